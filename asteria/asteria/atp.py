@@ -0,0 +1,234 @@
+"""Reservation-aware available-to-promise (ATP).
+
+ATP = ledger balance - Reserve Stock reservations - ERPNext Stock Reservation Entries
+
+- Ledger balance comes from Bin (item, warehouse) or, for a batch, from the
+  Batch Warehouse Balance store.
+- Reserve Stock reservations are the Reserved rows of submitted Reserve Stock.
+- Stock Reservation Entries count their undelivered reserved qty; for a batch,
+  the undelivered qty of their Serial and Batch Entry rows for that batch.
+
+Results are cached for the rest of the request, keyed by
+(item_code, warehouse, batch_no), and dropped whenever the reservation
+snapshot is cleared.
+"""
+
+import frappe
+from frappe.utils import cstr, flt, parse_json
+
+from asteria.asteria.doctype.batch_warehouse_balance.batch_warehouse_balance import get_batch_balances
+
+
+def get_atp(item_code, warehouse, batch_no=None):
+	"""Return the ATP breakdown of one item / warehouse (/ batch)."""
+	key = (cstr(item_code).strip(), cstr(warehouse).strip(), cstr(batch_no).strip() or None)
+	return get_atp_bulk([key])[key]
+
+
+def get_atp_bulk(keys):
+	"""Return { (item_code, warehouse, batch_no): frappe._dict(actual_qty, reserved_qty,
+	sre_reserved_qty, atp_qty) } for many keys with one query per source."""
+	keys = {
+		(cstr(item_code).strip(), cstr(warehouse).strip(), cstr(batch_no).strip() or None)
+		for item_code, warehouse, batch_no in keys
+	}
+	keys = {key for key in keys if key[0] and key[1]}
+
+	cache = get_atp_cache()
+	missing = [key for key in keys if key not in cache]
+	if missing:
+		cache.update(compute_atp(missing))
+
+	return {key: cache[key] for key in keys}
+
+
+@frappe.whitelist()
+def get_availability(items):
+	"""Whitelisted ATP lookup for Sales Order and Production Plan screens.
+
+	`items` is a JSON list of {item_code, warehouse, batch_no} rows; the result is
+	the same list with actual_qty, reserved_qty, sre_reserved_qty and atp_qty added.
+	"""
+	if isinstance(items, str):
+		items = parse_json(items)
+
+	frappe.has_permission("Bin", "read", throw=True)
+
+	keys = [(row.get("item_code"), row.get("warehouse"), row.get("batch_no")) for row in items or []]
+	for warehouse in {cstr(key[1]).strip() for key in keys if cstr(key[1]).strip()}:
+		frappe.has_permission("Warehouse", "read", warehouse, throw=True)
+
+	atp = get_atp_bulk(keys)
+
+	result = []
+	for item_code, warehouse, batch_no in keys:
+		key = (cstr(item_code).strip(), cstr(warehouse).strip(), cstr(batch_no).strip() or None)
+		result.append({"item_code": item_code, "warehouse": warehouse, "batch_no": batch_no, **atp.get(key, {})})
+
+	return result
+
+
+def get_atp_cache():
+	"""Request-scoped ATP cache, stored beside the reservation snapshot."""
+	from asteria.asteria.doctype.reserve_stock.reserve_stock import get_reservation_snapshot
+
+	return get_reservation_snapshot().setdefault("atp", {})
+
+
+def compute_atp(keys):
+	item_keys = {(item_code, warehouse) for item_code, warehouse, batch_no in keys if not batch_no}
+	batch_keys = {key for key in keys if key[2]}
+
+	actual = get_bin_qty(item_keys)
+	actual.update(get_batch_actual_qty(batch_keys))
+	reserved = get_reserve_stock_qty(item_keys, batch_keys)
+	sre_reserved = get_stock_reservation_entry_qty(item_keys, batch_keys)
+
+	atp = {}
+	for key in keys:
+		actual_qty = flt(actual.get(key))
+		reserved_qty = flt(reserved.get(key))
+		sre_reserved_qty = flt(sre_reserved.get(key))
+		atp[key] = frappe._dict(
+			actual_qty=actual_qty,
+			reserved_qty=reserved_qty,
+			sre_reserved_qty=sre_reserved_qty,
+			atp_qty=actual_qty - reserved_qty - sre_reserved_qty,
+		)
+
+	return atp
+
+
+def get_bin_qty(item_keys):
+	if not item_keys:
+		return {}
+
+	rows = frappe.db.sql(
+		"""
+		SELECT item_code, warehouse, actual_qty
+		FROM `tabBin`
+		WHERE item_code IN %(item_codes)s AND warehouse IN %(warehouses)s
+		""",
+		{
+			"item_codes": tuple({key[0] for key in item_keys}),
+			"warehouses": tuple({key[1] for key in item_keys}),
+		},
+		as_dict=True,
+	)
+
+	return {(row.item_code, row.warehouse, None): flt(row.actual_qty) for row in rows}
+
+
+def get_batch_actual_qty(batch_keys):
+	actual = {}
+	by_item = {}
+	for item_code, warehouse, batch_no in batch_keys:
+		by_item.setdefault(item_code, set()).add((batch_no, warehouse))
+
+	for item_code, pairs in by_item.items():
+		for (batch_no, warehouse), qty in get_batch_balances(pairs, item_code=item_code).items():
+			actual[(item_code, warehouse, batch_no)] = qty
+
+	return actual
+
+
+def get_reserve_stock_qty(item_keys, batch_keys):
+	"""Reserved qty from submitted Reserve Stock, per item/warehouse and per batch."""
+	all_keys = {(key[0], key[1]) for key in item_keys | batch_keys}
+	if not all_keys:
+		return {}
+
+	rows = frappe.db.sql(
+		"""
+		SELECT sri.item_code, sri.warehouse, sri.batch_no, SUM(ABS(IFNULL(sri.qty, 0))) AS qty
+		FROM `tabStock Reservation Items` AS sri
+		INNER JOIN `tabReserve Stock` AS rs ON rs.name = sri.parent
+		WHERE
+			sri.parenttype = 'Reserve Stock'
+			AND sri.status = 'Reserved'
+			AND rs.docstatus = 1
+			AND sri.item_code IN %(item_codes)s
+			AND sri.warehouse IN %(warehouses)s
+		GROUP BY sri.item_code, sri.warehouse, sri.batch_no
+		""",
+		{
+			"item_codes": tuple({key[0] for key in all_keys}),
+			"warehouses": tuple({key[1] for key in all_keys}),
+		},
+		as_dict=True,
+	)
+
+	return _fold_rows(rows, item_keys, batch_keys)
+
+
+def get_stock_reservation_entry_qty(item_keys, batch_keys):
+	"""Undelivered qty of submitted ERPNext Stock Reservation Entries."""
+	reserved = {}
+	all_keys = {(key[0], key[1]) for key in item_keys | batch_keys}
+	if not all_keys:
+		return reserved
+
+	values = {
+		"item_codes": tuple({key[0] for key in all_keys}),
+		"warehouses": tuple({key[1] for key in all_keys}),
+	}
+
+	if item_keys:
+		rows = frappe.db.sql(
+			"""
+			SELECT item_code, warehouse, SUM(reserved_qty - delivered_qty) AS qty
+			FROM `tabStock Reservation Entry`
+			WHERE
+				docstatus = 1
+				AND status NOT IN ('Delivered', 'Cancelled')
+				AND item_code IN %(item_codes)s
+				AND warehouse IN %(warehouses)s
+			GROUP BY item_code, warehouse
+			""",
+			values,
+			as_dict=True,
+		)
+		for row in rows:
+			key = (row.item_code, row.warehouse, None)
+			if key in item_keys:
+				reserved[key] = flt(row.qty)
+
+	if batch_keys:
+		rows = frappe.db.sql(
+			"""
+			SELECT sre.item_code, sre.warehouse, sbe.batch_no, SUM(sbe.qty - sbe.delivered_qty) AS qty
+			FROM `tabStock Reservation Entry` AS sre
+			INNER JOIN `tabSerial and Batch Entry` AS sbe
+				ON sbe.parent = sre.name AND sbe.parenttype = 'Stock Reservation Entry'
+			WHERE
+				sre.docstatus = 1
+				AND sre.status NOT IN ('Delivered', 'Cancelled')
+				AND sre.item_code IN %(item_codes)s
+				AND sre.warehouse IN %(warehouses)s
+				AND sbe.batch_no IS NOT NULL
+			GROUP BY sre.item_code, sre.warehouse, sbe.batch_no
+			""",
+			values,
+			as_dict=True,
+		)
+		for row in rows:
+			key = (row.item_code, row.warehouse, row.batch_no)
+			if key in batch_keys:
+				reserved[key] = flt(row.qty)
+
+	return reserved
+
+
+def _fold_rows(rows, item_keys, batch_keys):
+	"""Sum batch-level rows into item/warehouse totals and keep requested batch keys."""
+	totals = {}
+	for row in rows:
+		item_key = (row.item_code, row.warehouse, None)
+		if item_key in item_keys:
+			totals[item_key] = totals.get(item_key, 0) + flt(row.qty)
+
+		batch_key = (row.item_code, row.warehouse, cstr(row.batch_no).strip() or None)
+		if batch_key[2] and batch_key in batch_keys:
+			totals[batch_key] = totals.get(batch_key, 0) + flt(row.qty)
+
+	return totals
@@ -0,0 +1,142 @@
+"""Memoized BOM explosion for Production Plan material requests.
+
+ERPNext's explosion helpers return raw materials whose qty is linear in the
+planned qty. A tree is therefore exploded once per (kind, bom_no, company,
+include flags) for a planned qty of 1 and scaled for every plan row that uses
+it, instead of being walked again for each row.
+
+Explosions are kept for the rest of the request and, when "Cache BOM
+Explosion Across Requests" is set in Manufacturing Settings, in a Redis hash
+that is dropped whenever a BOM is submitted, cancelled or updated after submit,
+or an Item changes a field that the explosion copies or filters on.
+"""
+
+import json
+
+import frappe
+from erpnext.manufacturing.doctype.production_plan.production_plan import get_exploded_items, get_subitems
+from frappe.utils import cint, flt
+
+BOM_EXPLOSION_CACHE = "asteria:bom_explosion"
+BOM_EXPLOSION_TTL = 6 * 60 * 60
+
+# Item fields and child tables that ERPNext's explosion queries copy into rows or filter on
+EXPLOSION_ITEM_FIELDS = (
+	"default_bom",
+	"disabled",
+	"is_stock_item",
+	"include_item_in_manufacturing",
+	"is_sub_contracted_item",
+	"item_name",
+	"description",
+	"item_group",
+	"stock_uom",
+	"purchase_uom",
+	"min_order_qty",
+	"safety_stock",
+	"lead_time_days",
+	"default_material_request_type",
+)
+EXPLOSION_ITEM_TABLES = {
+	"uoms": ("uom", "conversion_factor"),
+	"item_defaults": ("company", "default_warehouse"),
+}
+
+
+def get_bom_explosion(kind, doc, data, bom_no, company, include_non_stock_items, include_subcontracted_items, planned_qty):
+	"""Return { item_code: row } of the exploded BOM for `planned_qty`.
+
+	kind is "exploded" (BOM Explosion Item, ERPNext get_exploded_items) or
+	"subitems" (multi-level walk, ERPNext get_subitems).
+	"""
+	key = json.dumps(
+		[
+			kind,
+			bom_no,
+			company,
+			cint(include_non_stock_items),
+			cint(include_subcontracted_items),
+			cint(data.get("include_exploded_items")),
+			cint(doc.get("skip_available_sub_assembly_item")),
+		]
+	)
+
+	cache = get_request_cache()
+	if key not in cache:
+		cache[key] = get_shared_explosion(key) if use_shared_cache() else None
+		if cache[key] is None:
+			cache[key] = explode_bom(
+				kind, doc, data, bom_no, company, include_non_stock_items, include_subcontracted_items
+			)
+			if use_shared_cache():
+				set_shared_explosion(key, cache[key])
+
+	return {
+		item_code: frappe._dict(row, qty=flt(row.get("qty")) * flt(planned_qty))
+		for item_code, row in cache[key].items()
+	}
+
+
+def explode_bom(kind, doc, data, bom_no, company, include_non_stock_items, include_subcontracted_items):
+	"""Explode the BOM for a planned qty of 1."""
+	if kind == "exploded":
+		return get_exploded_items({}, company, bom_no, include_non_stock_items, planned_qty=1, doc=doc)
+
+	return get_subitems(
+		doc,
+		data,
+		{},
+		bom_no,
+		company,
+		include_non_stock_items,
+		include_subcontracted_items,
+		1,
+		planned_qty=1,
+	)
+
+
+def get_request_cache():
+	cache = getattr(frappe.local, "bom_explosion_cache", None)
+	if cache is None:
+		cache = frappe.local.bom_explosion_cache = {}
+
+	return cache
+
+
+def use_shared_cache():
+	return cint(frappe.db.get_single_value("Manufacturing Settings", "cache_bom_explosion"))
+
+
+def get_shared_explosion(key):
+	return frappe.cache.hget(BOM_EXPLOSION_CACHE, key)
+
+
+def set_shared_explosion(key, value):
+	frappe.cache.hset(BOM_EXPLOSION_CACHE, key, value)
+	frappe.cache.expire(frappe.cache.make_key(BOM_EXPLOSION_CACHE), BOM_EXPLOSION_TTL)
+
+
+def clear_bom_explosion_cache(doc=None, method=None):
+	"""Drop every cached explosion; parent BOMs can embed the changed one."""
+	if doc and doc.doctype == "Item" and not has_explosion_fields_changed(doc):
+		return
+
+	frappe.local.bom_explosion_cache = None
+	frappe.cache.delete_value(BOM_EXPLOSION_CACHE)
+
+
+def has_explosion_fields_changed(item):
+	before = item.get_doc_before_save()
+	if not before:
+		return True
+
+	if any(item.has_value_changed(fieldname) for fieldname in EXPLOSION_ITEM_FIELDS):
+		return True
+
+	for table, fields in EXPLOSION_ITEM_TABLES.items():
+		rows = {tuple(row.get(field) for field in fields) for row in item.get(table)}
+		before_rows = {tuple(row.get(field) for field in fields) for row in before.get(table)}
+		if rows != before_rows:
+			return True
+
+	return False
@@ -248,6 +248,12 @@ def setup_custom_fields():
             }
         ],
         "Production Plan Sub Assembly Item" : [
+            {
+                "label" : "Ordered Qty (Draft)",
+                "fieldname" : "ordered_in_draft",
+                "fieldtype" : "Float",
+                "insert_after" : "wo_produced_qty",
+            },
             {
                 "label" : "Remaining Qty",
                 "fieldname" : "remaining_qty",
@@ -262,6 +268,24 @@ def setup_custom_fields():
                 "fieldtype" : "Check",
                 "insert_after" : "enable_validation_serial_no",
                 "default" : 0
+            },
+            {
+                "label" : "Reservation Expiry (Days)",
+                "fieldname" : "reservation_expiry_days",
+                "fieldtype" : "Int",
+                "insert_after" : "enable_batch_validation_for_manufacture",
+                "default" : 0,
+                "description" : "Reserve Stock rows older than this are released by the daily sweeper. 0 disables expiry."
+            }
+        ],
+        "Manufacturing Settings" : [
+            {
+                "label" : "Cache BOM Explosion Across Requests",
+                "fieldname" : "cache_bom_explosion",
+                "fieldtype" : "Check",
+                "insert_after" : "make_serial_no_batch_from_work_order",
+                "default" : 0,
+                "description" : "Keep exploded BOMs in Redis for Production Plan material requests. Cleared when a BOM or an Item's default BOM changes."
             }
         ],
         "Stock Reconciliation" : [
@@ -1,4 +1,5 @@
 import frappe
+from frappe import _
 from erpnext.manufacturing.doctype.work_order.work_order import make_stock_entry
 from frappe.model.mapper import get_mapped_doc
 from erpnext import get_company_currency, get_default_company
@@ -8,108 +9,141 @@ from erpnext.stock.doctype.stock_entry.stock_entry import OperationsNotCompleteE
 
 def on_submit(self, method):
 	if self.work_order:
+		# The Manufacture entry is built in the background once this submit commits
+		frappe.enqueue(
+			"asteria.asteria.doc_events.job_card.run_auto_manufacture",
+			queue="long",
+			timeout=3600,
+			enqueue_after_commit=True,
+			work_order=self.work_order,
+			job_card=self.name,
+			user=frappe.session.user,
+		)
+
+
+def run_auto_manufacture(work_order, job_card, user=None):
+	"""Background job queued by every Job Card submit, never deduplicated.
+
+	Job Cards finishing together each get their own job so no completion is
+	missed; the Work Order row lock and the existing-draft check in
+	make_auto_manufacture_entry make the extra runs no-ops. Progress and the
+	result go to `user`, who submitted the Job Card.
+	"""
+	try:
+		make_auto_manufacture_entry(work_order, job_card, user)
+		frappe.db.commit()
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(title=f"Auto Manufacture failed for {work_order}")
+		frappe.publish_realtime(
+			"msgprint",
+			_("Manufacture Stock Entry could not be created for Work Order {0}. Please check the Error Log.").format(
+				frappe.utils.get_link_to_form("Work Order", work_order)
+			),
+			user=user,
+		)
+
+
+def publish_auto_manufacture_progress(percent, description, user):
+	"""Progress bar for the user who submitted the Job Card, wherever they are in the desk."""
+	frappe.publish_realtime(
+		"progress",
+		{"percent": percent, "title": _("Preparing Manufacture Entry"), "description": description},
+		user=user,
+	)
 
-		job_cards = frappe.db.get_list('Job Card',
-											filters={
-												'work_order': self.work_order,
-												"docstatus" : ["<", 2]
-											},
-											fields=['name', 'status'],
-											order_by='name desc',
-										)
-		
-		
-		not_completed = [
-			row.name for row in job_cards if row.status != "Completed"
-		]
-
-		if not_completed:
-			return
-
-		if not job_cards:
-			return 
-
-		# check if any workflow is active
-		workflow = frappe.db.get_value("Workflow", { "is_active" : 1 , "document_type" : "Stock Entry"}, "name")
-
-		fg_warehouse = frappe.db.get_value("Work Order", self.work_order, "fg_warehouse")
-		qty=None
-		if self.for_quantity:
-			qty = self.for_quantity
-		try:
-			stock_entry = make_stock_entry(
-				self.work_order,
-				"Manufacture",
-				target_warehouse=fg_warehouse,
-				qty=qty
-			)
-
-		except OperationsNotCompleteError as e:
-			return   # or handle logic safely
-		
-		except frappe.ValidationError:
-			raise  
-
-		se = frappe.get_doc(stock_entry)
-
-		work_order = frappe.get_doc("Work Order", self.work_order)
-		se.cost_center = work_order.custom_cost_center
-		se.project = work_order.project
-		se.business_unit = work_order.custom_business_unit
-		se.create_from_job_card = 1
-
-
-		from asteria.asteria.override.serial_and_batch_bundle import get_auto_data
-		
-		for row in se.items:
-			row.cost_center = work_order.custom_cost_center
-			row.business_unit = work_order.custom_business_unit
-			row.project = work_order.project
-
-			if row.get("is_finished_item"):
-				continue
-
-			has_serial_no = frappe.db.get_value("Item", row.item_code, "has_serial_no")
-			has_batch_no = frappe.db.get_value("Item", row.item_code, "has_batch_no")
-
-			args = {
-					'doc' : se,
-					'item_code': row.item_code,
-					'warehouse': row.s_warehouse,
-					'has_serial_no': has_serial_no,
-					'has_batch_no': has_batch_no,
-					'qty': row.qty,
-					'based_on': "FIFO",
-					'posting_date' : se.posting_date,
-					'posting_time' : se.posting_time,
-				}
-			
-			auto_data = get_auto_data(**args) or []
-			sr_list = [d.get("serial_no") for d in auto_data if d.get("serial_no")]
-
-			if sr_list: 
-				serial_no_list = ",".join(sr_list)
-				row.use_serial_batch_fields = 1
-				row.serial_no = serial_no_list
-
-			# Auto-select batch from the same work order cycle
-			if not sr_list and has_batch_no:
-				batch_list = [d for d in auto_data if d.get("batch_no")]
-				if batch_list:
-					row.use_serial_batch_fields = 1
-					row.batch_no = batch_list[0].get("batch_no")
-		
-
-		se.insert(ignore_mandatory = True)
-		if workflow:
-			doc = frappe.get_doc("Workflow", workflow)
-			workflow_state = doc.transitions[0].get("next_state")
-			frappe.db.set_value("Stock Entry", se.name, "workflow_state", workflow_state)
-			# se.flags.ignore_permissions = True
-			# se.flags.ignore_mandatory = True
-			# se.save()
-
-		frappe.msgprint("Stock Entry is successfully created. {0}".format(frappe.utils.get_link_to_form("Stock Entry", se.name)))
+
+def make_auto_manufacture_entry(work_order, job_card, user=None):
+	"""Create the draft Manufacture entry when every Job Card of the Work Order is completed.
+
+	Idempotent: nothing is created while a draft job-card Manufacture entry exists.
+	"""
+	# Serialise runs for the same Work Order
+	frappe.db.sql("SELECT name FROM `tabWork Order` WHERE name = %s FOR UPDATE", work_order)
+
+	job_cards = frappe.db.get_list('Job Card',
+										filters={
+											'work_order': work_order,
+											"docstatus" : ["<", 2]
+										},
+										fields=['name', 'status'],
+										order_by='name desc',
+									)
+
+	not_completed = [
+		row.name for row in job_cards if row.status != "Completed"
+	]
+
+	if not_completed or not job_cards:
+		return
+
+	if frappe.db.exists("Stock Entry", {
+		"work_order": work_order,
+		"purpose": "Manufacture",
+		"create_from_job_card": 1,
+		"docstatus": 0,
+	}):
+		return
+
+	# check if any workflow is active
+	workflow = frappe.db.get_value("Workflow", { "is_active" : 1 , "document_type" : "Stock Entry"}, "name")
+
+	fg_warehouse = frappe.db.get_value("Work Order", work_order, "fg_warehouse")
+	qty = frappe.db.get_value("Job Card", job_card, "for_quantity") or None
+	try:
+		stock_entry = make_stock_entry(
+			work_order,
+			"Manufacture",
+			target_warehouse=fg_warehouse,
+			qty=qty
+		)
+
+	except OperationsNotCompleteError as e:
+		return   # or handle logic safely
+
+	se = frappe.get_doc(stock_entry)
+
+	work_order = frappe.get_doc("Work Order", work_order)
+	se.cost_center = work_order.custom_cost_center
+	se.project = work_order.project
+	se.business_unit = work_order.custom_business_unit
+	se.create_from_job_card = 1
+
+
+	from asteria.asteria.override.serial_and_batch_bundle import (
+		allocate_serial_batch_for_document,
+		apply_serial_batch_allocation,
+	)
+
+	for row in se.items:
+		row.cost_center = work_order.custom_cost_center
+		row.business_unit = work_order.custom_business_unit
+		row.project = work_order.project
+
+	publish_auto_manufacture_progress(
+		10, _("Allocating serial and batch nos for {0} items").format(len(se.items)), user
+	)
+
+	# One allocation for the whole entry, so no serial or batch is given to two rows.
+	# Batches come from the same work order cycle; a row short of one batch is split.
+	shortfall_messages = apply_serial_batch_allocation(se, allocate_serial_batch_for_document(se))
+
+	publish_auto_manufacture_progress(90, _("Saving Stock Entry"), user)
+
+	se.insert(ignore_mandatory = True)
+	if workflow:
+		doc = frappe.get_doc("Workflow", workflow)
+		workflow_state = doc.transitions[0].get("next_state")
+		frappe.db.set_value("Stock Entry", se.name, "workflow_state", workflow_state)
+		# se.flags.ignore_permissions = True
+		# se.flags.ignore_mandatory = True
+		# se.save()
+
+	message = _("Stock Entry is successfully created. {0}").format(frappe.utils.get_link_to_form("Stock Entry", se.name))
+	if shortfall_messages:
+		message += "<br><br>" + "<br>".join(shortfall_messages)
+
+	frappe.publish_realtime("msgprint", message, user=user or frappe.session.user)
 
 
 @frappe.whitelist()
@@ -1,14 +1,12 @@
 import frappe
 from erpnext.manufacturing.doctype.production_plan.production_plan import (
-	get_exploded_items,
 	get_raw_materials_of_sub_assembly_items,
-	get_subitems,
 	get_warehouse_list,
 	get_uom_conversion_factor,
-	get_materials_from_other_locations,
-	get_bin_details
 )
-from erpnext.setup.doctype.item_group.item_group import get_item_group_defaults
+
+from asteria.asteria.bom_explosion import get_bom_explosion
+from asteria.asteria.warehouse_netting import allocate, allocate_demand, get_warehouse_supply
 
 import json
 from collections import defaultdict
@@ -117,25 +115,26 @@ def get_items_for_material_requests(doc, warehouses=None, get_parent_warehouse_d
 
 				elif data.get("include_exploded_items") and include_subcontracted_items:
 					# fetch exploded items from BOM
-					item_details = get_exploded_items(
-						item_details,
-						company,
+					item_details = get_bom_explosion(
+						"exploded",
+						doc,
+						data,
 						bom_no,
+						company,
 						include_non_stock_items,
-						planned_qty=planned_qty,
-						doc=doc,
+						include_subcontracted_items,
+						planned_qty,
 					)
 				else:
-					item_details = get_subitems(
+					item_details = get_bom_explosion(
+						"subitems",
 						doc,
 						data,
-						item_details,
 						bom_no,
 						company,
 						include_non_stock_items,
 						include_subcontracted_items,
-						1,
-						planned_qty=planned_qty,
+						planned_qty,
 					)
 		elif data.get("item_code"):
 			item_master = frappe.get_doc("Item", data["item_code"]).as_dict()
@@ -174,14 +173,14 @@ def get_items_for_material_requests(doc, warehouses=None, get_parent_warehouse_d
 				so_item_details[sales_order][item_code] = details
 
 	mr_items = []
-	consumed_qty = defaultdict(float)
+	projected_supply = {}
+	item_data = get_material_request_item_data(so_item_details, company, warehouse)
 
 	for sales_order in so_item_details:
 		item_dict = so_item_details[sales_order]
 		for details in item_dict.values():
 			warehouse = warehouse or details.get("source_warehouse") or details.get("default_warehouse")
-			bin_dict = get_bin_details(details, doc.company, warehouse)
-			bin_dict = bin_dict[0] if bin_dict else {}
+			bin_dict = get_bin_row(item_data, details.item_code, warehouse)
 
 			if details.qty > 0:
 				items = get_material_request_items(
@@ -193,17 +192,14 @@ def get_items_for_material_requests(doc, warehouses=None, get_parent_warehouse_d
 					include_safety_stock,
 					warehouse,
 					bin_dict,
-					consumed_qty,
+					projected_supply,
+					item_data,
 				)
 				if items:
 					mr_items.append(items)
 
 	if (not ignore_existing_ordered_qty or get_parent_warehouse_data) and warehouses:
-		new_mr_items = []
-		for item in mr_items:
-			get_materials_from_other_locations(item, warehouses, new_mr_items, company)
-
-		mr_items = new_mr_items
+		mr_items = get_materials_from_other_warehouses(mr_items, warehouses, company, item_data)
 
 	if not mr_items:
 		to_enable = frappe.bold(_("Ignore Existing Projected Quantity"))
@@ -220,7 +216,7 @@ def get_items_for_material_requests(doc, warehouses=None, get_parent_warehouse_d
 	# changes started fosserp
 	final_mr_items = []
 	for row in mr_items:
-		if not frappe.db.get_value("Item", row.get("item_code") , "is_kit_item"):
+		if not get_item_row(item_data, row.get("item_code")).is_kit_item:
 			final_mr_items.append(row)
 	# changes end fosserp
 	return final_mr_items
@@ -236,7 +232,8 @@ def get_material_request_items(
 	include_safety_stock,
 	warehouse,
 	bin_dict,
-	consumed_qty,
+	projected_supply,
+	item_data,
 ):
 	required_qty = 0
 	item_code = row.get("item_code")
@@ -244,18 +241,14 @@ def get_material_request_items(
 	if ignore_existing_ordered_qty or bin_dict.get("projected_qty", 0) < 0:
 		required_qty = flt(row.get("qty"))
 	else:
-		key = (item_code, warehouse)
-		available_qty = flt(bin_dict.get("projected_qty", 0)) - consumed_qty[key]
-		if available_qty > 0:
-			required_qty = max(0, flt(row.get("qty")) - available_qty)
-			consumed_qty[key] += min(flt(row.get("qty")), available_qty)
-		else:
-			required_qty = flt(row.get("qty"))
+		# projected qty of the warehouse is shared by every row of the item
+		projected_supply.setdefault(item_code, {}).setdefault(warehouse, flt(bin_dict.get("projected_qty", 0)))
+		required_qty = allocate(projected_supply, item_code, row.get("qty"), [warehouse])[1]
 
 	if doc.get("consider_minimum_order_qty") and required_qty > 0 and required_qty < row["min_order_qty"]:
 		required_qty = row["min_order_qty"]
 
-	item_group_defaults = get_item_group_defaults(row.item_code, company)
+	item_master = get_item_row(item_data, row.item_code)
 
 	if not row["purchase_uom"]:
 		row["purchase_uom"] = row["stock_uom"]
@@ -270,22 +263,20 @@ def get_material_request_items(
 
 			required_qty = required_qty / row["conversion_factor"]
 
-	if frappe.db.get_value("UOM", row["purchase_uom"], "must_be_whole_number"):
+	if row["purchase_uom"] in item_data.whole_number_uoms:
 		required_qty = ceil(required_qty)
 
 	if include_safety_stock:
 		required_qty += flt(row["safety_stock"])
 
-	item_details = frappe.get_cached_value("Item", row.item_code, ["purchase_uom", "stock_uom"], as_dict=1)
-
 	conversion_factor = 1.0
 	if (
 		row.get("default_material_request_type") == "Purchase"
-		and item_details.purchase_uom
-		and item_details.purchase_uom != item_details.stock_uom
+		and item_master.purchase_uom
+		and item_master.purchase_uom != item_master.stock_uom
 	):
 		conversion_factor = (
-			get_conversion_factor(row.item_code, item_details.stock_uom).get("conversion_factor") or 1.0 # changes by fosserp item_details.stock_uom instead of item_details.purchase_uom
+			get_item_conversion_factor(item_data, row.item_code, item_master.stock_uom) # changes by fosserp item_details.stock_uom instead of item_details.purchase_uom
 		)
 
 	if required_qty > 0:
@@ -299,7 +290,7 @@ def get_material_request_items(
 			"warehouse": warehouse
 			or row.get("source_warehouse")
 			or row.get("default_warehouse")
-			or item_group_defaults.get("default_warehouse"),
+			or item_master.item_group_warehouse,
 			"safety_stock": row.safety_stock,
 			"actual_qty": bin_dict.get("actual_qty", 0),
 			"projected_qty": bin_dict.get("projected_qty", 0),
@@ -311,4 +302,160 @@ def get_material_request_items(
 			"description": row.get("description"),
 			"uom":  row.get("stock_uom") or row.get("purchase_uom"), # Fosserp row.get("purchase_uom") or row.get("stock_uom")
 			"main_bom_item": row.get("main_bom_item"),
-		}
\ No newline at end of file
+		}
+
+
+def get_material_request_item_data(so_item_details, company, for_warehouse=None):
+	"""Load everything get_material_request_items reads for the planned items.
+
+	Item, Item Group default warehouse, whole-number UOMs, UOM conversion
+	factors and Bin rows are fetched once for all items, so the per-item
+	loop runs in memory.
+	"""
+	rows = [details for item_dict in so_item_details.values() for details in item_dict.values()]
+	item_codes = list({row.item_code for row in rows})
+	item_data = frappe._dict(
+		items={}, whole_number_uoms=set(), conversion_factors={}, bins=defaultdict(list), warehouses={}
+	)
+	if not item_codes:
+		return item_data
+
+	for item in frappe.db.sql(
+		"""
+		SELECT
+			item.name, item.purchase_uom, item.stock_uom, item.variant_of, item.is_kit_item,
+			item_group_default.default_warehouse AS item_group_warehouse
+		FROM `tabItem` AS item
+		LEFT JOIN `tabItem Default` AS item_group_default
+			ON item_group_default.parent = item.item_group
+			AND item_group_default.parenttype = 'Item Group'
+			AND item_group_default.company = %(company)s
+		WHERE item.name IN %(item_codes)s
+		""",
+		{"item_codes": item_codes, "company": company},
+		as_dict=True,
+	):
+		item_data.items.setdefault(item.name, item)
+
+	uoms = {uom for row in rows for uom in (row.get("purchase_uom"), row.get("stock_uom")) if uom}
+	uoms |= {item.purchase_uom for item in item_data.items.values() if item.purchase_uom}
+	if uoms:
+		item_data.whole_number_uoms = set(
+			frappe.get_all("UOM", filters={"name": ("in", list(uoms)), "must_be_whole_number": 1}, pluck="name")
+		)
+
+	parents = set(item_codes) | {item.variant_of for item in item_data.items.values() if item.variant_of}
+	for conversion in frappe.get_all(
+		"UOM Conversion Detail",
+		filters={"parent": ("in", list(parents)), "parenttype": "Item"},
+		fields=["parent", "uom", "conversion_factor"],
+	):
+		item_data.conversion_factors[(conversion.parent, conversion.uom)] = conversion.conversion_factor
+
+	# ordered by warehouse like erpnext get_bin_details, whose first row is used
+	for bin_row in frappe.db.sql(
+		"""
+		SELECT
+			bin.item_code, bin.warehouse, warehouse.lft, warehouse.rgt,
+			IFNULL(SUM(bin.projected_qty), 0) AS projected_qty,
+			IFNULL(SUM(bin.actual_qty), 0) AS actual_qty,
+			IFNULL(SUM(bin.ordered_qty), 0) AS ordered_qty,
+			IFNULL(SUM(bin.reserved_qty_for_production), 0) AS reserved_qty_for_production,
+			IFNULL(SUM(bin.planned_qty), 0) AS planned_qty
+		FROM `tabBin` AS bin
+		INNER JOIN `tabWarehouse` AS warehouse ON warehouse.name = bin.warehouse
+		WHERE warehouse.company = %(company)s AND bin.item_code IN %(item_codes)s
+		GROUP BY bin.item_code, bin.warehouse
+		ORDER BY bin.item_code, bin.warehouse
+		""",
+		{"item_codes": item_codes, "company": company},
+		as_dict=True,
+	):
+		item_data.bins[bin_row.item_code].append(bin_row)
+
+	warehouses = {for_warehouse} | {
+		warehouse for row in rows for warehouse in (row.get("source_warehouse"), row.get("default_warehouse"))
+	}
+	warehouses.discard(None)
+	if warehouses:
+		item_data.warehouses = {
+			warehouse.name: warehouse
+			for warehouse in frappe.get_all(
+				"Warehouse", filters={"name": ("in", list(warehouses))}, fields=["name", "lft", "rgt"]
+			)
+		}
+
+	return item_data
+
+
+def get_materials_from_other_warehouses(mr_items, warehouses, company, item_data):
+	"""Cover MR rows from stock in `warehouses` before purchasing the rest.
+
+	Replaces calling erpnext get_materials_from_other_locations per row: Bin
+	stock of every warehouse is loaded once and allocated in one pass, so two
+	rows of the same item never count the same stock.
+	"""
+	supply = get_warehouse_supply([item["item_code"] for item in mr_items], warehouses, company)
+	demands = [(item["item_code"], flt(item.get("quantity")) * flt(item.get("conversion_factor"))) for item in mr_items]
+	precision = frappe.get_precision("Material Request Plan Item", "quantity")
+
+	new_mr_items = []
+	for item, (allocations, required_qty) in zip(mr_items, allocate_demand(demands, supply)):
+		# transfer what other warehouses hold, in stock UOM
+		for warehouse, qty in allocations:
+			new_mr_items.append(
+				{
+					**item,
+					"quantity": qty,
+					"material_request_type": "Material Transfer",
+					"uom": item.get("stock_uom"),
+					"from_warehouse": warehouse,
+					"conversion_factor": 1.0,
+				}
+			)
+
+		# raise purchase request for remaining qty
+		if flt(required_qty, precision) > 0:
+			item_master = get_item_row(item_data, item["item_code"])
+			if item_master.purchase_uom != item_master.stock_uom and item_master.purchase_uom == item.get("uom"):
+				required_qty = required_qty / get_item_conversion_factor(item_data, item["item_code"], item["uom"])
+
+			if item_master.purchase_uom in item_data.whole_number_uoms:
+				required_qty = ceil(required_qty)
+
+			item["quantity"] = required_qty
+			new_mr_items.append(item)
+
+	return new_mr_items
+
+
+def get_item_row(item_data, item_code):
+	return item_data.items.get(item_code) or frappe._dict()
+
+
+def get_bin_row(item_data, item_code, warehouse=None):
+	"""Prefetched counterpart of erpnext get_bin_details(...)[0]."""
+	bounds = item_data.warehouses.get(warehouse)
+	if warehouse and not bounds:
+		return {}
+
+	for bin_row in item_data.bins.get(item_code, []):
+		if not warehouse or (bounds.lft <= bin_row.lft and bin_row.rgt <= bounds.rgt):
+			return bin_row
+
+	return {}
+
+
+def get_item_conversion_factor(item_data, item_code, uom):
+	"""Prefetched counterpart of erpnext get_conversion_factor; checks the template for variants."""
+	item = get_item_row(item_data, item_code)
+	conversion_factor = item_data.conversion_factors.get((item_code, uom)) or item_data.conversion_factors.get(
+		(item.variant_of, uom)
+	)
+	if conversion_factor:
+		return flt(conversion_factor)
+
+	if uom == item.stock_uom:
+		return 1.0
+
+	return get_conversion_factor(item_code, uom).get("conversion_factor") or 1.0
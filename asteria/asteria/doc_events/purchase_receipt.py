@@ -9,33 +9,72 @@ from frappe.utils import (
 	get_last_day,
 	get_link_to_form,
 	getdate,
+	now,
 	rounded,
 	today,
 )
 
+WARRANTY_UPDATE_CHUNK_SIZE = 1000
+WARRANTY_BACKGROUND_THRESHOLD = 2000
+
 def on_submit(self,method=None):
     update_warenty_expiry_date(self)
 
 def update_warenty_expiry_date(self):
-    if self.voucher_type != "Purchase Receipt":
+    if self.voucher_type != "Purchase Receipt" or not self.voucher_no or not self.voucher_detail_no:
+        return
+    if not (self.has_serial_no or self.has_batch_no):
+        return
+
+    custom_supplier_invoice_date = frappe.db.get_value("Purchase Receipt", self.voucher_no, "custom_supplier_invoice_date")
+    if not custom_supplier_invoice_date:
+        return
+
+    days = cint(frappe.db.get_value("Purchase Receipt Item", self.voucher_detail_no, "warranty_period_day_purchase"))
+    if days <= 0:
+        return
+
+    warranty_date = add_days(str(getdate(custom_supplier_invoice_date)), (days - 1))
+    if cint(frappe.db.get_value("Item", self.item_code, "warranty_period_day_purchase")) != days:
+        frappe.db.set_value("Item", self.item_code, "warranty_period_day_purchase", days)
+
+    if self.has_serial_no:
+        update_warranty_expiry_for(self, "Serial No", "serial_no", warranty_date)
+
+    if self.has_batch_no:
+        update_warranty_expiry_for(self, "Batch", "batch_no", warranty_date)
+
+def update_warranty_expiry_for(self, doctype, fieldname, warranty_date):
+    names = list({row.get(fieldname) for row in self.entries if row.get(fieldname)})
+    if not names:
         return
-    if not frappe.db.get_value("Purchase Receipt", self.voucher_no, "custom_supplier_invoice_date"):
+
+    if len(names) > WARRANTY_BACKGROUND_THRESHOLD:
+        frappe.enqueue(
+            "asteria.asteria.doc_events.purchase_receipt.set_warranty_expiry_date",
+            queue="long",
+            enqueue_after_commit=True,
+            doctype=doctype,
+            names=names,
+            warranty_date=warranty_date,
+        )
         return
-    else:
-        custom_supplier_invoice_date = frappe.db.get_value("Purchase Receipt", self.voucher_no, "custom_supplier_invoice_date")
-    if self.voucher_type == "Purchase Receipt" and self.voucher_no and self.voucher_detail_no:
-        if self.has_serial_no:
-            days = frappe.db.sql(f"Select warranty_period_day_purchase as days From `tabPurchase Receipt Item` Where name = '{self.voucher_detail_no}'", as_dict=1)
-            if days and days[0].get("days") and days[0].get("days") > 0:
-                warranty_date = add_days(str(getdate(custom_supplier_invoice_date)), (days[0].get("days") - 1) )
-                frappe.db.set_value("Item", self.item_code, "warranty_period_day_purchase", days[0].get("days"))
-                for row in self.entries:
-                    frappe.db.set_value("Serial No", row.serial_no, "warranty_expiry_date_purchase", warranty_date)
-        
-        if self.has_batch_no:
-            days = frappe.db.sql(f"Select warranty_period_day_purchase as days From `tabPurchase Receipt Item` Where name = '{self.voucher_detail_no}'", as_dict=1)
-            if days and days[0].get("days") and days[0].get("days") > 0:
-                warranty_date = add_days(str(getdate(custom_supplier_invoice_date)), (days[0].get("days") - 1))
-                frappe.db.set_value("Item", self.item_code, "warranty_period_day_purchase", days[0].get("days"))
-                for row in self.entries:
-                    frappe.db.set_value("Batch", row.batch_no, "warranty_expiry_date_purchase", warranty_date)
\ No newline at end of file
+
+    set_warranty_expiry_date(doctype, names, warranty_date)
+
+def set_warranty_expiry_date(doctype, names, warranty_date):
+    """Set warranty_expiry_date_purchase on Serial No / Batch with one UPDATE per chunk."""
+    for start in range(0, len(names), WARRANTY_UPDATE_CHUNK_SIZE):
+        frappe.db.sql(
+            f"""
+            UPDATE `tab{doctype}`
+            SET warranty_expiry_date_purchase = %(warranty_date)s, modified = %(modified)s, modified_by = %(user)s
+            WHERE name IN %(names)s
+            """,
+            {
+                "warranty_date": warranty_date,
+                "modified": now(),
+                "user": frappe.session.user,
+                "names": tuple(names[start : start + WARRANTY_UPDATE_CHUNK_SIZE]),
+            },
+        )
@@ -1,4 +1,12 @@
 import frappe
+from frappe import _
+from frappe.utils import flt
+
+# Work Order link field -> (Production Plan row doctype, planned qty field)
+PLAN_ROW_LINKS = {
+    "production_plan_item": ("Production Plan Item", "planned_qty"),
+    "production_plan_sub_assembly_item": ("Production Plan Sub Assembly Item", "qty"),
+}
 
 def validate(self, method):
     trigger_method = "validate"
@@ -17,235 +25,139 @@ def on_trash(self, method=None):
     update_order_quantity(self, trigger_method)
 
 def update_order_quantity(self, trigger_method):
-    if not self.production_plan:
+    """Keep ordered_in_draft, ordered_qty and remaining_qty of the linked plan rows current.
+
+    ordered_in_draft = qty of draft Work Orders, moved by this Work Order's change as a
+    delta; ordered_qty = qty of submitted Work Orders, recomputed from them in the same
+    UPDATE (ERPNext's update_ordered_qty writes the same sum); remaining_qty = planned -
+    ordered_qty - ordered_in_draft (never below 0).
+    Skipped while a Production Plan creates Work Orders in bulk; the plan rolls
+    its counters up once at the end.
+    """
+    if frappe.flags.in_bulk_work_order_creation:
         return
-    
-    condition = ''
-    if self.production_plan_sub_assembly_item:
-        condition += f" and production_plan_sub_assembly_item = '{self.production_plan_sub_assembly_item}'"
-    
-    if self.production_plan_item:
-        condition += f" and production_plan_item = '{self.production_plan_item}'"
-    
-    # Get draft work orders quantity (excluding current document if it's in draft)
-    # For on_trash, we don't exclude current document since it's being deleted
-    name_condition = f"and name != '{self.name}'" if trigger_method != "on_trash" else ""
-    
-    work_order_data_draft = frappe.db.sql(f"""
-                        Select sum(qty) as qty
-                        From `tabWork Order`
-                        Where docstatus = 0 {name_condition}
-                        {condition}
-                    """, as_dict=1)
-    
-    draft_qty = work_order_data_draft[0].qty or 0
-    
-    # Get submitted work orders quantity for remaining calculation
-    work_order_data_submitted = frappe.db.sql(f"""
-                        Select sum(qty) as qty
-                        From `tabWork Order`
-                        Where docstatus = 1 {name_condition}
-                        {condition}
-                    """, as_dict=1)
-    
-    submitted_qty = work_order_data_submitted[0].qty or 0
-    
-    # If current document is being submitted (changing from draft to submitted)
-    if trigger_method == "on_submit" and self.docstatus == 1:
-        # Remove this work order's quantity from ordered_in_draft
-        if self.production_plan_item:
-            current_ordered_draft = frappe.db.get_value("Production Plan Item", 
-                                                       self.production_plan_item, 
-                                                       "ordered_in_draft") or 0
-            new_ordered_draft = max(0, current_ordered_draft - self.qty)
-            frappe.db.set_value("Production Plan Item", 
-                              self.production_plan_item, 
-                              "ordered_in_draft", 
-                              new_ordered_draft)
-            
-            # Update remaining quantity
-            update_remaining_qty_for_plan_item(self, trigger_method)
-        
-        if self.production_plan_sub_assembly_item:
-            current_ordered_draft = frappe.db.get_value("Production Plan Sub Assembly Item", 
-                                                       self.production_plan_sub_assembly_item, 
-                                                       "ordered_in_draft") or 0
-            new_ordered_draft = max(0, current_ordered_draft - self.qty)
-            frappe.db.set_value("Production Plan Sub Assembly Item", 
-                              self.production_plan_sub_assembly_item, 
-                              "ordered_in_draft", 
-                              new_ordered_draft)
-            
-            # Update remaining quantity
-            update_remaining_qty_for_sub_assembly_item(self, trigger_method)
-    
-    # For draft documents, update ordered_in_draft with total draft quantity
-    elif self.docstatus == 0 and trigger_method == "validate":
-        # Calculate total draft quantity including current document
-        total_draft_qty = draft_qty + self.qty
-        
-        if self.production_plan_item:
-            planned_qty = frappe.db.get_value("Production Plan Item", 
-                                            self.production_plan_item, 
-                                            "planned_qty")
-            if total_draft_qty and planned_qty and total_draft_qty > planned_qty:
-                frappe.throw(f"Planned quantity is {planned_qty}. Work Order is already created for {abs(total_draft_qty - self.qty)} in draft.")
-            
-            frappe.db.set_value("Production Plan Item", 
-                              self.production_plan_item, 
-                              "ordered_in_draft", 
-                              total_draft_qty)
-            
-            # Update remaining quantity
-            update_remaining_qty_for_plan_item(self, trigger_method)
-        
-        if self.production_plan_sub_assembly_item:
-            planned_qty = frappe.db.get_value("Production Plan Sub Assembly Item", 
-                                            self.production_plan_sub_assembly_item, 
-                                            "qty")
-            if total_draft_qty and planned_qty and total_draft_qty > planned_qty:
-                frappe.throw(f"Planned quantity is {planned_qty}. Work Order is already created for {abs(total_draft_qty - self.qty)} in draft.")
-            
-            frappe.db.set_value("Production Plan Sub Assembly Item", 
-                              self.production_plan_sub_assembly_item, 
-                              "ordered_in_draft", 
-                              total_draft_qty)
-            
-            # Update remaining quantity
-            update_remaining_qty_for_sub_assembly_item(self, trigger_method)
-    
-    # For cancelled documents
+
+    if trigger_method == "validate":
+        self.flags.plan_counters_updated = True
+
+    before = self.get_doc_before_save()
+    deltas = {}
+
+    if trigger_method == "validate":
+        if self.docstatus != 0:
+            return
+        # Move the draft qty from what was saved before to the current links and qty
+        if before and before.docstatus == 0:
+            add_plan_deltas(deltas, before, draft=-flt(before.qty))
+        add_plan_deltas(deltas, self, draft=flt(self.qty))
+
+    elif trigger_method == "on_submit" and self.docstatus == 1:
+        draft_qty = flt(before.qty) if before and before.docstatus == 0 else flt(self.qty)
+        add_plan_deltas(deltas, self, draft=-draft_qty)
+
     elif trigger_method == "on_cancel" and self.docstatus == 2:
-        remove_work_order_quantity(self, trigger_method)
-    
-    # For permanent deletion
-    elif trigger_method == "on_trash":
-        remove_work_order_quantity(self, trigger_method)
-
-def remove_work_order_quantity(self, trigger_method):
-    """Common method to remove work order quantity from plan items"""
-    # Remove quantity from ordered_in_draft for draft documents
-    if self.docstatus == 0:  # If it was a draft
-        if self.production_plan_item:
-            current_ordered_draft = frappe.db.get_value("Production Plan Item", 
-                                                       self.production_plan_item, 
-                                                       "ordered_in_draft") or 0
-            new_ordered_draft = max(0, current_ordered_draft - self.qty)
-            frappe.db.set_value("Production Plan Item", 
-                              self.production_plan_item, 
-                              "ordered_in_draft", 
-                              new_ordered_draft)
-        
-        if self.production_plan_sub_assembly_item:
-            current_ordered_draft = frappe.db.get_value("Production Plan Sub Assembly Item", 
-                                                       self.production_plan_sub_assembly_item, 
-                                                       "ordered_in_draft") or 0
-            new_ordered_draft = max(0, current_ordered_draft - self.qty)
-            frappe.db.set_value("Production Plan Sub Assembly Item", 
-                              self.production_plan_sub_assembly_item, 
-                              "ordered_in_draft", 
-                              new_ordered_draft)
-    
-    # If it was a submitted document being cancelled/deleted
-    elif self.docstatus == 1:  # If it was submitted
-        # No need to adjust ordered_in_draft as submitted docs don't count in draft
-        pass
-    
-    # Update remaining quantity for both plan items
-    if self.production_plan_item:
-        update_remaining_qty_for_plan_item(self, trigger_method)
-    
-    if self.production_plan_sub_assembly_item:
-        update_remaining_qty_for_sub_assembly_item(self, trigger_method)
-
-def update_remaining_qty_for_plan_item(self, trigger_method):
-    """Update remaining quantity for Production Plan Item"""
-    if not self.production_plan_item:
-        return
-    
-    # For on_trash, we don't exclude current document since it's being deleted
-    name_condition = "and name != %s" if self.name and trigger_method != "on_trash" else ""
-    params = [self.production_plan_item]
-    if name_condition:
-        params.append(self.name)
-    
-    work_order_data = frappe.db.sql(f"""
-                        Select 
-                            sum(case when docstatus = 0 then qty else 0 end) as draft_qty,
-                            sum(case when docstatus = 1 then qty else 0 end) as submitted_qty
-                        From `tabWork Order`
-                        Where production_plan_item = %s
-                        {name_condition}
-                    """, tuple(params), as_dict=1)
-    
-    draft_qty = work_order_data[0].draft_qty or 0
-    submitted_qty = work_order_data[0].submitted_qty or 0
-    
-    # Get planned quantity
-    plan_item = frappe.db.get_value("Production Plan Item", 
-                                   self.production_plan_item, 
-                                   ["planned_qty", "ordered_qty"], 
-                                   as_dict=1)
-    
-    if plan_item:
-        # Calculate remaining quantity
-        # remaining = planned_qty - (submitted_qty + draft_qty)
-        remaining_qty = max(0, (plan_item.planned_qty or 0) - (submitted_qty + draft_qty))
-        
-        # Update remaining_qty field
-        frappe.db.set_value("Production Plan Item", 
-                          self.production_plan_item, 
-                          "remaining_qty", 
-                          remaining_qty)
-        
-        # Update ordered_qty (total submitted)
-        frappe.db.set_value("Production Plan Item", 
-                          self.production_plan_item, 
-                          "ordered_qty", 
-                          submitted_qty)
-
-def update_remaining_qty_for_sub_assembly_item(self, trigger_method):
-    """Update remaining quantity for Production Plan Sub Assembly Item"""
-    if not self.production_plan_sub_assembly_item:
+        # Only ordered_qty changes, and that is recomputed
+        add_plan_deltas(deltas, self)
+
+    elif trigger_method == "on_trash" and self.docstatus == 0:
+        add_plan_deltas(deltas, self, draft=-flt(self.qty))
+
+    for (doctype, name), draft in sorted(deltas.items()):
+        if draft or trigger_method in ("on_submit", "on_cancel"):
+            apply_plan_delta(doctype, name, draft, check_planned=draft > 0, current_qty=flt(self.qty))
+
+def add_plan_deltas(deltas, work_order, draft=0):
+    if not work_order.get("production_plan"):
         return
-    
-    # For on_trash, we don't exclude current document since it's being deleted
-    name_condition = "and name != %s" if self.name and trigger_method != "on_trash" else ""
-    params = [self.production_plan_sub_assembly_item]
-    if name_condition:
-        params.append(self.name)
-    
-    work_order_data = frappe.db.sql(f"""
-                        Select 
-                            sum(case when docstatus = 0 then qty else 0 end) as draft_qty,
-                            sum(case when docstatus = 1 then qty else 0 end) as submitted_qty
-                        From `tabWork Order`
-                        Where production_plan_sub_assembly_item = %s
-                        {name_condition}
-                    """, tuple(params), as_dict=1)
-    
-    draft_qty = work_order_data[0].draft_qty or 0
-    submitted_qty = work_order_data[0].submitted_qty or 0
-    
-    # Get planned quantity
-    sub_assembly_item = frappe.db.get_value("Production Plan Sub Assembly Item", 
-                                           self.production_plan_sub_assembly_item, 
-                                           ["qty", "ordered_qty"], 
-                                           as_dict=1)
-    
-    if sub_assembly_item:
-        # Calculate remaining quantity
-        # remaining = planned_qty - (submitted_qty + draft_qty)
-        remaining_qty = max(0, (sub_assembly_item.qty or 0) - (submitted_qty + draft_qty))
-        
-        # Update remaining_qty field
-        frappe.db.set_value("Production Plan Sub Assembly Item", 
-                          self.production_plan_sub_assembly_item, 
-                          "remaining_qty", 
-                          remaining_qty)
-        
-        # Update ordered_qty (total submitted)
-        frappe.db.set_value("Production Plan Sub Assembly Item", 
-                          self.production_plan_sub_assembly_item, 
-                          "ordered_qty", 
-                          submitted_qty)
\ No newline at end of file
+
+    for link_field, (doctype, _planned_field) in PLAN_ROW_LINKS.items():
+        name = work_order.get(link_field)
+        # Sub-assembly Work Orders also carry the parent's production_plan_item;
+        # like ERPNext, they only count against their sub-assembly row
+        if link_field == "production_plan_item" and work_order.get("production_plan_sub_assembly_item"):
+            continue
+
+        if name:
+            deltas[(doctype, name)] = deltas.get((doctype, name), 0) + draft
+
+def apply_plan_delta(doctype, name, draft=0, check_planned=False, current_qty=0):
+    """Apply the draft delta and recompute ordered_qty of one plan row in a single UPDATE."""
+    link_field, planned_field = next(
+        (field, planned) for field, (dt, planned) in PLAN_ROW_LINKS.items() if dt == doctype
+    )
+
+    if check_planned:
+        row = frappe.db.sql(
+            f"""
+            SELECT {planned_field} AS planned_qty, ordered_in_draft
+            FROM `tab{doctype}`
+            WHERE name = %s
+            FOR UPDATE
+            """,
+            name,
+            as_dict=1,
+        )
+        if row:
+            planned_qty = flt(row[0].planned_qty)
+            total_draft_qty = flt(row[0].ordered_in_draft) + draft
+            if total_draft_qty and planned_qty and total_draft_qty > planned_qty:
+                frappe.throw(_("Planned quantity is {0}. Work Order is already created for {1} in draft.").format(
+                    planned_qty, abs(total_draft_qty - current_qty)
+                ))
+
+    # MariaDB applies SET assignments left to right, so remaining_qty sees the new counters
+    frappe.db.sql(
+        f"""
+        UPDATE `tab{doctype}`
+        SET
+            ordered_in_draft = GREATEST(0, IFNULL(ordered_in_draft, 0) + %(draft)s),
+            ordered_qty = (
+                SELECT IFNULL(SUM(wo.qty), 0)
+                FROM `tabWork Order` AS wo
+                WHERE wo.{link_field} = %(name)s AND wo.docstatus = 1 {get_sub_assembly_condition(link_field)}
+            ),
+            remaining_qty = GREATEST(0, IFNULL({planned_field}, 0) - ordered_qty - ordered_in_draft)
+        WHERE name = %(name)s
+        """,
+        {"draft": draft, "name": name},
+    )
+
+def get_sub_assembly_condition(link_field, alias="wo"):
+    if link_field != "production_plan_item":
+        return ""
+
+    return f"AND IFNULL({alias}.production_plan_sub_assembly_item, '') = ''"
+
+def reconcile_production_plan_quantities(production_plan=None):
+    """Recompute the plan row counters of submitted Production Plans from their Work Orders.
+
+    Pass `production_plan` to roll up a single plan.
+    """
+    plan_condition = "AND pp.name = %(production_plan)s" if production_plan else ""
+    wo_condition = "AND production_plan = %(production_plan)s" if production_plan else ""
+
+    for link_field, (doctype, planned_field) in PLAN_ROW_LINKS.items():
+        frappe.db.sql(
+            f"""
+            UPDATE `tab{doctype}` AS plan_row
+            INNER JOIN `tabProduction Plan` AS pp ON pp.name = plan_row.parent
+            LEFT JOIN (
+                SELECT
+                    {link_field} AS plan_row,
+                    SUM(CASE WHEN docstatus = 0 THEN qty ELSE 0 END) AS draft_qty,
+                    SUM(CASE WHEN docstatus = 1 THEN qty ELSE 0 END) AS submitted_qty
+                FROM `tabWork Order` AS wo
+                WHERE IFNULL({link_field}, '') != '' AND docstatus < 2 {wo_condition}
+                    {get_sub_assembly_condition(link_field)}
+                GROUP BY {link_field}
+            ) AS wo ON wo.plan_row = plan_row.name
+            SET
+                plan_row.ordered_in_draft = IFNULL(wo.draft_qty, 0),
+                plan_row.ordered_qty = IFNULL(wo.submitted_qty, 0),
+                plan_row.remaining_qty = GREATEST(
+                    0, IFNULL(plan_row.{planned_field}, 0) - IFNULL(wo.draft_qty, 0) - IFNULL(wo.submitted_qty, 0)
+                )
+            WHERE pp.docstatus = 1 {plan_condition}
+            """,
+            {"production_plan": production_plan},
+        )
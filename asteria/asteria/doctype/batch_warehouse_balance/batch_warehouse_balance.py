@@ -0,0 +1,248 @@
+# Copyright (c) 2026, Viral and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cstr, flt, now
+
+
+class BatchWarehouseBalance(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_unique(
+		"Batch Warehouse Balance",
+		["item_code", "batch_no", "warehouse"],
+		constraint_name="unique_item_batch_warehouse",
+	)
+	frappe.db.add_index("Batch Warehouse Balance", ["batch_no", "warehouse"])
+
+
+def update_from_stock_ledger_entry(doc, method=None):
+	"""Apply a submitted Stock Ledger Entry to the batch balance store.
+
+	On cancel ERPNext marks the original SLE as cancelled and submits a reversal
+	SLE (is_cancelled = 1, negated qty), so applying every submitted SLE as a
+	delta keeps the store equal to the sum over non-cancelled ledger rows.
+	"""
+	from asteria.asteria.doctype.reserve_stock.reserve_stock import clear_batch_qty_snapshot
+
+	deltas = get_batch_deltas_for_sle(doc)
+	apply_batch_deltas(deltas)
+	clear_batch_qty_snapshot([(batch_no, warehouse) for _item_code, batch_no, warehouse in deltas])
+
+
+def get_batch_deltas_for_sle(sle):
+	"""Return { (item_code, batch_no, warehouse): qty } moved by one SLE.
+
+	Mirrors the two paths of the ledger aggregation:
+	1. Legacy SLE rows (batch_no set directly on SLE, no bundle)
+	2. SBB-based rows (batch in Serial and Batch Entry, SLE has no batch_no)
+	"""
+	item_code = cstr(sle.item_code).strip()
+	batch_no = cstr(sle.batch_no).strip()
+	bundle = cstr(sle.serial_and_batch_bundle).strip()
+	deltas = {}
+
+	if batch_no and not bundle:
+		deltas[(item_code, batch_no, cstr(sle.warehouse).strip())] = flt(sle.actual_qty)
+
+	elif bundle and not batch_no:
+		# Reversal SLEs point to the same bundle, whose entries keep their original sign
+		sign = -1 if sle.is_cancelled else 1
+		rows = frappe.db.sql(
+			"""
+			SELECT sbe.batch_no, sbe.warehouse, SUM(sbe.qty) AS qty
+			FROM `tabSerial and Batch Entry` AS sbe
+			WHERE sbe.parent = %(bundle)s
+			  AND sbe.batch_no IS NOT NULL
+			  AND sbe.batch_no != ''
+			GROUP BY sbe.batch_no, sbe.warehouse
+			""",
+			{"bundle": bundle},
+			as_dict=True,
+		)
+		for row in rows:
+			key = (item_code, cstr(row.batch_no).strip(), cstr(row.warehouse).strip())
+			deltas[key] = deltas.get(key, 0) + sign * flt(row.qty)
+
+	return deltas
+
+
+def apply_batch_deltas(deltas):
+	"""Add qty deltas to the store with one atomic upsert per key.
+
+	Keys are applied in sorted order so concurrent postings lock rows in the same
+	sequence and cannot deadlock each other.
+	"""
+	timestamp = now()
+	for (item_code, batch_no, warehouse), qty in sorted(deltas.items()):
+		if not qty or not batch_no or not warehouse:
+			continue
+
+		frappe.db.sql(
+			"""
+			INSERT INTO `tabBatch Warehouse Balance`
+				(name, creation, modified, owner, modified_by, item_code, batch_no, warehouse, qty)
+			VALUES
+				(%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, %(item_code)s, %(batch_no)s, %(warehouse)s, %(qty)s)
+			ON DUPLICATE KEY UPDATE
+				qty = qty + VALUES(qty),
+				modified = VALUES(modified)
+			""",
+			{
+				"name": frappe.generate_hash(length=10),
+				"now": timestamp,
+				"user": frappe.session.user,
+				"item_code": item_code,
+				"batch_no": batch_no,
+				"warehouse": warehouse,
+				"qty": flt(qty),
+			},
+		)
+
+
+def get_batch_balance(batch_no, warehouse, item_code=None):
+	"""Return the stored balance of a batch in a warehouse (one indexed read)."""
+	filters = {"batch_no": batch_no, "warehouse": warehouse}
+	if item_code:
+		filters["item_code"] = item_code
+
+	return flt(frappe.db.get_value("Batch Warehouse Balance", filters, "sum(qty)"))
+
+
+def get_batch_balances(keys, item_code=None):
+	"""Return { (batch_no, warehouse): qty } for many keys in one grouped query.
+
+	Keys without any stored balance are returned with qty 0.
+	"""
+	keys = {(cstr(batch_no).strip(), cstr(warehouse).strip()) for batch_no, warehouse in keys or []}
+	keys = {key for key in keys if key[0] and key[1]}
+	if not keys:
+		return {}
+
+	values = {
+		"batch_nos": tuple({key[0] for key in keys}),
+		"warehouses": tuple({key[1] for key in keys}),
+	}
+	item_filter = ""
+	if item_code:
+		item_filter = "AND item_code = %(item_code)s"
+		values["item_code"] = item_code
+
+	rows = frappe.db.sql(
+		f"""
+		SELECT batch_no, warehouse, SUM(qty) AS qty
+		FROM `tabBatch Warehouse Balance`
+		WHERE batch_no IN %(batch_nos)s
+		  AND warehouse IN %(warehouses)s
+		  {item_filter}
+		GROUP BY batch_no, warehouse
+		""",
+		values,
+		as_dict=True,
+	)
+
+	balances = dict.fromkeys(keys, 0.0)
+	for row in rows:
+		key = (cstr(row.batch_no).strip(), cstr(row.warehouse).strip())
+		if key in balances:
+			balances[key] = flt(row.qty)
+
+	return balances
+
+
+def get_batch_warehouses(batch_nos):
+	"""Return { batch_no: [(item_code, warehouse), ...] } where the batch has positive qty."""
+	batch_nos = {cstr(batch_no).strip() for batch_no in batch_nos or [] if cstr(batch_no).strip()}
+	if not batch_nos:
+		return {}
+
+	rows = frappe.db.sql(
+		"""
+		SELECT item_code, batch_no, warehouse
+		FROM `tabBatch Warehouse Balance`
+		WHERE batch_no IN %(batch_nos)s
+		  AND qty > 0
+		ORDER BY batch_no, warehouse
+		""",
+		{"batch_nos": tuple(batch_nos)},
+		as_dict=True,
+	)
+
+	warehouses = {}
+	for row in rows:
+		warehouses.setdefault(row.batch_no, []).append((row.item_code, row.warehouse))
+
+	return warehouses
+
+
+def get_ledger_batch_balances():
+	"""Aggregate { (item_code, batch_no, warehouse): qty } from the full ledger."""
+	balances = {}
+
+	# 1. Legacy: SLE with batch_no (no SBB or SBB empty)
+	legacy_rows = frappe.db.sql(
+		"""
+		SELECT sle.item_code, sle.batch_no, sle.warehouse, SUM(sle.actual_qty) AS qty
+		FROM `tabStock Ledger Entry` sle
+		WHERE sle.batch_no IS NOT NULL
+		  AND sle.batch_no != ''
+		  AND sle.is_cancelled = 0
+		  AND (sle.serial_and_batch_bundle IS NULL OR sle.serial_and_batch_bundle = '')
+		GROUP BY sle.item_code, sle.batch_no, sle.warehouse
+		""",
+		as_dict=True,
+	)
+
+	# 2. SBB-based: batch qty from Serial and Batch Entry (SLE has SBB, no batch_no on SLE)
+	sbb_rows = frappe.db.sql(
+		"""
+		SELECT sle.item_code, sbe.batch_no, sbe.warehouse, SUM(sbe.qty) AS qty
+		FROM `tabSerial and Batch Entry` sbe
+		INNER JOIN `tabSerial and Batch Bundle` sbb ON sbe.parent = sbb.name
+		INNER JOIN `tabStock Ledger Entry` sle ON sle.serial_and_batch_bundle = sbb.name
+		WHERE sbe.batch_no IS NOT NULL
+		  AND sbe.batch_no != ''
+		  AND sle.is_cancelled = 0
+		  AND sbb.docstatus = 1
+		  AND (sle.batch_no IS NULL OR sle.batch_no = '')
+		GROUP BY sle.item_code, sbe.batch_no, sbe.warehouse
+		""",
+		as_dict=True,
+	)
+
+	for row in [*legacy_rows, *sbb_rows]:
+		key = (cstr(row.item_code).strip(), cstr(row.batch_no).strip(), cstr(row.warehouse).strip())
+		balances[key] = balances.get(key, 0) + flt(row.qty)
+
+	return balances
+
+
+def rebuild_batch_warehouse_balance():
+	"""Recompute the whole store from the Stock Ledger.
+
+	Run from bench (`bench --site <site> execute
+	asteria.asteria.doctype.batch_warehouse_balance.batch_warehouse_balance.rebuild_batch_warehouse_balance`)
+	while no stock transactions are being posted.
+	"""
+	balances = get_ledger_batch_balances()
+
+	frappe.db.sql("DELETE FROM `tabBatch Warehouse Balance`")
+
+	timestamp = now()
+	user = frappe.session.user
+	values = [
+		(frappe.generate_hash(length=10), timestamp, timestamp, user, user, *key, flt(qty))
+		for key, qty in sorted(balances.items())
+		if key[1] and key[2]
+	]
+
+	frappe.db.bulk_insert(
+		"Batch Warehouse Balance",
+		fields=["name", "creation", "modified", "owner", "modified_by", "item_code", "batch_no", "warehouse", "qty"],
+		values=values,
+	)
+
+	return len(values)
@@ -0,0 +1,299 @@
+# Copyright (c) 2026, Viral and contributors
+# For license information, please see license.txt
+
+"""Redis index of active Reserve Stock reservations.
+
+Two hashes are kept in frappe.cache:
+
+- BATCH_INDEX: field [batch_no, warehouse] -> { reserve_stock: reserved_qty }
+- SERIAL_INDEX: field serial_no -> reserve_stock
+
+Each hash carries its own READY_FIELD, written last by a rebuild. Redis evicts
+a hash as a whole, so a hash without the marker (never built, evicted, or
+flushed) is not trusted and readers use SQL until `bench
+rebuild-reservation-index` runs.
+
+A Reserve Stock change marks the keys it touches PENDING inside its
+transaction; readers resolve pending keys from SQL. After the transaction
+commits or rolls back, the keys are recomputed from SQL, so the index never
+serves entries older than the committed rows.
+"""
+
+import json
+import pickle
+
+import frappe
+from frappe.utils import cstr, flt
+
+BATCH_INDEX = "asteria:reserved_batch"
+SERIAL_INDEX = "asteria:reserved_serial"
+READY_FIELD = "__ready__"
+PENDING = "__pending__"
+
+
+def is_index_ready():
+	return all(_is_hash_ready(name) for name in (BATCH_INDEX, SERIAL_INDEX))
+
+
+def get_indexed_batch_reservations(keys):
+	"""Return { (batch_no, warehouse): { reserve_stock: qty } }, or None when the index is not built."""
+	keys = list(keys)
+	values = _hmget(BATCH_INDEX, [_batch_field(key) for key in keys])
+	if values is None:
+		return None
+
+	reservations = {key: value for key, value in zip(keys, values) if value and value != PENDING}
+	pending = [key for key, value in zip(keys, values) if value == PENDING]
+	if pending:
+		reservations.update(get_batch_reservations_from_db(pending))
+
+	return reservations
+
+
+def get_indexed_serial_reservations(serial_nos):
+	"""Return { serial_no: reserve_stock }, or None when the index is not built."""
+	serial_nos = list(serial_nos)
+	values = _hmget(SERIAL_INDEX, serial_nos)
+	if values is None:
+		return None
+
+	reservations = {
+		serial_no: value for serial_no, value in zip(serial_nos, values) if value and value != PENDING
+	}
+	pending = [serial_no for serial_no, value in zip(serial_nos, values) if value == PENDING]
+	if pending:
+		reservations.update(get_serial_reservations_from_db(pending))
+
+	return reservations
+
+
+def schedule_index_refresh(doc):
+	"""Refresh index entries for every key the Reserve Stock (now or before save) touches."""
+	rows = list(getattr(doc, "items", []) or [])
+	doc_before_save = doc.get_doc_before_save() if hasattr(doc, "get_doc_before_save") else None
+	if doc_before_save:
+		rows.extend(getattr(doc_before_save, "items", []) or [])
+
+	batch_keys = set()
+	serial_nos = set()
+	for row in rows:
+		batch_no = cstr(row.get("batch_no")).strip()
+		warehouse = cstr(row.get("warehouse")).strip()
+		serial_no = cstr(row.get("serial_no")).strip()
+		if batch_no and warehouse:
+			batch_keys.add((batch_no, warehouse))
+		if serial_no:
+			serial_nos.add(serial_no)
+
+	schedule_key_refresh(batch_keys, serial_nos)
+
+
+def schedule_key_refresh(batch_keys=None, serial_nos=None):
+	"""Mark the keys pending now and recompute them once the transaction ends."""
+	batch_keys = set(batch_keys or [])
+	serial_nos = set(serial_nos or [])
+	if not batch_keys and not serial_nos:
+		return
+
+	if _is_hash_ready(BATCH_INDEX):
+		_hset_many(BATCH_INDEX, {_batch_field(key): PENDING for key in batch_keys})
+	if _is_hash_ready(SERIAL_INDEX):
+		_hset_many(SERIAL_INDEX, {serial_no: PENDING for serial_no in serial_nos})
+
+	frappe.db.after_commit.add(lambda: refresh_index_keys(batch_keys, serial_nos))
+	frappe.db.after_rollback.add(lambda: refresh_index_keys(batch_keys, serial_nos))
+
+
+def refresh_index_keys(batch_keys=None, serial_nos=None):
+	"""Recompute the given index entries from SQL."""
+	batch_keys = set(batch_keys or [])
+	serial_nos = set(serial_nos or [])
+
+	if batch_keys and _is_hash_ready(BATCH_INDEX):
+		reservations = get_batch_reservations_from_db(batch_keys)
+		_hset_many(
+			BATCH_INDEX,
+			{_batch_field(key): reservations[key] for key in batch_keys if reservations.get(key)},
+			delete=[_batch_field(key) for key in batch_keys if not reservations.get(key)],
+		)
+
+	if serial_nos and _is_hash_ready(SERIAL_INDEX):
+		reservations = get_serial_reservations_from_db(serial_nos)
+		_hset_many(
+			SERIAL_INDEX,
+			{serial_no: reservations[serial_no] for serial_no in serial_nos if reservations.get(serial_no)},
+			delete=[serial_no for serial_no in serial_nos if not reservations.get(serial_no)],
+		)
+
+
+def rebuild_reservation_index():
+	"""Rebuild both hashes from SQL; the ready marker of each is written last."""
+	frappe.cache.delete_value([BATCH_INDEX, SERIAL_INDEX])
+
+	batch_reservations = get_batch_reservations_from_db()
+	_hset_many(BATCH_INDEX, {_batch_field(key): value for key, value in batch_reservations.items()})
+	_hset_many(BATCH_INDEX, {READY_FIELD: 1})
+
+	serial_reservations = get_serial_reservations_from_db()
+	_hset_many(SERIAL_INDEX, serial_reservations)
+	_hset_many(SERIAL_INDEX, {READY_FIELD: 1})
+
+	return {"batch_no": len(batch_reservations), "serial_no": len(serial_reservations)}
+
+
+@frappe.whitelist()
+def check_reservation_index():
+	"""Compare the index against SQL and return the keys that differ."""
+	frappe.only_for("System Manager")
+
+	if not is_index_ready():
+		return {"ready": False}
+
+	mismatches = {"batch_no": [], "serial_no": []}
+
+	batch_reservations = get_batch_reservations_from_db()
+	indexed_batches = {
+		tuple(json.loads(field)): value
+		for field, value in _hgetall(BATCH_INDEX).items()
+		if field != READY_FIELD and value != PENDING
+	}
+	for key in sorted(set(batch_reservations) | set(indexed_batches)):
+		expected = batch_reservations.get(key) or {}
+		indexed = indexed_batches.get(key) or {}
+		if set(expected) != set(indexed) or any(
+			flt(expected[name]) != flt(indexed[name]) for name in expected
+		):
+			mismatches["batch_no"].append(
+				{"batch_no": key[0], "warehouse": key[1], "expected": expected, "indexed": indexed}
+			)
+
+	serial_reservations = get_serial_reservations_from_db()
+	indexed_serials = {
+		field: value for field, value in _hgetall(SERIAL_INDEX).items() if field != READY_FIELD and value != PENDING
+	}
+	for serial_no in sorted(set(serial_reservations) | set(indexed_serials)):
+		if serial_reservations.get(serial_no) != indexed_serials.get(serial_no):
+			mismatches["serial_no"].append(
+				{
+					"serial_no": serial_no,
+					"expected": serial_reservations.get(serial_no),
+					"indexed": indexed_serials.get(serial_no),
+				}
+			)
+
+	return {
+		"ready": True,
+		"consistent": not mismatches["batch_no"] and not mismatches["serial_no"],
+		"mismatches": mismatches,
+	}
+
+
+def get_batch_reservations_from_db(keys=None):
+	"""Return { (batch_no, warehouse): { reserve_stock: qty } } for active reservations."""
+	conditions = [
+		"sri.parenttype = 'Reserve Stock'",
+		"sri.status = 'Reserved'",
+		"rs.docstatus = 1",
+		"sri.batch_no IS NOT NULL",
+		"sri.batch_no != ''",
+		"sri.warehouse IS NOT NULL",
+		"sri.warehouse != ''",
+	]
+	values = {}
+
+	if keys is not None:
+		keys = set(keys)
+		if not keys:
+			return {}
+		conditions.append("sri.batch_no IN %(batch_nos)s")
+		conditions.append("sri.warehouse IN %(warehouses)s")
+		values["batch_nos"] = tuple({key[0] for key in keys})
+		values["warehouses"] = tuple({key[1] for key in keys})
+
+	rows = frappe.db.sql(
+		f"""
+		SELECT
+			sri.batch_no,
+			sri.warehouse,
+			rs.name AS reserve_stock,
+			SUM(ABS(IFNULL(sri.qty, 0))) AS reserved_qty
+		FROM `tabStock Reservation Items` AS sri
+		INNER JOIN `tabReserve Stock` AS rs ON rs.name = sri.parent
+		WHERE {" AND ".join(conditions)}
+		GROUP BY sri.batch_no, sri.warehouse, rs.name
+		""",
+		values,
+		as_dict=True,
+	)
+
+	reservations = {}
+	for row in rows:
+		key = (cstr(row.batch_no).strip(), cstr(row.warehouse).strip())
+		if keys is not None and key not in keys:
+			continue
+		reservations.setdefault(key, {})[row.reserve_stock] = flt(row.reserved_qty)
+
+	return reservations
+
+
+def get_serial_reservations_from_db(serial_nos=None):
+	"""Return { serial_no: reserve_stock } for active reservations."""
+	conditions = [
+		"sri.parenttype = 'Reserve Stock'",
+		"sri.status = 'Reserved'",
+		"rs.docstatus = 1",
+		"sri.serial_no IS NOT NULL",
+		"sri.serial_no != ''",
+	]
+	values = {}
+
+	if serial_nos is not None:
+		if not serial_nos:
+			return {}
+		conditions.append("sri.serial_no IN %(serial_nos)s")
+		values["serial_nos"] = tuple(serial_nos)
+
+	rows = frappe.db.sql(
+		f"""
+		SELECT sri.serial_no, rs.name
+		FROM `tabStock Reservation Items` AS sri
+		INNER JOIN `tabReserve Stock` AS rs ON rs.name = sri.parent
+		WHERE {" AND ".join(conditions)}
+		""",
+		values,
+		as_dict=True,
+	)
+
+	return {cstr(row.serial_no).strip(): row.name for row in rows}
+
+
+def _batch_field(key):
+	return json.dumps([key[0], key[1]])
+
+
+def _is_hash_ready(name):
+	return bool(frappe.cache.hexists(name, READY_FIELD))
+
+
+def _hmget(name, fields):
+	"""Values of `fields` in one round trip, or None when the hash is not built."""
+	values = frappe.cache.hmget(frappe.cache.make_key(name), [READY_FIELD, *fields])
+	if values[0] is None:
+		return None
+
+	return [pickle.loads(value) if value is not None else None for value in values[1:]]
+
+
+def _hgetall(name):
+	return {cstr(field): value for field, value in (frappe.cache.hgetall(name) or {}).items()}
+
+
+def _hset_many(name, mapping, delete=None):
+	"""Write and delete hash fields in one pipelined round trip."""
+	key = frappe.cache.make_key(name)
+	pipeline = frappe.cache.pipeline()
+	if mapping:
+		pipeline.hset(key, mapping={field: pickle.dumps(value) for field, value in mapping.items()})
+	if delete:
+		pipeline.hdel(key, *delete)
+	pipeline.execute()
@@ -45,6 +45,14 @@ frappe.ui.form.on("Reserve Stock", {
 			toggle_qty_editable_for_row(frm, row.name, !row.serial_no);
 		});
 
+		if (frm.doc.docstatus === 0) {
+			load_allowed_warehouses_for_grid(frm);
+		}
+
+		if (!frm.is_new() && frm.doc.docstatus === 0) {
+			frm.add_custom_button(__("Import Rows"), () => import_rows_from_file(frm));
+		}
+
 		if (!frm.is_new() && frm.doc.docstatus === 1) {
 			const has_reserved_row = (frm.doc.items || []).some(
 				(row) => row.status !== "Unreserved"
@@ -56,7 +64,16 @@ frappe.ui.form.on("Reserve Stock", {
 					frappe.call({
 						method: "asteria.asteria.doctype.reserve_stock.reserve_stock.mark_as_unreserved",
 						args: { name: frm.doc.name },
-						callback: () => frm.reload_doc(),
+						callback: (r) => {
+							if (r.message?.status === "Queued") {
+								frappe.show_alert({
+									message: __("Unreserving {0} rows in the background.", [r.message.count]),
+									indicator: "blue",
+								});
+								return;
+							}
+							frm.reload_doc();
+						},
 					});
 				});
 			});
@@ -87,6 +104,67 @@ frappe.ui.form.on("Reserve Stock", {
 	},
 });
 
+function import_rows_from_file(frm) {
+	const dialog = new frappe.ui.Dialog({
+		title: __("Import Reservation Rows"),
+		fields: [
+			{
+				fieldname: "file_url",
+				fieldtype: "Attach",
+				label: __("CSV / XLSX File"),
+				description: __("Columns: Item Code, Serial No, Batch No, Warehouse, Qty"),
+				reqd: 1,
+			},
+		],
+		primary_action_label: __("Import"),
+		primary_action: ({ file_url }) => {
+			dialog.hide();
+			frappe.call({
+				method: "asteria.asteria.doctype.reserve_stock.reserve_stock_import.import_reserve_stock",
+				args: { file_url: file_url, reserve_stock: frm.doc.name },
+				freeze: true,
+				freeze_message: __("Importing rows..."),
+				callback: (r) => {
+					if (r.message?.status === "Queued") {
+						frappe.show_alert({ message: __("Import queued in the background."), indicator: "blue" });
+						return;
+					}
+					show_import_summary(r.message || {});
+					frm.reload_doc();
+				},
+			});
+		},
+	});
+	dialog.show();
+}
+
+function show_import_summary(summary) {
+	const errors = (summary.errors || [])
+		.slice(0, 100)
+		.map((d) => `<li>${__("Row {0}", [d.row])}: ${d.error}</li>`)
+		.join("");
+
+	frappe.msgprint({
+		title: __("Import Summary"),
+		indicator: summary.rejected_rows ? "orange" : "green",
+		message: `
+			<p>${__("{0} of {1} rows imported ({2} rows/s).", [
+				summary.accepted_rows,
+				summary.total_rows,
+				summary.rows_per_second,
+			])}</p>
+			${errors ? `<ul>${errors}</ul>` : ""}
+		`,
+	});
+}
+
+frappe.realtime.on("reserve_stock_import_complete", (summary) => {
+	show_import_summary(summary);
+	if (cur_frm?.doc?.doctype === "Reserve Stock" && cur_frm.doc.name === summary.reserve_stock) {
+		cur_frm.reload_doc();
+	}
+});
+
 function update_available_qty_for_row(frm, cdt, cdn) {
 	const row = locals[cdt][cdn];
 	if (!row.batch_no || !row.warehouse) {
@@ -110,6 +188,26 @@ function update_available_qty_for_row(frm, cdt, cdn) {
 	});
 }
 
+function load_allowed_warehouses_for_grid(frm) {
+	// Resolve allowed warehouses for every serial / batch row in one round trip.
+	const rows = (frm.doc.items || []).filter((row) => row.serial_no || row.batch_no);
+	if (!rows.length) return;
+
+	frappe.call({
+		method: "asteria.asteria.doctype.reserve_stock.reserve_stock.get_available_warehouses_for_reserve_row",
+		args: {
+			rows: rows.map((row) => [row.item_code, row.batch_no, row.serial_no]),
+		},
+		callback: (r) => {
+			if (r.exc) return;
+
+			(r.message || []).forEach((allowed, i) => {
+				rows[i]._allowed_warehouses = allowed || [];
+			});
+		},
+	});
+}
+
 function update_allowed_warehouses_for_row(frm, cdt, cdn) {
 	const row = locals[cdt][cdn];
 
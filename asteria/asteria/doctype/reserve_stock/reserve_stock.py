@@ -1,10 +1,25 @@
 # Copyright (c) 2026, Viral and contributors
 # For license information, please see license.txt
 
+import re
+
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import cstr, flt
+from frappe.utils import add_days, cint, cstr, flt, now, nowdate, parse_json
+
+from asteria.asteria.doctype.batch_warehouse_balance.batch_warehouse_balance import (
+	get_batch_balance,
+	get_batch_balances,
+	get_batch_warehouses,
+)
+from asteria.asteria.doctype.reserve_stock.reservation_allocation import allocate_batch_reservations
+from asteria.asteria.doctype.reserve_stock.reservation_index import (
+	get_indexed_batch_reservations,
+	get_indexed_serial_reservations,
+	schedule_index_refresh,
+	schedule_key_refresh,
+)
 
 
 class ReserveStock(Document):
@@ -18,12 +33,22 @@ class ReserveStock(Document):
 			if not cstr(row.get("status")).strip():
 				row.status = "Reserved"
 
-		validate_batch_reservation_availability(self)
+		validate_batch_reservation_availability(self, lock=True)
+
+	def on_submit(self):
+		clear_reservation_snapshot()
+		schedule_index_refresh(self)
 
 	def on_update_after_submit(self):
 		# Re-validate whenever a submitted Reserve Stock is edited (e.g. row status changed)
 		validate_child_row_warehouses(self)
-		validate_batch_reservation_availability(self)
+		validate_batch_reservation_availability(self, lock=True)
+		clear_reservation_snapshot()
+		schedule_index_refresh(self)
+
+	def on_cancel(self):
+		clear_reservation_snapshot()
+		schedule_index_refresh(self)
 
 
 def validate_child_row_warehouses(doc):
@@ -46,6 +71,9 @@ def get_reserved_stock_references(serial_nos=None, batch_nos=None):
 	reserved_batch_refs = {}
 
 	if serial_nos:
+		reserved_serial_refs = get_indexed_serial_reservations(serial_nos)
+
+	if serial_nos and reserved_serial_refs is None:
 		serial_rows = frappe.db.sql(
 			"""
 			SELECT sri.serial_no, rs.name
@@ -87,6 +115,24 @@ def get_reserved_batch_details(batch_nos=None, warehouses=None, item_code=None,
 	batch_nos = [cstr(v).strip() for v in (batch_nos or []) if cstr(v).strip()]
 	warehouses = [cstr(v).strip() for v in (warehouses or []) if cstr(v).strip()]
 
+	indexed = None
+	if batch_nos and warehouses and not item_code:
+		indexed = get_indexed_batch_reservations(
+			{(batch_no, warehouse) for batch_no in batch_nos for warehouse in warehouses}
+		)
+
+	if indexed is not None:
+		reserved_batch_details = {}
+		for key, qty_by_reserve_stock in indexed.items():
+			reserve_stocks = sorted(name for name in qty_by_reserve_stock if name != exclude_reserve_stock)
+			if reserve_stocks:
+				reserved_batch_details[key] = {
+					"reserved_qty": sum(flt(qty_by_reserve_stock[name]) for name in reserve_stocks),
+					"reserve_stocks": reserve_stocks,
+				}
+
+		return reserved_batch_details
+
 	conditions = [
 		"sri.parenttype = 'Reserve Stock'",
 		"sri.status = 'Reserved'",
@@ -141,138 +187,188 @@ def get_reserved_batch_details(batch_nos=None, warehouses=None, item_code=None,
 	return reserved_batch_details
 
 
+def get_reservation_snapshot():
+	"""Return the request-scoped reservation snapshot.
+
+	A Stock Entry save runs the Stock Entry validate hook and then the validate
+	hook of every Serial and Batch Bundle it generates; all of them read the same
+	reservation and balance keys. The snapshot keeps what was already fetched in
+	this request, keyed by serial_no and by (batch_no, warehouse):
+
+	- serial_no: { serial_no: reserve_stock or None }
+	- batch_no: { (batch_no, warehouse): reserved batch detail or None }
+	- batch_qty: { (batch_no, warehouse): current qty }
+	"""
+	snapshot = getattr(frappe.local, "reservation_snapshot", None)
+	if snapshot is None:
+		snapshot = frappe.local.reservation_snapshot = frappe._dict(serial_no={}, batch_no={}, batch_qty={})
+
+	return snapshot
+
+
+def clear_reservation_snapshot():
+	"""Drop the request-scoped snapshot, e.g. after a Reserve Stock change."""
+	frappe.local.reservation_snapshot = None
+
+
+def clear_batch_qty_snapshot(keys):
+	"""Forget cached balances of (batch_no, warehouse) keys after a ledger posting."""
+	snapshot = getattr(frappe.local, "reservation_snapshot", None)
+	if not snapshot:
+		return
+
+	for key in keys:
+		snapshot.batch_qty.pop(key, None)
+
+	# ATP figures are derived from the same balances
+	snapshot.pop("atp", None)
+
+
+def get_cached_reserved_serials(serial_nos):
+	"""Return { serial_no: reserve_stock } for reserved serials, through the snapshot."""
+	cache = get_reservation_snapshot().serial_no
+	serial_nos = {cstr(s).strip() for s in serial_nos or [] if cstr(s).strip()}
+
+	missing = [s for s in serial_nos if s not in cache]
+	if missing:
+		reserved = get_reserved_stock_references(serial_nos=missing).get("serial_no", {})
+		for serial_no in missing:
+			cache[serial_no] = reserved.get(serial_no)
+
+	return {s: cache[s] for s in serial_nos if cache.get(s)}
+
+
+def get_cached_reserved_batches(keys):
+	"""Return { (batch_no, warehouse): detail } for reserved keys, through the snapshot."""
+	cache = get_reservation_snapshot().batch_no
+	keys = set(keys or [])
+
+	missing = [key for key in keys if key not in cache]
+	if missing:
+		reserved = get_reserved_batch_details(
+			batch_nos=[key[0] for key in missing],
+			warehouses=[key[1] for key in missing],
+		)
+		for key in missing:
+			cache[key] = reserved.get(key)
+
+	return {key: cache[key] for key in keys if cache.get(key)}
+
+
+def get_cached_batch_qty(keys):
+	"""Return { (batch_no, warehouse): qty } through the snapshot."""
+	cache = get_reservation_snapshot().batch_qty
+	keys = set(keys or [])
+
+	missing = [key for key in keys if key not in cache]
+	if missing:
+		cache.update(get_batch_qty_bulk(missing))
+
+	return {key: cache.get(key, 0) for key in keys}
+
+
 @frappe.whitelist()
 def get_batch_qty_in_warehouse(batch_no, warehouse, item_code=None):
 	"""Return batch qty so it matches Stock Ledger / Batch Balance report.
 
-	Includes both:
+	Reads the Batch Warehouse Balance store, which is maintained from every
+	submitted Stock Ledger Entry and includes both:
 	1. Legacy SLE rows (batch_no set directly on SLE)
 	2. SBB-based rows (batch in Serial and Batch Entry, SLE has serial_and_batch_bundle)
 
 	ERPNext's get_batch_qty uses only the SBB join and can undercount when some
 	stock was received without Serial and Batch Bundle.
 	"""
-	values = {"batch_no": batch_no, "warehouse": warehouse}
-	item_filter = "AND sle.item_code = %(item_code)s" if item_code else ""
-	if item_code:
-		values["item_code"] = item_code
+	return get_batch_balance(batch_no, warehouse, item_code=item_code)
 
-	# 1. Legacy: SLE with batch_no (no SBB or SBB empty)
-	qty_legacy = frappe.db.sql(
-		f"""
-		SELECT IFNULL(SUM(sle.actual_qty), 0)
-		FROM `tabStock Ledger Entry` sle
-		WHERE sle.batch_no = %(batch_no)s
-		  AND sle.warehouse = %(warehouse)s
-		  AND sle.is_cancelled = 0
-		  AND (sle.serial_and_batch_bundle IS NULL OR sle.serial_and_batch_bundle = '')
-		  {item_filter}
-		""",
-		values,
-	)
-	legacy = flt(qty_legacy[0][0]) if qty_legacy else 0
 
-	# 2. SBB-based: batch qty from Serial and Batch Entry (SLE has SBB, no batch_no on SLE)
-	qty_sbb = frappe.db.sql(
-		f"""
-		SELECT IFNULL(SUM(sbe.qty), 0)
-		FROM `tabSerial and Batch Entry` sbe
-		INNER JOIN `tabSerial and Batch Bundle` sbb ON sbe.parent = sbb.name
-		INNER JOIN `tabStock Ledger Entry` sle ON sle.serial_and_batch_bundle = sbb.name
-		WHERE sbe.batch_no = %(batch_no)s
-		  AND sbe.warehouse = %(warehouse)s
-		  AND sle.is_cancelled = 0
-		  AND sbb.docstatus = 1
-		  AND (sle.batch_no IS NULL OR sle.batch_no = '')
-		  {item_filter}
-		""",
-		values,
-	)
-	sbb = flt(qty_sbb[0][0]) if qty_sbb else 0
+@frappe.whitelist()
+def get_batch_qty_bulk(keys, item_code=None):
+	"""Return { (batch_no, warehouse): qty } for many (batch_no, warehouse) keys at once.
 
-	return legacy + sbb
+	Same figures as get_batch_qty_in_warehouse, read from the balance store in a
+	single grouped query. Over HTTP the keys arrive as a JSON list of pairs and
+	the result is returned as a list of {batch_no, warehouse, qty} rows.
+	"""
+	if isinstance(keys, str):
+		balances = get_batch_balances([tuple(key) for key in parse_json(keys)], item_code=item_code)
+		return [
+			{"batch_no": batch_no, "warehouse": warehouse, "qty": qty}
+			for (batch_no, warehouse), qty in sorted(balances.items())
+		]
+
+	return get_batch_balances(keys, item_code=item_code)
 
 
 @frappe.whitelist()
-def get_available_warehouses_for_reserve_row(item_code=None, serial_no=None, batch_no=None):
+def get_available_warehouses_for_reserve_row(item_code=None, serial_no=None, batch_no=None, rows=None):
 	"""Return list of warehouses where the given serial / batch currently has stock.
 
 	- If serial_no is provided: return its current warehouse (if any and Active).
-	- If batch_no is provided: return all warehouses where that batch has positive qty,
-	  combining both legacy SLE rows and SBB-based rows.
+	- If batch_no is provided: return all warehouses where that batch has positive qty
+	  in the Batch Warehouse Balance store (legacy SLE and SBB-based stock).
+
+	Pass `rows` (a list of {item_code, batch_no, serial_no} dicts or
+	[item_code, batch_no, serial_no] lists) to resolve a whole grid in one call;
+	the result is then a list of warehouse lists in the same order.
 	"""
-	item_code = cstr(item_code).strip() or None
-	serial_no = cstr(serial_no).strip() or None
-	batch_no = cstr(batch_no).strip() or None
-
-	warehouses = set()
-
-	# 1) Serial No current warehouse
-	if serial_no:
-		serial_wh = frappe.db.get_value(
-			"Serial No",
-			{"name": serial_no, "status": "Active"},
-			"warehouse",
-		)
-		if serial_wh:
-			warehouses.add(cstr(serial_wh).strip())
-
-	# 2) Batch-wise warehouses with positive qty
-	if batch_no:
-		values = {"batch_no": batch_no}
-		item_filter = ""
-		if item_code:
-			item_filter = "AND sle.item_code = %(item_code)s"
-			values["item_code"] = item_code
-
-		# 2a) Legacy SLE rows with batch_no directly on SLE
-		legacy_rows = frappe.db.sql(
-			f"""
-			SELECT sle.warehouse, SUM(sle.actual_qty) AS qty
-			FROM `tabStock Ledger Entry` sle
-			WHERE sle.batch_no = %(batch_no)s
-			  AND sle.is_cancelled = 0
-			  {item_filter}
-			GROUP BY sle.warehouse
-			HAVING SUM(sle.actual_qty) > 0
-			""",
-			values,
-			as_dict=True,
-		)
-		for row in legacy_rows:
-			if row.warehouse:
-				warehouses.add(cstr(row.warehouse).strip())
-
-		# 2b) SBB-based rows where SLE links to Serial and Batch Bundle
-		sbb_rows = frappe.db.sql(
-			f"""
-			SELECT sbe.warehouse, SUM(sbe.qty) AS qty
-			FROM `tabSerial and Batch Entry` AS sbe
-			INNER JOIN `tabSerial and Batch Bundle` AS sbb ON sbe.parent = sbb.name
-			INNER JOIN `tabStock Ledger Entry` AS sle ON sle.serial_and_batch_bundle = sbb.name
-			WHERE sbe.batch_no = %(batch_no)s
-			  AND sle.is_cancelled = 0
-			  AND sbb.docstatus = 1
-			  {item_filter}
-			GROUP BY sbe.warehouse
-			HAVING SUM(sbe.qty) > 0
-			""",
-			values,
-			as_dict=True,
+	if rows is not None:
+		if isinstance(rows, str):
+			rows = parse_json(rows)
+
+		return get_available_warehouses_bulk(rows)
+
+	return get_available_warehouses_bulk([(item_code, batch_no, serial_no)])[0]
+
+
+def get_available_warehouses_bulk(rows):
+	"""Resolve available warehouses for many (item_code, batch_no, serial_no) rows."""
+	keys = []
+	for row in rows or []:
+		if isinstance(row, dict):
+			row = (row.get("item_code"), row.get("batch_no"), row.get("serial_no"))
+		keys.append(tuple(cstr(value).strip() or None for value in row))
+
+	serial_nos = {serial_no for _item_code, _batch_no, serial_no in keys if serial_no}
+	serial_warehouses = {}
+	if serial_nos:
+		serial_warehouses = dict(
+			frappe.get_all(
+				"Serial No",
+				filters={"name": ("in", list(serial_nos)), "status": "Active"},
+				fields=["name", "warehouse"],
+				as_list=True,
+			)
 		)
-		for row in sbb_rows:
-			if row.warehouse:
-				warehouses.add(cstr(row.warehouse).strip())
 
-	if not warehouses:
-		return []
+	batch_warehouses = get_batch_warehouses({batch_no for _item_code, batch_no, _serial_no in keys if batch_no})
+
+	result = []
+	for item_code, batch_no, serial_no in keys:
+		warehouses = set()
+
+		# 1) Serial No current warehouse
+		if serial_no and serial_warehouses.get(serial_no):
+			warehouses.add(cstr(serial_warehouses[serial_no]).strip())
 
-	# Return sorted unique list
-	return sorted(warehouses)
+		# 2) Batch-wise warehouses with positive qty
+		for batch_item_code, warehouse in batch_warehouses.get(batch_no, []):
+			if not item_code or batch_item_code == item_code:
+				warehouses.add(cstr(warehouse).strip())
 
+		# Return sorted unique list
+		result.append(sorted(warehouses))
 
-def validate_batch_reservation_availability(doc):
-	"""Ensure requested reserved qty is available in selected warehouse for each batch."""
+	return result
+
+
+def validate_batch_reservation_availability(doc, lock=False):
+	"""Ensure requested reserved qty is available in selected warehouse for each batch.
+
+	With lock=True (submit and update after submit) availability is evaluated by
+	the allocation engine under row locks, so concurrent reservations of the same
+	batch cannot both pass.
+	"""
 	requested_by_key = {}
 	for row in getattr(doc, "items", []) or []:
 		# Only validate rows that are (or will be) reserved
@@ -307,50 +403,318 @@ def validate_batch_reservation_availability(doc):
 	if not requested_by_key:
 		return
 
-	reserved_other = get_reserved_batch_details(
-		batch_nos=[k[0] for k in requested_by_key],
-		warehouses=[k[1] for k in requested_by_key],
-		exclude_reserve_stock=doc.name,
-	)
-
-	for (batch_no, warehouse), requested_qty in requested_by_key.items():
-		current_qty = get_batch_qty_in_warehouse(batch_no, warehouse)
-		already_reserved_qty = flt(reserved_other.get((batch_no, warehouse), {}).get("reserved_qty"))
-		available_to_reserve = current_qty - already_reserved_qty
+	if lock:
+		allocation = allocate_batch_reservations(requested_by_key, exclude_reserve_stock=doc.name)
+	else:
+		allocation = get_batch_reservation_availability(requested_by_key, exclude_reserve_stock=doc.name)
 
-		if requested_qty > available_to_reserve:
+	for (batch_no, warehouse), row in allocation.items():
+		if not row.allocated:
 			frappe.throw(
 				_(
 					"Cannot reserve {0} qty for batch {1} in warehouse {2}.<br>"
 					"Available to reserve: {3} (Current stock: {4}, Already reserved: {5})."
 				).format(
-					frappe.bold(requested_qty),
+					frappe.bold(row.requested_qty),
 					frappe.bold(batch_no),
 					frappe.bold(warehouse),
-					frappe.bold(flt(available_to_reserve)),
-					frappe.bold(flt(current_qty)),
-					frappe.bold(flt(already_reserved_qty)),
+					frappe.bold(flt(row.available_qty)),
+					frappe.bold(flt(row.current_qty)),
+					frappe.bold(flt(row.reserved_qty)),
 				),
 				title=_("Insufficient Batch Qty"),
 			)
 
 
+def get_batch_reservation_availability(requested_by_key, exclude_reserve_stock=None):
+	"""Non-locking counterpart of allocate_batch_reservations, used while in draft."""
+	reserved_other = get_reserved_batch_details(
+		batch_nos=[k[0] for k in requested_by_key],
+		warehouses=[k[1] for k in requested_by_key],
+		exclude_reserve_stock=exclude_reserve_stock,
+	)
+	current_qty_by_key = get_batch_qty_bulk(requested_by_key.keys())
+
+	availability = {}
+	for key, requested_qty in requested_by_key.items():
+		current_qty = current_qty_by_key.get(key, 0)
+		reserved_qty = flt(reserved_other.get(key, {}).get("reserved_qty"))
+		availability[key] = frappe._dict(
+			requested_qty=requested_qty,
+			current_qty=current_qty,
+			reserved_qty=reserved_qty,
+			available_qty=current_qty - reserved_qty,
+			allocated=requested_qty <= current_qty - reserved_qty,
+		)
+
+	return availability
+
+
+UNRESERVE_BACKGROUND_THRESHOLD = 2000
+UNRESERVE_CHUNK_SIZE = 500
+
+
 @frappe.whitelist()
-def mark_as_unreserved(name: str):
-	"""Mark submitted Reserve Stock rows as Unreserved from form button."""
-	doc = frappe.get_doc("Reserve Stock", name)
-	doc.check_permission("write")
+def mark_as_unreserved(
+	name: str,
+	item_code: str | None = None,
+	warehouse: str | None = None,
+	batch_no: str | None = None,
+	from_serial_no: str | None = None,
+	to_serial_no: str | None = None,
+):
+	"""Mark submitted Reserve Stock rows as Unreserved from form button.
+
+	All rows matching the optional filters are updated in one statement. Large
+	selections are handed to a background job that works in chunks and publishes
+	progress.
+
+	A serial range is given as serials that share a prefix and end in a number,
+	e.g. "SN-0001" to "SN-0150" (zero padding optional). It matches, inclusively,
+	serials with the same prefix whose trailing number lies between the two.
+	"""
+	frappe.has_permission("Reserve Stock", "write", name, throw=True)
 
-	if doc.docstatus != 1:
+	if frappe.db.get_value("Reserve Stock", name, "docstatus") != 1:
 		frappe.throw(_("Unreserve is allowed only for submitted Reserve Stock documents."))
 
-	has_reserved_rows = False
-	for row in getattr(doc, "items", []) or []:
-		if cstr(row.get("status")).strip() != "Unreserved":
-			has_reserved_rows = True
-			frappe.db.set_value("Stock Reservation Items", row.name, "status", "Unreserved")
+	filters = frappe._dict(
+		item_code=item_code,
+		warehouse=warehouse,
+		batch_no=batch_no,
+		from_serial_no=from_serial_no,
+		to_serial_no=to_serial_no,
+	)
+	rows = get_rows_to_unreserve(name, filters)
+	if not rows:
+		return {"status": "Unreserved", "count": 0}
+
+	if len(rows) > UNRESERVE_BACKGROUND_THRESHOLD:
+		frappe.enqueue(
+			"asteria.asteria.doctype.reserve_stock.reserve_stock.unreserve_in_background",
+			queue="long",
+			timeout=3600,
+			job_id=f"unreserve::{name}",
+			deduplicate=True,
+			name=name,
+			filters=filters,
+			user=frappe.session.user,
+		)
+		return {"status": "Queued", "count": len(rows)}
+
+	unreserve_rows(rows)
+	return {"status": "Unreserved", "count": len(rows)}
+
+
+def get_rows_to_unreserve(name, filters=None):
+	"""Return still-reserved child rows of a Reserve Stock matching the filters."""
+	filters = frappe._dict(filters or {})
+	conditions = [
+		"parent = %(name)s",
+		"parenttype = 'Reserve Stock'",
+		"IFNULL(status, '') != 'Unreserved'",
+	]
+	values = {"name": name}
+
+	for fieldname in ("item_code", "warehouse", "batch_no"):
+		if cstr(filters.get(fieldname)).strip():
+			conditions.append(f"{fieldname} = %({fieldname})s")
+			values[fieldname] = cstr(filters.get(fieldname)).strip()
+
+	serial_range = parse_serial_range(filters.get("from_serial_no"), filters.get("to_serial_no"))
+	if serial_range:
+		conditions.append("serial_no LIKE %(serial_prefix)s")
+		values["serial_prefix"] = (
+			serial_range.prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+		)
+
+	rows = frappe.db.sql(
+		f"""
+		SELECT name, serial_no, batch_no, warehouse
+		FROM `tabStock Reservation Items`
+		WHERE {" AND ".join(conditions)}
+		ORDER BY idx
+		""",
+		values,
+		as_dict=True,
+	)
+
+	if serial_range:
+		rows = [row for row in rows if in_serial_range(row.serial_no, serial_range)]
+
+	return rows
+
+
+SERIAL_NUMBER_PATTERN = re.compile(r"^(.*?)(\d+)$")
+
+
+def parse_serial_range(from_serial_no=None, to_serial_no=None):
+	"""Return frappe._dict(prefix, start, end) for a prefix + trailing number range, or None."""
+	bounds = {}
+	for bound, serial_no in (("start", from_serial_no), ("end", to_serial_no)):
+		serial_no = cstr(serial_no).strip()
+		if not serial_no:
+			continue
+
+		match = SERIAL_NUMBER_PATTERN.match(serial_no)
+		if not match:
+			frappe.throw(_("Serial No {0} must end with a number to be used in a range.").format(serial_no))
+
+		bounds[bound] = (match.group(1), cint(match.group(2)))
 
-	if not has_reserved_rows:
-		return {"status": "Unreserved"}
+	if not bounds:
+		return None
 
-	return {"status": "Unreserved"}
+	prefixes = {prefix for prefix, number in bounds.values()}
+	if len(prefixes) > 1:
+		frappe.throw(_("From and To Serial No must have the same prefix."))
+
+	return frappe._dict(
+		prefix=prefixes.pop(),
+		start=bounds["start"][1] if "start" in bounds else None,
+		end=bounds["end"][1] if "end" in bounds else None,
+	)
+
+
+def in_serial_range(serial_no, serial_range):
+	match = SERIAL_NUMBER_PATTERN.match(cstr(serial_no).strip())
+	if not match or match.group(1) != serial_range.prefix:
+		return False
+
+	number = cint(match.group(2))
+	return (serial_range.start is None or number >= serial_range.start) and (
+		serial_range.end is None or number <= serial_range.end
+	)
+
+
+def unreserve_rows(rows):
+	"""Set status Unreserved on the given child rows with a single UPDATE.
+
+	The reservation snapshot is cleared and the Redis index entries of the
+	affected keys are refreshed when this transaction commits.
+	"""
+	if not rows:
+		return
+
+	frappe.db.sql(
+		"""
+		UPDATE `tabStock Reservation Items`
+		SET status = 'Unreserved', modified = %(modified)s, modified_by = %(modified_by)s
+		WHERE name IN %(names)s
+		""",
+		{
+			"names": tuple(row.name for row in rows),
+			"modified": now(),
+			"modified_by": frappe.session.user,
+		},
+	)
+
+	clear_reservation_snapshot()
+	schedule_key_refresh(
+		batch_keys={(row.batch_no, row.warehouse) for row in rows if row.batch_no and row.warehouse},
+		serial_nos={row.serial_no for row in rows if row.serial_no},
+	)
+
+
+def unreserve_in_background(name, filters, user):
+	"""Background job: unreserve matching rows chunk by chunk, publishing progress."""
+	rows = get_rows_to_unreserve(name, filters)
+	total = len(rows)
+
+	for start in range(0, total, UNRESERVE_CHUNK_SIZE):
+		unreserve_rows(rows[start : start + UNRESERVE_CHUNK_SIZE])
+		frappe.db.commit()
+		frappe.publish_progress(
+			min(start + UNRESERVE_CHUNK_SIZE, total) * 100 / total,
+			title=_("Unreserving Stock"),
+			doctype="Reserve Stock",
+			docname=name,
+			description=_("{0} of {1} rows unreserved").format(min(start + UNRESERVE_CHUNK_SIZE, total), total),
+		)
+
+	frappe.publish_realtime(
+		"msgprint",
+		_("Reserve Stock {0}: {1} rows unreserved.").format(name, total),
+		user=user,
+		doctype="Reserve Stock",
+		docname=name,
+	)
+
+
+EXPIRY_CHUNK_SIZE = 1000
+
+
+def expire_stale_reservations():
+	"""Scheduled job: release Reserved rows that are past their horizon.
+
+	A row expires when its Reserve Stock is past `valid_till`, or has no
+	`valid_till` and was created more than Stock Settings'
+	`reservation_expiry_days` ago, or is linked to a Sales Order that is closed,
+	completed or cancelled. Rows are released in bounded chunks, one UPDATE and
+	one commit per chunk, and every affected Reserve Stock gets a comment.
+	"""
+	expiry_days = cint(frappe.db.get_single_value("Stock Settings", "reservation_expiry_days"))
+	cutoff = add_days(nowdate(), -expiry_days) if expiry_days > 0 else None
+
+	while True:
+		rows = get_expired_reservation_rows(cutoff, limit=EXPIRY_CHUNK_SIZE)
+		if not rows:
+			break
+
+		unreserve_rows(rows)
+
+		rows_by_parent = {}
+		for row in rows:
+			rows_by_parent.setdefault(row.parent, []).append(row)
+
+		for reserve_stock, parent_rows in rows_by_parent.items():
+			frappe.get_doc(
+				{
+					"doctype": "Comment",
+					"comment_type": "Info",
+					"reference_doctype": "Reserve Stock",
+					"reference_name": reserve_stock,
+					"content": _("{0} row(s) released automatically: {1}.").format(
+						len(parent_rows), parent_rows[0].reason
+					),
+				}
+			).insert(ignore_permissions=True)
+
+		frappe.db.commit()
+
+		if len(rows) < EXPIRY_CHUNK_SIZE:
+			break
+
+
+def get_expired_reservation_rows(cutoff=None, limit=EXPIRY_CHUNK_SIZE):
+	"""Return up to `limit` Reserved rows that should be released, with the reason."""
+	expiry_conditions = [
+		"(rs.valid_till IS NOT NULL AND rs.valid_till < %(today)s)",
+		"(so.docstatus = 2 OR so.status IN ('Closed', 'Completed'))",
+	]
+	if cutoff:
+		expiry_conditions.append("(rs.valid_till IS NULL AND rs.creation < %(cutoff)s)")
+
+	return frappe.db.sql(
+		f"""
+		SELECT
+			sri.name, sri.parent, sri.serial_no, sri.batch_no, sri.warehouse,
+			CASE
+				WHEN so.docstatus = 2 OR so.status IN ('Closed', 'Completed')
+					THEN CONCAT('Sales Order ', so.name, ' is ', IF(so.docstatus = 2, 'Cancelled', so.status))
+				ELSE 'reservation expired'
+			END AS reason
+		FROM `tabStock Reservation Items` AS sri
+		INNER JOIN `tabReserve Stock` AS rs ON rs.name = sri.parent
+		LEFT JOIN `tabSales Order` AS so ON so.name = rs.sales_order
+		WHERE
+			sri.parenttype = 'Reserve Stock'
+			AND sri.status = 'Reserved'
+			AND rs.docstatus = 1
+			AND ({" OR ".join(expiry_conditions)})
+		ORDER BY sri.parent, sri.idx
+		LIMIT %(limit)s
+		""",
+		{"today": nowdate(), "cutoff": cutoff, "limit": limit},
+		as_dict=True,
+	)
@@ -0,0 +1,371 @@
+# Copyright (c) 2026, Viral and contributors
+# For license information, please see license.txt
+
+"""Bulk import of Stock Reservation Items into a draft Reserve Stock.
+
+Rows are streamed from a CSV or XLSX attachment and validated in chunks with
+bulk lookups (item flags, serial status, batch balances and reservations), so
+the cost grows with the number of chunks rather than the number of rows. Rows
+that fail validation are reported with their file row number and skipped,
+including rows already present in the target draft, so re-importing a file
+does not double its reservations. Accepted rows of each chunk are written with
+a single bulk insert. Final
+availability is still enforced under lock when the Reserve Stock is submitted.
+
+Expected columns (header names are case-insensitive, spaces allowed):
+Item Code, Serial No, Batch No, Warehouse, Qty
+"""
+
+import csv
+import time
+from io import BytesIO, StringIO
+
+import frappe
+from frappe import _
+from frappe.utils import cint, cstr, flt, now
+
+from asteria.asteria.doctype.reserve_stock.reserve_stock import (
+	get_batch_qty_bulk,
+	get_reserved_batch_details,
+	get_reserved_stock_references,
+)
+
+IMPORT_CHUNK_SIZE = 500
+BACKGROUND_FILE_SIZE = 256 * 1024
+IMPORT_FIELDS = ("item_code", "serial_no", "batch_no", "warehouse", "qty")
+
+
+@frappe.whitelist()
+def import_reserve_stock(file_url, reserve_stock=None):
+	"""Import rows from an attached CSV/XLSX into a draft Reserve Stock.
+
+	A new draft is created when `reserve_stock` is not given. Large files are
+	processed in a background job which publishes progress and the final summary.
+	"""
+	frappe.has_permission("Reserve Stock", "create" if not reserve_stock else "write", reserve_stock, throw=True)
+
+	file_doc = frappe.get_doc("File", {"file_url": file_url})
+	file_doc.check_permission("read")
+	if cint(file_doc.file_size) > BACKGROUND_FILE_SIZE:
+		frappe.enqueue(
+			"asteria.asteria.doctype.reserve_stock.reserve_stock_import.import_in_background",
+			queue="long",
+			timeout=7200,
+			file_url=file_url,
+			reserve_stock=reserve_stock,
+			user=frappe.session.user,
+		)
+		return {"status": "Queued"}
+
+	return run_reserve_stock_import(file_url, reserve_stock)
+
+
+def import_in_background(file_url, reserve_stock, user):
+	summary = run_reserve_stock_import(file_url, reserve_stock, publish_progress=True)
+	frappe.publish_realtime("reserve_stock_import_complete", summary, user=user)
+
+
+def run_reserve_stock_import(file_url, reserve_stock=None, publish_progress=False):
+	"""Stream, validate and insert the rows of `file_url`; return an import summary."""
+	started = time.monotonic()
+	doc = get_target_reserve_stock(reserve_stock)
+	context = frappe._dict(
+		items={},
+		batch_available={},
+		batch_requested={},
+		serials_seen=set(),
+		existing_rows=set(),
+		next_idx=cint(
+			frappe.db.sql(
+				"SELECT MAX(idx) FROM `tabStock Reservation Items` WHERE parent = %s", doc.name
+			)[0][0]
+		)
+		+ 1,
+	)
+	load_existing_rows(context, doc.name)
+
+	total = accepted = 0
+	errors = []
+	for chunk in iter_chunks(iter_import_rows(file_url), IMPORT_CHUNK_SIZE):
+		accepted_rows, chunk_errors = validate_chunk(chunk, context)
+		insert_rows(doc, accepted_rows, context)
+
+		total += len(chunk)
+		accepted += len(accepted_rows)
+		errors.extend(chunk_errors)
+
+		if publish_progress:
+			frappe.db.commit()
+			frappe.publish_realtime(
+				"reserve_stock_import_progress",
+				{"reserve_stock": doc.name, "processed": total, "accepted": accepted},
+				user=frappe.session.user,
+			)
+
+	frappe.db.set_value("Reserve Stock", doc.name, "modified", now())
+
+	seconds = time.monotonic() - started
+	return {
+		"reserve_stock": doc.name,
+		"total_rows": total,
+		"accepted_rows": accepted,
+		"rejected_rows": len(errors),
+		"errors": errors,
+		"seconds": round(seconds, 3),
+		"rows_per_second": round(total / seconds, 1) if seconds else total,
+	}
+
+
+def get_target_reserve_stock(reserve_stock=None):
+	if not reserve_stock:
+		doc = frappe.new_doc("Reserve Stock")
+		doc.insert()
+		return doc
+
+	doc = frappe.get_doc("Reserve Stock", reserve_stock)
+	if doc.docstatus != 0:
+		frappe.throw(_("Rows can only be imported into a draft Reserve Stock."))
+
+	return doc
+
+
+def load_existing_rows(context, reserve_stock):
+	"""Record the rows already in the draft: their keys, and their batch qty as requested."""
+	for row in frappe.get_all(
+		"Stock Reservation Items",
+		filters={"parent": reserve_stock, "parenttype": "Reserve Stock"},
+		fields=["item_code", "serial_no", "batch_no", "warehouse", "qty"],
+	):
+		context.existing_rows.add(get_row_key(row))
+		if row.batch_no:
+			key = (row.batch_no, row.warehouse)
+			context.batch_requested[key] = context.batch_requested.get(key, 0) + flt(row.qty)
+
+
+def get_row_key(row):
+	return tuple(cstr(row.get(field)).strip() for field in ("item_code", "serial_no", "batch_no", "warehouse"))
+
+
+def iter_import_rows(file_url):
+	"""Yield (row_no, row dict) from a CSV or XLSX file without building a full table."""
+	file_doc = frappe.get_doc("File", {"file_url": file_url})
+	content = file_doc.get_content()
+	extension = cstr(file_doc.file_name or file_url).rsplit(".", 1)[-1].lower()
+
+	if extension == "xlsx":
+		from openpyxl import load_workbook
+
+		workbook = load_workbook(BytesIO(content), read_only=True, data_only=True)
+		rows = workbook.active.iter_rows(values_only=True)
+	elif extension == "csv":
+		if isinstance(content, bytes):
+			content = content.decode("utf-8-sig")
+		rows = csv.reader(StringIO(content))
+	else:
+		frappe.throw(_("Only CSV and XLSX files can be imported."))
+
+	header = None
+	for row_no, row in enumerate(rows, start=1):
+		if header is None:
+			header = [cstr(value).strip().lower().replace(" ", "_") for value in row]
+			missing = {"item_code", "warehouse"} - set(header)
+			if missing:
+				frappe.throw(_("Missing column(s): {0}").format(", ".join(sorted(missing))))
+			continue
+
+		if not any(cstr(value).strip() for value in row):
+			continue
+
+		values = dict(zip(header, row))
+		yield row_no, frappe._dict({field: cstr(values.get(field)).strip() for field in IMPORT_FIELDS})
+
+
+def iter_chunks(rows, size):
+	chunk = []
+	for row in rows:
+		chunk.append(row)
+		if len(chunk) >= size:
+			yield chunk
+			chunk = []
+
+	if chunk:
+		yield chunk
+
+
+def validate_chunk(chunk, context):
+	"""Validate one chunk with bulk lookups; return (accepted rows, errors)."""
+	load_item_details(context, {row.item_code for _row_no, row in chunk if row.item_code})
+
+	serial_nos = {row.serial_no for _row_no, row in chunk if row.serial_no}
+	serial_details = {}
+	reserved_serials = {}
+	if serial_nos:
+		serial_details = {
+			d.name: d
+			for d in frappe.get_all(
+				"Serial No",
+				filters={"name": ("in", list(serial_nos))},
+				fields=["name", "item_code", "warehouse", "batch_no", "status"],
+			)
+		}
+		reserved_serials = get_reserved_stock_references(serial_nos=list(serial_nos)).get("serial_no", {})
+
+	load_batch_availability(
+		context, {(row.batch_no, row.warehouse) for _row_no, row in chunk if row.batch_no and row.warehouse}
+	)
+
+	accepted = []
+	errors = []
+	for row_no, row in chunk:
+		error = validate_row(row, context, serial_details, reserved_serials)
+		if error:
+			errors.append({"row": row_no, "error": error})
+			continue
+
+		if row.serial_no:
+			context.serials_seen.add(row.serial_no)
+		if row.batch_no:
+			key = (row.batch_no, row.warehouse)
+			context.batch_requested[key] = context.batch_requested.get(key, 0) + flt(row.qty)
+
+		accepted.append(row)
+
+	return accepted, errors
+
+
+def validate_row(row, context, serial_details, reserved_serials):
+	"""Return an error message for the row, or None; normalises qty in place."""
+	if not row.item_code or not row.warehouse:
+		return _("Item Code and Warehouse are mandatory.")
+
+	if get_row_key(row) in context.existing_rows:
+		return _("Row is already in this Reserve Stock.")
+
+	item = context.items.get(row.item_code)
+	if not item:
+		return _("Item {0} does not exist.").format(row.item_code)
+
+	if item.has_serial_no and not row.serial_no:
+		return _("Serial No is mandatory for item {0}.").format(row.item_code)
+
+	if item.has_batch_no and not item.has_serial_no and not row.batch_no:
+		return _("Batch No is mandatory for item {0}.").format(row.item_code)
+
+	if row.serial_no:
+		serial = serial_details.get(row.serial_no)
+		if not serial or serial.item_code != row.item_code:
+			return _("Serial No {0} does not belong to item {1}.").format(row.serial_no, row.item_code)
+		if serial.status != "Active" or serial.warehouse != row.warehouse:
+			return _("Serial No {0} is not available in warehouse {1}.").format(row.serial_no, row.warehouse)
+		if row.serial_no in reserved_serials:
+			return _("Serial No {0} is already reserved in {1}.").format(
+				row.serial_no, reserved_serials[row.serial_no]
+			)
+		if row.serial_no in context.serials_seen:
+			return _("Serial No {0} is repeated in the file.").format(row.serial_no)
+
+		row.qty = 1
+	else:
+		row.qty = flt(row.qty)
+		if row.qty <= 0:
+			return _("Qty must be greater than 0.")
+
+	if row.batch_no:
+		key = (row.batch_no, row.warehouse)
+		available = context.batch_available.get(key, 0) - context.batch_requested.get(key, 0)
+		if row.qty > available:
+			return _("Only {0} qty of batch {1} is available to reserve in warehouse {2}.").format(
+				flt(available), row.batch_no, row.warehouse
+			)
+
+
+def load_item_details(context, item_codes):
+	missing = [item_code for item_code in item_codes if item_code not in context.items]
+	if not missing:
+		return
+
+	for item in frappe.get_all(
+		"Item",
+		filters={"name": ("in", missing)},
+		fields=["name", "item_name", "has_serial_no", "has_batch_no"],
+	):
+		context.items[item.name] = item
+
+
+def load_batch_availability(context, keys):
+	"""Cache current minus already-reserved qty for new (batch_no, warehouse) keys."""
+	missing = [key for key in keys if key not in context.batch_available]
+	if not missing:
+		return
+
+	current_qty_by_key = get_batch_qty_bulk(missing)
+	reserved = get_reserved_batch_details(
+		batch_nos=[key[0] for key in missing],
+		warehouses=[key[1] for key in missing],
+	)
+	for key in missing:
+		context.batch_available[key] = flt(current_qty_by_key.get(key)) - flt(
+			reserved.get(key, {}).get("reserved_qty")
+		)
+
+
+def insert_rows(doc, rows, context):
+	"""Bulk insert accepted rows as Stock Reservation Items of `doc`."""
+	if not rows:
+		return
+
+	timestamp = now()
+	user = frappe.session.user
+	values = []
+	for row in rows:
+		item = context.items[row.item_code]
+		values.append(
+			(
+				frappe.generate_hash(length=10),
+				timestamp,
+				timestamp,
+				user,
+				user,
+				0,
+				context.next_idx,
+				doc.name,
+				"Reserve Stock",
+				"items",
+				row.item_code,
+				item.item_name,
+				row.serial_no or None,
+				row.batch_no or None,
+				cint(item.has_serial_no),
+				cint(item.has_batch_no),
+				flt(row.qty),
+				row.warehouse,
+				"Reserved",
+			)
+		)
+		context.next_idx += 1
+
+	frappe.db.bulk_insert(
+		"Stock Reservation Items",
+		fields=[
+			"name",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"docstatus",
+			"idx",
+			"parent",
+			"parenttype",
+			"parentfield",
+			"item_code",
+			"item_name",
+			"serial_no",
+			"batch_no",
+			"has_serial_no",
+			"has_batch_no",
+			"qty",
+			"warehouse",
+			"status",
+		],
+		values=values,
+	)
@@ -1,9 +1,16 @@
 # Copyright (c) 2026, Viral and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 
 class StockReservationItems(Document):
 	pass
+
+
+def on_doctype_update():
+	# Reservation lookups always filter on status = 'Reserved'; leading with status
+	# keeps them on the live rows only, however many released rows pile up.
+	frappe.db.add_index("Stock Reservation Items", ["status", "batch_no", "warehouse"])
+	frappe.db.add_index("Stock Reservation Items", ["status", "serial_no"])
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Viral and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Work Order Serial Trail", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,103 @@
+# Copyright (c) 2026, Viral and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cint, now
+
+TRAIL_PAGE_LENGTH = 100
+
+
+class WorkOrderSerialTrail(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Work Order Serial Trail", ["work_order", "creation"])
+
+
+def append_serial_trail(stock_entry):
+	"""Append the serial movements of a submitted Stock Entry to its Work Order's trail.
+
+	One row per Serial and Batch Entry, named after it, so re-running is a no-op.
+	Rows keep the bundle's creation time, which is the order the trail is read in.
+	"""
+	if not stock_entry.get("work_order"):
+		return
+
+	_insert_trail_rows("sbb.voucher_no = %(stock_entry)s", {"stock_entry": stock_entry.name})
+
+
+def remove_serial_trail(stock_entry):
+	frappe.db.delete("Work Order Serial Trail", {"stock_entry": stock_entry.name})
+
+
+def rebuild_serial_trail():
+	"""Backfill the trail from every submitted Stock Entry linked to a Work Order."""
+	frappe.db.delete("Work Order Serial Trail")
+	_insert_trail_rows("se.docstatus = 1 AND IFNULL(se.work_order, '') != ''", {})
+
+
+def get_serial_trail_rows(work_order, start=0, page_length=TRAIL_PAGE_LENGTH):
+	"""Trail rows of a Work Order in movement order, with the Stock Entry Detail flags."""
+	return frappe.db.sql(
+		"""
+		SELECT
+			trail.serial_no,
+			trail.type_of_transaction,
+			trail.warehouse,
+			trail.item_code,
+			trail.stock_entry,
+			sed.has_serial_no_replaced,
+			se.from_bom
+		FROM `tabWork Order Serial Trail` AS trail
+		LEFT JOIN `tabStock Entry Detail` AS sed ON sed.name = trail.voucher_detail_no
+		LEFT JOIN `tabStock Entry` AS se ON se.name = sed.parent
+		WHERE trail.work_order = %(work_order)s
+		ORDER BY trail.creation, trail.idx
+		LIMIT %(page_length)s OFFSET %(start)s
+		""",
+		{"work_order": work_order, "start": cint(start), "page_length": cint(page_length)},
+		as_dict=True,
+	)
+
+
+def get_serial_trail_count(work_order):
+	return frappe.db.count("Work Order Serial Trail", {"work_order": work_order})
+
+
+@frappe.whitelist()
+def get_serial_trail(work_order, start=0, page_length=TRAIL_PAGE_LENGTH):
+	"""Paginated serial movement trail of a Work Order."""
+	frappe.has_permission("Work Order", "read", work_order, throw=True)
+
+	page_length = min(cint(page_length) or TRAIL_PAGE_LENGTH, 1000)
+	return {
+		"total": get_serial_trail_count(work_order),
+		"rows": get_serial_trail_rows(work_order, start, page_length),
+	}
+
+
+def _insert_trail_rows(condition, values):
+	timestamp = now()
+	frappe.db.sql(
+		f"""
+		INSERT IGNORE INTO `tabWork Order Serial Trail`
+			(name, creation, modified, owner, modified_by, docstatus, idx,
+			work_order, stock_entry, voucher_detail_no, serial_and_batch_bundle,
+			item_code, serial_no, type_of_transaction, warehouse)
+		SELECT
+			sbe.name, sbb.creation, %(timestamp)s, %(user)s, %(user)s, 0, sbe.idx,
+			se.work_order, se.name, sbb.voucher_detail_no, sbb.name,
+			sbb.item_code, sbe.serial_no, sbb.type_of_transaction, sbb.warehouse
+		FROM `tabSerial and Batch Bundle` AS sbb
+		INNER JOIN `tabSerial and Batch Entry` AS sbe ON sbe.parent = sbb.name
+		INNER JOIN `tabStock Entry` AS se ON se.name = sbb.voucher_no
+		WHERE
+			sbb.voucher_type = 'Stock Entry'
+			AND sbb.docstatus < 2
+			AND IFNULL(sbe.serial_no, '') != ''
+			AND {condition}
+		""",
+		{**values, "timestamp": timestamp, "user": frappe.session.user},
+	)
@@ -3,6 +3,20 @@ from erpnext.manufacturing.doctype.production_plan.production_plan import Produc
 from frappe.utils import flt, getdate, nowdate
 
 class CustomProductionPlan(ProductionPlan):
+	@frappe.whitelist()
+	def make_work_order(self):
+		"""Create the plan's Work Orders without per-document counter updates, then
+		roll the plan row counters up from the created Work Orders in one pass."""
+		from asteria.asteria.doc_events.work_order import reconcile_production_plan_quantities
+
+		frappe.flags.in_bulk_work_order_creation = True
+		try:
+			super().make_work_order()
+		finally:
+			frappe.flags.in_bulk_work_order_creation = False
+
+		reconcile_production_plan_quantities(self.name)
+
 	def make_subcontracted_purchase_order(self, subcontracted_po, purchase_orders):
 		if not subcontracted_po:
 			return
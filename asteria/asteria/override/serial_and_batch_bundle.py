@@ -1,17 +1,27 @@
+from functools import lru_cache
+
 import frappe
 from erpnext.stock.doctype.serial_and_batch_bundle.serial_and_batch_bundle import (
 	get_auto_batch_nos,
 	get_reserved_serial_nos,
 	get_serial_nos_based_on_posting_date,
 	get_non_expired_batches,
+	get_qty_based_available_batches,
 	get_serial_nos_based_on_filters
 )
-from frappe.utils import parse_json, cint, cstr, flt, get_link_to_form
+from frappe.utils import parse_json, cint, cstr, flt, get_datetime, get_link_to_form, nowtime
 from frappe import _
 from asteria.asteria.doctype.reserve_stock.reserve_stock import (
-	get_batch_qty_in_warehouse,
-	get_reserved_batch_details,
-	get_reserved_stock_references,
+	get_cached_batch_qty,
+	get_cached_reserved_batches,
+	get_cached_reserved_serials,
+)
+from asteria.asteria.wip_pool import (
+	get_material_transfer_entries,
+	get_pool_serial_nos,
+	get_transferred_serials,
+	get_wip_batch_availability,
+	get_wip_pool,
 )
 
 
@@ -22,185 +32,399 @@ def get_auto_data(**kwargs):
 		return get_available_serial_nos(kwargs)
 
 	elif cint(kwargs.has_batch_no):
+		batches = get_available_batches_for_manufacture(kwargs)
+		if batches is not None:
+			return batches
+
 		return get_auto_batch_nos(kwargs)
 
 
+@frappe.whitelist()
+def allocate_serial_batch_for_document(doc, based_on="FIFO"):
+	"""Pick serials and batches for every raw-material row of a Stock Entry at once.
+
+	Candidates are fetched once per (item_code, warehouse) through get_auto_data
+	and handed out in order across the rows, so no serial or batch qty is given
+	to two rows. Returns [{idx, item_code, serial_nos: [...], batches: [{batch_no,
+	qty, warehouse}], shortfall, message}] for the rows that got an assignment or
+	could not be covered; `message` explains a non-zero shortfall.
+	"""
+	if isinstance(doc, str):
+		doc = frappe._dict(parse_json(doc))
+
+	rows = [
+		frappe._dict(row.as_dict() if hasattr(row, "as_dict") else row)
+		for row in doc.get("items") or []
+		if not row.get("is_finished_item") and not row.get("is_scrap_item") and row.get("item_code")
+	]
+	item_flags = {
+		item.name: item
+		for item in frappe.get_all(
+			"Item",
+			filters={"name": ("in", list({row.item_code for row in rows}))},
+			fields=["name", "has_serial_no", "has_batch_no"],
+		)
+	}
+
+	groups = {}
+	for row in rows:
+		flags = item_flags.get(row.item_code)
+		if flags and (flags.has_serial_no or flags.has_batch_no):
+			groups.setdefault((row.item_code, row.get("s_warehouse")), []).append(row)
+
+	allocation = []
+	for (item_code, warehouse), group_rows in groups.items():
+		flags = item_flags[item_code]
+		candidates = get_auto_data(
+			doc=doc,
+			item_code=item_code,
+			warehouse=warehouse,
+			has_serial_no=flags.has_serial_no,
+			has_batch_no=flags.has_batch_no,
+			qty=sum(flt(row.get("transfer_qty") or row.get("qty")) for row in group_rows),
+			based_on=based_on,
+			posting_date=doc.get("posting_date"),
+			posting_time=doc.get("posting_time"),
+		) or []
+
+		if flags.has_serial_no:
+			allocation.extend(allocate_serial_nos(group_rows, candidates))
+		else:
+			allocation.extend(allocate_batches(group_rows, candidates))
+
+	return allocation
+
+
+def allocate_serial_nos(rows, candidates):
+	serial_nos = [row.get("serial_no") for row in candidates if row.get("serial_no")]
+
+	allocation = []
+	start = 0
+	for row in rows:
+		qty = cint(flt(row.get("transfer_qty") or row.get("qty")))
+		if not qty:
+			continue
+
+		assigned = serial_nos[start : start + qty]
+		start += len(assigned)
+
+		shortfall = qty - len(assigned)
+		message = None
+		if shortfall:
+			message = _("Row #{0}: Only {1} Serial Nos are available for Item {2}, {3} more are required.").format(
+				row.idx, len(assigned), row.item_code, shortfall
+			)
+
+		allocation.append(
+			{
+				"idx": row.idx,
+				"item_code": row.item_code,
+				"serial_nos": assigned,
+				"batches": [],
+				"shortfall": shortfall,
+				"message": message,
+			}
+		)
+
+	return allocation
+
+
+def allocate_batches(rows, candidates):
+	"""Fill the rows in order from the candidate batches, which arrive in picking order."""
+	available = [
+		frappe._dict(batch_no=row.get("batch_no"), qty=flt(row.get("qty")), warehouse=row.get("warehouse"))
+		for row in candidates
+		if row.get("batch_no") and flt(row.get("qty")) > 0
+	]
+
+	allocation = []
+	position = 0
+	for row in rows:
+		required = flt(row.get("transfer_qty") or row.get("qty"))
+		if required <= 0:
+			continue
+
+		batches = []
+		while required > 0 and position < len(available):
+			batch = available[position]
+			qty = min(required, batch.qty)
+			batches.append({"batch_no": batch.batch_no, "qty": qty, "warehouse": batch.warehouse})
+			batch.qty -= qty
+			required -= qty
+			if batch.qty <= 0:
+				position += 1
+
+		message = None
+		if required > 0:
+			message = _("Row #{0}: Only {1} qty is available in batches of Item {2}, {3} more is required.").format(
+				row.idx, sum(batch["qty"] for batch in batches), row.item_code, required
+			)
+
+		allocation.append(
+			{
+				"idx": row.idx,
+				"item_code": row.item_code,
+				"serial_nos": [],
+				"batches": batches,
+				"shortfall": max(required, 0),
+				"message": message,
+			}
+		)
+
+	return allocation
+
+
+def apply_serial_batch_allocation(doc, allocation):
+	"""Set an allocate_serial_batch_for_document result on the Stock Entry rows.
+
+	A row filled from several batches keeps the first one and a copy of the row
+	is appended for each further batch, with that batch's qty. Returns the
+	shortfall messages of rows the allocation could not cover.
+	"""
+	rows_by_idx = {row.idx: row for row in doc.items}
+	messages = [assignment["message"] for assignment in allocation if assignment.get("message")]
+	for assignment in allocation:
+		row = rows_by_idx.get(assignment["idx"])
+		if not row or row.get("serial_and_batch_bundle"):
+			continue
+
+		if not assignment["serial_nos"] and not assignment["batches"]:
+			continue
+
+		row.use_serial_batch_fields = 1
+		if assignment["serial_nos"]:
+			row.serial_no = "\n".join(assignment["serial_nos"])
+			continue
+
+		conversion_factor = flt(row.conversion_factor) or 1
+		for position, batch in enumerate(assignment["batches"]):
+			target = row
+			if position:
+				target = doc.append("items", {key: value for key, value in row.as_dict().items() if key not in ("name", "idx")})
+
+			target.batch_no = batch["batch_no"]
+			target.transfer_qty = flt(batch["qty"])
+			target.qty = flt(batch["qty"]) / conversion_factor
+
+	return messages
+
+
+def get_manufacture_work_order(kwargs):
+	"""Return (True, work_order) when the request comes from a Manufacture Stock Entry."""
+	if not kwargs.get("doc"):
+		return False, None
+
+	try:
+		doc = frappe._dict(parse_json(kwargs.doc))
+	except Exception:
+		doc = kwargs.doc
+
+	# Handle both dict and document object
+	doctype = doc.get("doctype") if hasattr(doc, "get") else getattr(doc, "doctype", None)
+	stock_entry_type = doc.get("stock_entry_type") if hasattr(doc, "get") else getattr(doc, "stock_entry_type", None)
+	work_order = doc.get("work_order") if hasattr(doc, "get") else getattr(doc, "work_order", None)
+
+	return doctype == "Stock Entry" and stock_entry_type == "Manufacture", work_order
+
+
 def get_available_batches_for_manufacture(kwargs):
 	"""Fetch batch numbers from the same work order cycle (Material Transfer for Manufacture).
 	If batch B1 was transferred for manufacturing, B1 will be auto-selected.
-	Only batches that currently have stock in the WIP warehouse are returned."""
-	
-	# Check if batch validation is enabled in Stock Settings
-	# if not frappe.db.get_single_value("Stock Settings", "enable_batch_validation_for_manufacture", 0):
-	# 	return get_auto_batch_nos(kwargs)
-	
-	if kwargs.get("doc"):
-		try:
-			doc = frappe._dict(parse_json(kwargs.doc))
-		except Exception:
-			doc = kwargs.doc
-
-		# Handle both dict and document object
-		doctype = doc.get("doctype") if hasattr(doc, "get") else getattr(doc, "doctype", None)
-		stock_entry_type = doc.get("stock_entry_type") if hasattr(doc, "get") else getattr(doc, "stock_entry_type", None)
-		work_order = doc.get("work_order") if hasattr(doc, "get") else getattr(doc, "work_order", None)
-
-		if doctype == "Stock Entry" and stock_entry_type == "Manufacture" and work_order:
-			# Get WIP warehouse from Work Order
-			wip_warehouse = frappe.db.get_value("Work Order", work_order, "wip_warehouse")
-			if not wip_warehouse:
-				return get_auto_batch_nos(kwargs)
-
-			material_transfer_entries = frappe.get_all(
-				"Stock Entry",
-				{
-					"stock_entry_type": "Material Transfer for Manufacture",
-					"work_order": work_order,
-					"docstatus": 1,
-				},
-				pluck="name",
+	Only batches that currently have stock in the WIP warehouse are returned.
+
+	Returns None when the standard batch selection should be used instead."""
+	is_manufacture, work_order = get_manufacture_work_order(kwargs)
+	if not is_manufacture or not work_order or not kwargs.item_code:
+		return None
+
+	# Get WIP warehouse from Work Order
+	wip_warehouse = frappe.db.get_value("Work Order", work_order, "wip_warehouse")
+	if not wip_warehouse or not get_material_transfer_entries(work_order):
+		return None
+
+	# If MTfM entries exist, only return batches from those entries
+	# Don't fall back to standard selection - force user to pick from MTfM batches.
+	# Only batches with stock left in the WIP warehouse are kept, with their WIP qty.
+	batch_nos = [bd.get("batch_no") for bd in get_wip_pool(work_order, kwargs.item_code).batches]
+
+	batches = get_wip_batch_availability(
+		batch_nos, wip_warehouse, item_code=kwargs.item_code, based_on=kwargs.get("based_on")
+	)
+
+	# Trimmed to the requested qty in picking order, like get_auto_batch_nos
+	if flt(kwargs.get("qty")):
+		batches = get_qty_based_available_batches(batches, flt(kwargs.qty))
+
+	return batches
+
+
+SERIAL_PAGE_FIELDS = ("serial_no", "warehouse", "batch_no")
+SERIAL_PAGE_LENGTH = 500
+
+
+@frappe.whitelist()
+def get_serial_no_page(
+	item_code,
+	doc=None,
+	warehouse=None,
+	cursor=None,
+	page_length=SERIAL_PAGE_LENGTH,
+	count_only=0,
+	based_on="FIFO",
+	posting_date=None,
+	posting_time=None,
+	batches=None,
+	ignore_serial_nos=None,
+):
+	"""Return one page of selectable serials as compact rows.
+
+	Returns {"fields": [...], "rows": [[...], ...], "cursor": [...] | None}; pass the
+	returned cursor back to get the next page. With `count_only` only {"count": n}
+	is returned. Like get_available_serial_nos, Manufacture entries page through
+	the Work Order's WIP pool, newest movement first, and fall back to the other
+	entries' selection when it is empty: Active serials in `based_on` order, limited
+	like get_auto_data by posting date and batches. `ignore_serial_nos` (already
+	on the document) are left out of every page.
+	"""
+	kwargs = frappe._dict(
+		doc=doc,
+		item_code=item_code,
+		warehouse=warehouse,
+		based_on=based_on,
+		posting_date=posting_date,
+		posting_time=posting_time,
+		batches=parse_json(batches) if isinstance(batches, str) else batches,
+		ignore_serial_nos=parse_json(ignore_serial_nos) if isinstance(ignore_serial_nos, str) else ignore_serial_nos,
+	)
+	page_length = min(cint(page_length) or SERIAL_PAGE_LENGTH, 5000)
+	cursor = parse_json(cursor) if isinstance(cursor, str) else cursor
+
+	is_manufacture, work_order = get_manufacture_work_order(kwargs)
+	if is_manufacture and get_manufacture_serial_nos(work_order, kwargs, limit=1):
+		if cint(count_only):
+			return {"count": get_manufacture_serial_nos(work_order, kwargs, count_only=True)}
+
+		after = (get_datetime(cursor[0]), cursor[1]) if cursor else None
+		rows = get_manufacture_serial_nos(work_order, kwargs, limit=page_length, after=after)
+		next_cursor = [rows[-1].posting_datetime, rows[-1].serial_no] if len(rows) == page_length else None
+	else:
+		rows = get_active_serial_nos(kwargs, page_length, cursor, count_only=cint(count_only))
+		if cint(count_only):
+			return {"count": rows}
+
+		next_cursor = [rows[-1].sort_key, rows[-1].serial_no] if len(rows) == page_length else None
+
+	return {
+		"fields": SERIAL_PAGE_FIELDS,
+		"rows": [[row.get(field) for field in SERIAL_PAGE_FIELDS] for row in rows],
+		"cursor": next_cursor,
+	}
+
+
+SERIAL_PAGE_ORDER = {
+	# based_on: (sort key, direction), matching get_available_serial_nos
+	"FIFO": ("creation", "ASC"),
+	"LIFO": ("creation", "DESC"),
+	"Expiry": ("IFNULL(amc_expiry_date, '0001-01-01')", "ASC"),
+}
+
+
+def get_active_serial_nos(kwargs, page_length, cursor=None, count_only=0):
+	"""Keyset page of unreserved Active serials ordered by (sort key, name) for kwargs.based_on."""
+	conditions = ["item_code = %(item_code)s", "status = 'Active'"]
+	values = {"item_code": kwargs.item_code, "page_length": page_length}
+
+	if kwargs.warehouse:
+		conditions.append("warehouse = %(warehouse)s")
+		values["warehouse"] = kwargs.warehouse
+	else:
+		conditions.append("IFNULL(warehouse, '') != ''")
+
+	ignore_serial_nos = get_reserved_serial_nos(kwargs)
+	if kwargs.ignore_serial_nos:
+		ignore_serial_nos.extend(kwargs.ignore_serial_nos)
+
+	if kwargs.posting_date:
+		if kwargs.posting_time is None:
+			kwargs.posting_time = nowtime()
+
+		# serials in stock at the posting date, as get_available_serial_nos does for backdated entries
+		time_based_serial_nos = get_serial_nos_based_on_posting_date(kwargs, ignore_serial_nos)
+		if not time_based_serial_nos:
+			return 0 if count_only else []
+
+		conditions.append("name IN %(time_based_serial_nos)s")
+		values["time_based_serial_nos"] = tuple(time_based_serial_nos)
+	elif ignore_serial_nos:
+		conditions.append("name NOT IN %(ignore_serial_nos)s")
+		values["ignore_serial_nos"] = tuple(ignore_serial_nos)
+
+	if kwargs.batches:
+		batches = get_non_expired_batches(kwargs.batches)
+		if not batches:
+			return 0 if count_only else []
+
+		conditions.append("batch_no IN %(batches)s")
+		values["batches"] = tuple(batches)
+
+	if count_only:
+		return cint(
+			frappe.db.sql(f"SELECT COUNT(*) FROM `tabSerial No` WHERE {' AND '.join(conditions)}", values)[0][0]
+		)
+
+	sort_key, direction = SERIAL_PAGE_ORDER.get(kwargs.based_on) or SERIAL_PAGE_ORDER["FIFO"]
+	if cursor:
+		operator = "<" if direction == "DESC" else ">"
+		conditions.append(
+			f"({sort_key} {operator} %(after_key)s OR ({sort_key} = %(after_key)s AND name {operator} %(after_name)s))"
+		)
+		values["after_key"], values["after_name"] = cursor[0], cursor[1]
+
+	return frappe.db.sql(
+		f"""
+		SELECT name AS serial_no, warehouse, batch_no, {sort_key} AS sort_key
+		FROM `tabSerial No`
+		WHERE {" AND ".join(conditions)}
+		ORDER BY sort_key {direction}, name {direction}
+		LIMIT %(page_length)s
+		""",
+		values,
+		as_dict=True,
+	)
+
+
+def get_manufacture_serial_nos(work_order, kwargs, limit=None, after=None, count_only=False):
+	"""Serials a Manufacture entry draws from: the Work Order's WIP pool once it has
+	a transfer, else every transferred serial of the item."""
+	ignore = kwargs.get("ignore_serial_nos")
+	if work_order and get_material_transfer_entries(work_order):
+		if count_only:
+			return len(
+				get_pool_serial_nos(work_order, kwargs.item_code, warehouse=kwargs.get("warehouse"), ignore=ignore)
 			)
 
-			if material_transfer_entries:
-				entry_list = ", ".join([f'"{e}"' for e in material_transfer_entries])
-
-				conditions = f" AND sbb.voucher_no IN ({entry_list})"
-				sql_params = {}
-				if kwargs.item_code:
-					# Use parameterized query to prevent SQL injection
-					conditions += " AND sbb.item_code = %(item_code)s"
-					sql_params["item_code"] = kwargs.item_code
-
-				# Fetch batches from Serial and Batch Bundle entries
-				sql_query = f"""
-					SELECT
-						sbe.batch_no,
-						SUM(ABS(sbe.qty)) as qty,
-						sbe.warehouse
-					FROM `tabSerial and Batch Bundle` AS sbb
-					LEFT JOIN `tabSerial and Batch Entry` AS sbe ON sbe.parent = sbb.name
-					WHERE
-						sbb.docstatus = 1
-						AND sbe.batch_no IS NOT NULL
-						AND sbb.has_batch_no = 1
-						{conditions}
-					GROUP BY sbe.batch_no, sbe.warehouse
-				"""
-				
-				batch_data = frappe.db.sql(sql_query, sql_params, as_dict=1)
-
-				# Fallback: check Stock Entry Detail for batch_no (when use_serial_batch_fields is used)
-				if not batch_data and kwargs.item_code:
-					batch_data = frappe.db.sql(f"""
-						SELECT
-							sed.batch_no,
-							SUM(sed.qty) as qty,
-							sed.t_warehouse as warehouse
-						FROM `tabStock Entry Detail` AS sed
-						WHERE
-							sed.parent IN ({entry_list})
-							AND sed.item_code = %(item_code)s
-							AND sed.batch_no IS NOT NULL
-							AND sed.batch_no != ''
-						GROUP BY sed.batch_no, sed.t_warehouse
-					""", {"item_code": kwargs.item_code}, as_dict=1)
-
-				# If MTfM entries exist, only return batches from those entries
-				# Don't fall back to standard selection - force user to pick from MTfM batches
-				if batch_data:
-					# Filter: only keep batches that have actual stock in the WIP warehouse
-					filtered = []
-					for bd in batch_data:
-						batch_no = cstr(bd.get("batch_no")).strip()
-						if not batch_no:
-							continue
-						wip_qty = frappe.db.sql(
-							"""SELECT IFNULL(SUM(actual_qty), 0)
-							FROM `tabStock Ledger Entry`
-							WHERE batch_no = %s AND warehouse = %s AND is_cancelled = 0""",
-							(batch_no, wip_warehouse),
-						)
-						if wip_qty and flt(wip_qty[0][0]) > 0:
-							filtered.append(bd)
-
-					if filtered:
-						return filtered
-					# If MTfM entries exist but no valid batches found (all rejected), return empty list
-					return []
-				else:
-					# MTfM entries exist but no batches found for this item - return empty list
-					return []
-
-	# Fallback to standard batch selection (only if no MTfM entries exist)
+		return get_pool_serial_nos(
+			work_order, kwargs.item_code, warehouse=kwargs.get("warehouse"), qty=limit, after=after, ignore=ignore
+		)
+
+	return get_transferred_serials(
+		[],
+		kwargs.item_code,
+		warehouse=kwargs.get("warehouse"),
+		limit=limit,
+		after=after,
+		count_only=count_only,
+		ignore=ignore,
+	)
 
 
 def get_available_serial_nos(kwargs):
 	# start foss changes
-	if kwargs.get("doc"):
-		try:
-			doc = frappe._dict(parse_json(kwargs.doc))
-		except:
-			doc = kwargs.doc
-		if doc.get("doctype") == "Stock Entry" and doc.get("stock_entry_type") == "Manufacture":
-			material_transfer_entry = frappe.get_all("Stock Entry", { 
-				"stock_entry_type" : "Material Transfer for Manufacture",
-				"work_order" : doc.get("work_order"),
-				"docstatus" :  1,
-				}, pluck="name")
-
-			conditions = ''
-			if material_transfer_entry:
-				conditions = " and sbb.voucher_no in {} ".format(
-						"(" + ", ".join([f'"{l}"' for l in material_transfer_entry]) + ")")	
-
-			if kwargs.item_code:
-				conditions += f"  and sbb.item_code = '{kwargs.item_code}'"
-
-			if kwargs.has_serial_no:
-				conditions += f" and sbb.has_serial_no = '{kwargs.has_serial_no}'"
-			
-			if kwargs.get("warehouse"):
-				conditions += f" and serial.warehouse = '{kwargs.warehouse}'"
-			limit = ''
-
-			if cint(kwargs.qty):
-				limit = f"Limit {cint(kwargs.qty)}"
-			else:
-				limit = f"Limit 10000000"
-
-			serial_no = frappe.db.sql(f"""
-				SELECT *
-				FROM (
-					SELECT 
-						sbe.serial_no,
-						serial.warehouse,
-						serial.batch_no,
-						sbb.type_of_transaction,
-						sle.posting_datetime,
-						ROW_NUMBER() OVER(
-							PARTITION BY sbe.serial_no
-							ORDER BY sle.posting_datetime DESC
-						) AS rn
-					FROM `tabSerial and Batch Bundle` AS sbb
-					LEFT JOIN `tabSerial and Batch Entry` AS sbe
-						ON sbe.parent = sbb.name
-					LEFT JOIN `tabSerial No` AS serial
-						ON serial.name = sbe.serial_no
-					LEFT JOIN `tabStock Ledger Entry` AS sle 
-						ON sle.serial_and_batch_bundle = sbb.name
-					WHERE 
-						serial.status = "Active"
-						AND sle.is_cancelled = 0
-						{conditions}
-				) t
-				WHERE t.rn = 1
-				ORDER BY posting_datetime DESC
-				{limit}
-			""", as_dict=1)
-
-			
-			if serial_no:
-				return serial_no
+	is_manufacture, work_order = get_manufacture_work_order(kwargs)
+	if is_manufacture and kwargs.item_code:
+		serial_no = get_manufacture_serial_nos(work_order, kwargs, limit=cint(kwargs.qty))
+		if serial_no:
+			return serial_no
 	# end changes
 
 	fields = ["name as serial_no", "warehouse"]
@@ -258,41 +482,53 @@ def validate(self, method):
 	validate_reserved_stock_usage(self)
 
 	if self.voucher_type == "Stock Entry":
-		stock_entry_type = frappe.db.get_value("Stock Entry", self.voucher_no, "stock_entry_type")
-		
-		if stock_entry_type == "Manufacture":
-			work_order = frappe.db.get_value("Stock Entry", self.voucher_no, "work_order")
-
-			err_validate= not_validate_finished_item(self, self.voucher_detail_no)
-
-			if self.voucher_detail_no and (err_validate.get("is_finished_item") or err_validate.get("has_serial_no_replaced")):
-				return
-			material_transfer_entries = frappe.get_all(
-				"Stock Entry", 
-				{"stock_entry_type": "Material Transfer for Manufacture", "work_order": work_order, "docstatus": 1}, 
-				pluck="name"
-			)
+		validate_serial_nos_from_work_order(self)
+
+def validate_serial_nos_from_work_order(self):
+	"""Serials consumed by a Manufacture entry must come from the Work Order's transfers."""
+	serial_nos = {cstr(row.get("serial_no")).strip() for row in self.entries if row.get("serial_no")}
+	if not serial_nos or not frappe.db.get_single_value("Stock Settings", "enable_validation_serial_no"):
+		return
 
-			# Build conditions for querying serials and batches
-			conditions = build_conditions(self, material_transfer_entries)
-			
-			# SQL to fetch serial numbers and batch numbers
-			serial_no_data = get_serial_no_data(conditions, material_transfer_entries)
-			batch_no_data = get_batch_no_data(conditions)
-
-			# Prepare the lists for validation
-			pre_serial_no = [row.get("serial_no") for row in serial_no_data]
-			pre_batch_no = [row.batch_no for row in batch_no_data]
-
-			# Validate each entry in self.entries
-			for row in self.entries:
-				if row.get("serial_no") and row.get("serial_no") not in pre_serial_no:
-					idx = frappe.db.sql(f"Select idx From `tabStock Entry Detail` Where name = '{self.voucher_detail_no}'", as_dict=1)
-					message = _(f"Row #{idx[0].idx}: Selected Serial No '{frappe.bold(get_link_to_form('Serial No', row.get('serial_no')))}' is not from previous material transfer entries.<br>")
-					message += _(f"Serial No should be from related work order process {frappe.bold(get_link_to_form('Work Order', work_order))}")
-					message += _(f"<br><br>To update the correct serial no, use <b>'Add Serial / Batch No'</b> button.")
-					if frappe.db.get_single_value("Stock Settings", "enable_validation_serial_no"):
-						frappe.throw(message)
+	stock_entry = frappe.db.get_value(
+		"Stock Entry", self.voucher_no, ["stock_entry_type", "work_order"], as_dict=True
+	)
+	if not stock_entry or stock_entry.stock_entry_type != "Manufacture":
+		return
+
+	work_order = stock_entry.work_order
+	detail = frappe._dict()
+	if self.voucher_detail_no:
+		detail = frappe.db.get_value(
+			"Stock Entry Detail",
+			self.voucher_detail_no,
+			["idx", "is_finished_item", "has_serial_no_replaced"],
+			as_dict=True,
+		) or frappe._dict()
+
+		if detail.is_finished_item or detail.has_serial_no_replaced:
+			return
+
+	material_transfer_entries = get_material_transfer_entries(work_order) if work_order else []
+
+	# Only the serials of this bundle are looked up
+	conditions, values = build_conditions(self, material_transfer_entries, serial_nos)
+	allowed = {
+		cstr(row.serial_no).strip()
+		for row in frappe.db.sql(get_statement("bundle_serial_nos", conditions), values, as_dict=True)
+	}
+
+	invalid = serial_nos - allowed
+	if invalid and material_transfer_entries:
+		invalid -= set(get_transfer_serial_nos(material_transfer_entries))
+
+	invalid = sorted(invalid)
+	if invalid:
+		message = _(f"Row #{detail.idx}: ") if detail.idx else ""
+		message += _(f"Selected Serial No '{frappe.bold(get_link_to_form('Serial No', invalid[0]))}' is not from previous material transfer entries.<br>")
+		message += _(f"Serial No should be from related work order process {frappe.bold(get_link_to_form('Work Order', work_order))}")
+		message += _(f"<br><br>To update the correct serial no, use <b>'Add Serial / Batch No'</b> button.")
+		frappe.throw(message)
 
 def validate_reserved_stock_usage(self):
 	serial_nos = []
@@ -315,14 +551,13 @@ def validate_reserved_stock_usage(self):
 	if not serial_nos and not outward_batch_qty:
 		return
 
-	reserved_refs = get_reserved_stock_references(serial_nos=serial_nos, batch_nos=[])
-	reserved_serials = reserved_refs.get("serial_no", {})
+	reserved_serials = get_cached_reserved_serials(serial_nos)
 	violating_batches = {}
 
 	if outward_batch_qty:
-		batch_details = get_reserved_batch_details(
-			batch_nos=[k[0] for k in outward_batch_qty.keys()],
-			warehouses=[k[1] for k in outward_batch_qty.keys()],
+		batch_details = get_cached_reserved_batches(outward_batch_qty.keys())
+		current_qty_by_key = get_cached_batch_qty(
+			[key for key in outward_batch_qty if key in batch_details]
 		)
 		for (batch_no, warehouse), outgoing_qty in outward_batch_qty.items():
 			reserved_detail = batch_details.get((batch_no, warehouse))
@@ -330,7 +565,7 @@ def validate_reserved_stock_usage(self):
 				continue
 
 			reserved_qty = flt(reserved_detail.get("reserved_qty"))
-			current_qty = get_batch_qty_in_warehouse(batch_no, warehouse)
+			current_qty = current_qty_by_key.get((batch_no, warehouse), 0)
 			projected_qty = current_qty - flt(outgoing_qty)
 
 			if projected_qty < reserved_qty:
@@ -387,85 +622,86 @@ def validate_reserved_stock_usage(self):
 	frappe.throw("<br>".join(message_parts))
 
 
-def not_validate_finished_item(self, voucher_detail_no):
-	data = frappe.db.sql(f"""
-				Select is_finished_item, has_serial_no_replaced
-				From `tabStock Entry Detail`
-				Where name = '{voucher_detail_no}'
-	 """, as_dict=1)
-
-	return { "is_finished_item": data[0].is_finished_item, "has_serial_no_replaced" : data[0].has_serial_no_replaced } 
+def build_conditions(self, material_transfer_entries, serial_nos=None):
+	"""Build SQL conditions and bind values for serial and batch validation.
 
-def build_conditions(self, material_transfer_entries):
-	"""Build SQL conditions for serial and batch validation."""
-	conditions = ''
+	Returns (conditions, values). The condition text only depends on which
+	filters are present, so each combination maps to one cached statement.
+	"""
+	values = {}
 	if material_transfer_entries:
-		conditions += " AND sbb.voucher_no IN ({})".format(
-			", ".join([f'"{entry}"' for entry in material_transfer_entries])
-		)
+		values["transfers"] = tuple(material_transfer_entries)
 
 	if self.item_code:
-		conditions += f" AND sbb.item_code = '{self.item_code}'"
+		values["item_code"] = self.item_code
 
 	if self.has_serial_no:
-		conditions += f" AND sbb.has_serial_no = {self.has_serial_no}"
+		values["has_serial_no"] = cint(self.has_serial_no)
+
+	if serial_nos:
+		values["serial_nos"] = tuple(serial_nos)
+
+	return get_condition_text(tuple(sorted(values))), values
+
+
+@lru_cache(maxsize=8)
+def get_condition_text(filters):
+	conditions = ""
+	if "transfers" in filters:
+		conditions += " AND sbb.voucher_no IN %(transfers)s"
+
+	if "item_code" in filters:
+		conditions += " AND sbb.item_code = %(item_code)s"
+
+	if "has_serial_no" in filters:
+		conditions += " AND sbb.has_serial_no = %(has_serial_no)s"
+
+	if "serial_nos" in filters:
+		conditions += " AND sbe.serial_no IN %(serial_nos)s"
 
 	return conditions
 
-def get_serial_no_data(conditions, material_transfer_entries):
-    """Fetch active serial numbers based on conditions."""
-
-    # 1️⃣ Fetch serial numbers from Serial & Batch tables
-    serial_no = frappe.db.sql(
-        f"""
-        SELECT 
-            sbe.serial_no, 
-            serial.warehouse, 
-            serial.batch_no
-        FROM `tabSerial and Batch Bundle` AS sbb
-        LEFT JOIN `tabSerial and Batch Entry` AS sbe 
-            ON sbe.parent = sbb.name
-        LEFT JOIN `tabSerial No` AS serial 
-            ON serial.name = sbe.serial_no
-        WHERE serial.status = "Active" {conditions}
-        """,
-        as_dict=True,
-    )
-
-    if not material_transfer_entries:
-        return serial_no
-
-    # 2️⃣ Fetch serial numbers from Stock Entry Detail (in one optimized query)
-    placeholders = ", ".join(["%s"] * len(material_transfer_entries))
-
-    raw_serials = frappe.db.sql(
-        f"""
-        SELECT sed.serial_no
-        FROM `tabStock Entry Detail` AS sed
-        WHERE sed.parent IN ({placeholders})
-        """,
-        values=material_transfer_entries,
-        as_dict=True,
-    )
-
-    # 3️⃣ Split and flatten serial numbers
-    extra_serials = []
-    for row in raw_serials:
-        if row.serial_no:
-            extra_serials.extend(
-                {"serial_no": s.strip()}
-                for s in row.serial_no.split("\n") if s.strip()
-            )
-
-    return serial_no + extra_serials
-
-
-def get_batch_no_data(conditions):
-	"""Fetch batch numbers with remaining quantity based on conditions."""
-	return frappe.db.sql(f"""
-		SELECT sbe.serial_no, batch.name AS batch_no
+
+STATEMENTS = {
+	"bundle_serial_nos": """
+		SELECT
+			sbe.serial_no,
+			serial.warehouse,
+			serial.batch_no
 		FROM `tabSerial and Batch Bundle` AS sbb
-		LEFT JOIN `tabSerial and Batch Entry` AS sbe ON sbe.parent = sbb.name
-		LEFT JOIN `tabBatch` AS batch ON batch.name = sbe.batch_no
-		WHERE 1=1 AND batch.batch_qty > 0 {conditions}
-	""", as_dict=1)
+		LEFT JOIN `tabSerial and Batch Entry` AS sbe
+			ON sbe.parent = sbb.name
+		LEFT JOIN `tabSerial No` AS serial
+			ON serial.name = sbe.serial_no
+		WHERE serial.status = "Active" {conditions}
+	""",
+	"transfer_serial_nos": """
+		SELECT sed.serial_no
+		FROM `tabStock Entry Detail` AS sed
+		WHERE sed.parent IN %(transfers)s
+	""",
+}
+
+
+@lru_cache(maxsize=32)
+def get_statement(name, conditions=""):
+	"""Return the SQL text of a named statement; one text per (name, conditions)."""
+	return STATEMENTS[name].format(conditions=conditions)
+
+
+def get_transfer_serial_nos(material_transfer_entries):
+	"""Serials typed into the Stock Entry Detail rows of the transfers."""
+	raw_serials = frappe.db.sql(
+		get_statement("transfer_serial_nos"),
+		{"transfers": tuple(material_transfer_entries)},
+		as_dict=True,
+	)
+
+	# 3️⃣ Split and flatten serial numbers
+	extra_serials = []
+	for row in raw_serials:
+		if row.serial_no:
+			extra_serials.extend(s.strip() for s in row.serial_no.split("\n") if s.strip())
+
+	return extra_serials
+
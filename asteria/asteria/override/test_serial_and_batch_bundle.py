@@ -0,0 +1,88 @@
+# Copyright (c) 2026, Viral and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from asteria.asteria.override.serial_and_batch_bundle import (
+	allocate_batches,
+	allocate_serial_batch_for_document,
+	allocate_serial_nos,
+	apply_serial_batch_allocation,
+)
+
+MODULE = "asteria.asteria.override.serial_and_batch_bundle"
+
+
+class TestSerialAndBatchBundle(FrappeTestCase):
+	def test_row_allocated_across_two_batches(self):
+		rows = [frappe._dict(idx=1, item_code="_Test RM", transfer_qty=10)]
+		candidates = [
+			{"batch_no": "B1", "qty": 6, "warehouse": "WIP"},
+			{"batch_no": "B2", "qty": 8, "warehouse": "WIP"},
+		]
+
+		allocation = allocate_batches(rows, candidates)
+
+		self.assertEqual(
+			[(batch["batch_no"], batch["qty"]) for batch in allocation[0]["batches"]], [("B1", 6), ("B2", 4)]
+		)
+
+		stock_entry = frappe.new_doc("Stock Entry")
+		stock_entry.append(
+			"items", {"item_code": "_Test RM", "qty": 10, "transfer_qty": 10, "conversion_factor": 1}
+		)
+		apply_serial_batch_allocation(stock_entry, allocation)
+
+		self.assertEqual(
+			[(row.batch_no, row.qty) for row in stock_entry.items], [("B1", 6), ("B2", 4)]
+		)
+
+	def test_serial_nos_handed_out_in_order_across_rows(self):
+		rows = [
+			frappe._dict(idx=1, item_code="_Test Serial RM", transfer_qty=2),
+			frappe._dict(idx=2, item_code="_Test Serial RM", transfer_qty=1),
+		]
+		candidates = [{"serial_no": serial_no} for serial_no in ("SN1", "SN2", "SN3")]
+
+		allocation = allocate_serial_nos(rows, candidates)
+
+		self.assertEqual([row["serial_nos"] for row in allocation], [["SN1", "SN2"], ["SN3"]])
+		self.assertFalse(any(row["shortfall"] or row["message"] for row in allocation))
+
+	def test_document_allocation_reports_shortfall(self):
+		doc = {
+			"doctype": "Stock Entry",
+			"items": [
+				{"idx": 1, "item_code": "_Test Serial RM", "s_warehouse": "WIP", "transfer_qty": 2},
+				{"idx": 2, "item_code": "_Test Serial RM", "s_warehouse": "WIP", "transfer_qty": 2},
+				{"idx": 3, "item_code": "_Test Batch RM", "s_warehouse": "WIP", "transfer_qty": 10},
+			],
+		}
+		item_flags = [
+			frappe._dict(name="_Test Serial RM", has_serial_no=1, has_batch_no=0),
+			frappe._dict(name="_Test Batch RM", has_serial_no=0, has_batch_no=1),
+		]
+
+		def get_auto_data(**kwargs):
+			if kwargs["has_serial_no"]:
+				return [{"serial_no": "SN1"}, {"serial_no": "SN2"}, {"serial_no": "SN3"}]
+
+			return [{"batch_no": "B1", "qty": 6, "warehouse": "WIP"}]
+
+		with patch(f"{MODULE}.frappe.get_all", return_value=item_flags), patch(
+			f"{MODULE}.get_auto_data", side_effect=get_auto_data
+		):
+			allocation = allocate_serial_batch_for_document(frappe.as_json(doc))
+
+		by_idx = {row["idx"]: row for row in allocation}
+		self.assertEqual(by_idx[1]["serial_nos"], ["SN1", "SN2"])
+		self.assertEqual(by_idx[2]["serial_nos"], ["SN3"])
+		self.assertEqual(by_idx[2]["shortfall"], 1)
+		self.assertEqual(by_idx[3]["batches"], [{"batch_no": "B1", "qty": 6, "warehouse": "WIP"}])
+		self.assertEqual(by_idx[3]["shortfall"], 4)
+		self.assertFalse(by_idx[1]["message"])
+		self.assertIn("Row #2", by_idx[2]["message"])
+		self.assertIn("Row #3", by_idx[3]["message"])
@@ -5,8 +5,11 @@ from asteria.asteria.doc_events.work_order import update_order_quantity
 
 class CustomWorkOrder(WorkOrder):
     def after_insert(self):
-        trigger_method = "validate"
-        update_order_quantity(self, trigger_method)
+        # Work Orders made by a Production Plan are inserted with ignore_validate,
+        # so the validate hook has not counted them yet
+        if not self.flags.plan_counters_updated:
+            trigger_method = "validate"
+            update_order_quantity(self, trigger_method)
     def update_transferred_qty_for_required_items(self):
         ste = frappe.qb.DocType("Stock Entry")
         ste_child = frappe.qb.DocType("Stock Entry Detail")
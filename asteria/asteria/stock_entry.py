@@ -2,10 +2,20 @@ import frappe
 from frappe import _
 from frappe.utils import cstr, flt, get_link_to_form
 from asteria.asteria.doctype.reserve_stock.reserve_stock import (
-    get_batch_qty_in_warehouse,
-    get_reserved_batch_details,
-    get_reserved_stock_references,
+    get_cached_batch_qty,
+    get_cached_reserved_batches,
+    get_cached_reserved_serials,
 )
+from asteria.asteria.doctype.work_order_serial_trail.work_order_serial_trail import (
+    append_serial_trail,
+    get_serial_trail_count,
+    get_serial_trail_rows,
+    remove_serial_trail,
+)
+from asteria.asteria.doctype.batch_warehouse_balance.batch_warehouse_balance import get_batch_balances
+from asteria.asteria.wip_pool import get_valid_batch_map, on_stock_entry_update
+
+SERIAL_TRAIL_MSGPRINT_ROWS = 500
 
 
 def validate(self, method):
@@ -15,26 +25,48 @@ def validate(self, method):
 
 def on_submit(self, method):
     validate_manufacture_batch_from_work_order(self)
+    append_serial_trail(self)
     show_serial_no_transaction(self)
+    on_stock_entry_update(self)
+
+
+def on_cancel(self, method):
+    remove_serial_trail(self)
+    on_stock_entry_update(self)
 
 def show_serial_no_transaction(self):
     if self.work_order:
-        stock_entry_list = frappe.db.get_list("Stock Entry", {"docstatus" : 1, "work_order" : self.work_order}, "name")
-        stock_entry_list.append({
-            "name" : self.name
-        })
-        conditions = ''
-        if stock_entry_list:
-            conditions = " and sbb.voucher_no in {} ".format(
-                    "(" + ", ".join([f'"{l.get("name")}"' for l in stock_entry_list]) + ")")
-
-        serial_and_batch_bundle = frappe.db.sql(f"""
-                    Select sbe.serial_no, sbb.type_of_transaction, sbb.warehouse, sbb.item_code, sbb.name, sbb.voucher_detail_no
-                    From `tabSerial and Batch Bundle` as sbb
-                    Left Join `tabSerial and Batch Entry` as sbe ON sbe.parent = sbb.name
-                    Where sbb.docstatus < 2 {conditions}
-                    Order By sbb.creation
-        """, as_dict=1)
+        rows = get_serial_trail_rows(self.work_order, page_length=SERIAL_TRAIL_MSGPRINT_ROWS)
+        total = len(rows)
+        if total == SERIAL_TRAIL_MSGPRINT_ROWS:
+            total = get_serial_trail_count(self.work_order)
+
+        cell = '<td style="border: 1px solid #d1d8dd; padding: 8px; {0}">{1}</td>'
+        body = []
+        for row in rows:
+            style = ""
+            if row.has_serial_no_replaced or (row.from_bom is not None and not row.from_bom):
+                style = "color: red;"
+
+            inward_warehouse = row.warehouse if row.type_of_transaction == "Inward" else ""
+            outward_warehouse = row.warehouse if row.type_of_transaction == "Outward" else ""
+            body.append(
+                "<tr>"
+                + cell.format(style, row.serial_no or "")
+                + cell.format(style, inward_warehouse or "")
+                + cell.format(style, outward_warehouse or "")
+                + "</tr>"
+            )
+
+        footer = ""
+        if total > len(rows):
+            footer = _("Showing the first {0} of {1} rows. See the full trail in {2}.").format(
+                len(rows),
+                total,
+                '<a href="/app/work-order-serial-trail?work_order={0}">{1}</a>'.format(
+                    self.work_order, _("Work Order Serial Trail")
+                ),
+            )
 
         message = """
             <h4>Serial Number Transactions</h4>
@@ -46,46 +78,10 @@ def show_serial_no_transaction(self):
                         <th style="border: 1px solid #d1d8dd; padding: 8px; background-color: #f7fafc;">Outward</th>
                     </tr>
                 </thead>
-                <tbody>
-        """
-
-        for row in serial_and_batch_bundle:
-            sted_data = []
-            has_serial_no_replaced = False
-            style = ''
-            inward_warehouse = ""
-            outward_warehouse = ""
-            if row.type_of_transaction == "Outward":
-                outward_warehouse = row.warehouse
-            if row.type_of_transaction == "Inward":
-                inward_warehouse = row.warehouse
-            if row.voucher_detail_no:
-                sted_data = frappe.db.sql("""Select 
-                                                sed.has_serial_no_replaced, se.from_bom 
-                                            From 
-                                                `tabStock Entry Detail`  as sed
-                                            Left Join 
-                                                `tabStock Entry` as se ON se.name = sed.parent
-                                            Where 
-                                                sed.name = '{0}'    
-                                            """.format(row.voucher_detail_no), as_dict=1)
-            if sted_data:
-                has_serial_no_replaced = sted_data[0].get("has_serial_no_replaced")
-                from_bom = sted_data[0].get("from_bom")
-                if has_serial_no_replaced or not from_bom:
-                    style = "color: red;"
-            message += f"""
-                <tr>
-                    <td style="border: 1px solid #d1d8dd; padding: 8px; {style}">{row.serial_no or ""}</td>
-                    <td style="border: 1px solid #d1d8dd; padding: 8px; {style}">{inward_warehouse}</td>
-                    <td style="border: 1px solid #d1d8dd; padding: 8px; {style}">{outward_warehouse}</td>
-                </tr>
-            """
-
-        message += """
-                </tbody>
+                <tbody>{0}</tbody>
             </table>
-        """
+            <p>{1}</p>
+        """.format("".join(body), footer)
 
         frappe.msgprint(message)
 
@@ -138,7 +134,11 @@ def validate_manufacture_batch_from_work_order(self):
 
 
 def _check_manufacture_batches(self, block=True):
-    """Core check logic. If block=True, frappe.throw; if False, frappe.msgprint."""
+    """Core check logic. If block=True, frappe.throw; if False, frappe.msgprint.
+
+    Batches of all rows (batch_no field or Serial and Batch Bundle) and their WIP
+    balances are fetched up front, so the cost follows distinct batches, not rows.
+    """
 
     # Check if batch validation is enabled in Stock Settings
     if not frappe.db.get_single_value("Stock Settings", "enable_batch_validation_for_manufacture", 0) and block:
@@ -152,139 +152,95 @@ def _check_manufacture_batches(self, block=True):
     if not wip_warehouse:
         return
 
-    # 2. Get all submitted Material Transfer for Manufacture entries for this WO
-    material_transfer_entries = frappe.get_all(
-        "Stock Entry",
-        {
-            "stock_entry_type": "Material Transfer for Manufacture",
-            "work_order": self.work_order,
-            "docstatus": 1,
-        },
-        pluck="name",
-    )
+    # 2. Valid batches of the Work Order's Material Transfer for Manufacture entries
+    valid_batches = get_valid_batch_map(self.work_order)
+    if not valid_batches:
+        return
 
-    if not material_transfer_entries:
+    # 3. Batches used by each raw-material row
+    rows = [
+        row for row in self.items
+        if not row.get("is_finished_item") and not row.get("is_scrap_item")
+    ]
+    batches_by_row = _get_row_batches(rows)
+    if not batches_by_row:
         return
 
-    # 3. Collect valid batches from those transfers
-    valid_batches = _get_valid_batches_for_work_order(
-        material_transfer_entries, self.work_order
+    wip_qty = get_batch_balances(
+        {(batch_no, wip_warehouse) for batch_nos in batches_by_row.values() for batch_no in batch_nos}
     )
 
-    if not valid_batches:
-        return
-
     # 4. Validate each raw-material row
-    for row in self.items:
-        if row.get("is_finished_item") or row.get("is_scrap_item"):
-            continue
-
-        batch_no = cstr(row.get("batch_no")).strip()
-        if not batch_no:
-            continue
-
-        # 4a. Batch must come from a MTfM of this Work Order
+    for row in rows:
         item_valid = valid_batches.get(cstr(row.item_code).strip(), set())
 
-        if batch_no not in item_valid:
-            msg = _(
-                "Row #{0}: Batch {1} for item {2} is not from the "
-                "Material Transfer for Manufacture entries of Work Order {3}.<br><br>"
-                "Only batches transferred for this Work Order cycle are allowed."
-            ).format(
-                row.idx,
-                frappe.bold(get_link_to_form("Batch", batch_no)),
-                frappe.bold(get_link_to_form("Item", row.item_code)),
-                frappe.bold(get_link_to_form("Work Order", self.work_order)),
-            )
-            if block:
-                frappe.throw(msg, title=_("Invalid Batch for Manufacture"))
-            else:
-                frappe.msgprint(msg, title=_("Invalid Batch for Manufacture"), indicator="orange")
-
-        # 4b. Batch must currently exist in the WIP warehouse
-        #     (rejected batches transferred out of WIP will have 0 qty)
-        batch_qty = _get_batch_qty_in_warehouse(batch_no, wip_warehouse)
-        if flt(batch_qty) <= 0:
-            msg = _(
-                "Row #{0}: Batch {1} for item {2} is not available in "
-                "WIP Warehouse {3} of Work Order {4}.<br><br>"
-                "The batch may have been rejected and transferred out. "
-                "Please use a batch that is currently in the WIP Warehouse."
-            ).format(
-                row.idx,
-                frappe.bold(get_link_to_form("Batch", batch_no)),
-                frappe.bold(get_link_to_form("Item", row.item_code)),
-                frappe.bold(wip_warehouse),
-                frappe.bold(get_link_to_form("Work Order", self.work_order)),
-            )
-            if block:
-                frappe.throw(msg, title=_("Batch Not in WIP Warehouse"))
-            else:
-                frappe.msgprint(msg, title=_("Batch Not in WIP Warehouse"), indicator="orange")
-
-
-def _get_valid_batches_for_work_order(material_transfer_entries, work_order):
-    """Return { item_code: set(batch_no, …) } collected from the given
-    Material Transfer for Manufacture stock entries."""
-
-    valid = {}  # { item_code: set() }
-
-    entry_list = ", ".join([f'"{e}"' for e in material_transfer_entries])
-
-    # --- Source 1: Serial and Batch Bundle entries ---
-    sbb_batches = frappe.db.sql(
-        f"""
-        SELECT sbb.item_code, sbe.batch_no
-        FROM `tabSerial and Batch Bundle` AS sbb
-        INNER JOIN `tabSerial and Batch Entry` AS sbe ON sbe.parent = sbb.name
-        WHERE
-            sbb.docstatus = 1
-            AND sbb.has_batch_no = 1
-            AND sbe.batch_no IS NOT NULL
-            AND sbb.voucher_no IN ({entry_list})
-        """,
-        as_dict=True,
-    )
-
-    for r in sbb_batches:
-        valid.setdefault(cstr(r.item_code).strip(), set()).add(cstr(r.batch_no).strip())
-
-    # --- Source 2: Stock Entry Detail (use_serial_batch_fields) ---
-    sed_batches = frappe.db.sql(
-        f"""
-        SELECT sed.item_code, sed.batch_no
-        FROM `tabStock Entry Detail` AS sed
-        WHERE
-            sed.parent IN ({entry_list})
-            AND sed.batch_no IS NOT NULL
-            AND sed.batch_no != ''
-        """,
-        as_dict=True,
-    )
+        for batch_no in batches_by_row.get(row.name, []):
+            # 4a. Batch must come from a MTfM of this Work Order
+            if batch_no not in item_valid:
+                msg = _(
+                    "Row #{0}: Batch {1} for item {2} is not from the "
+                    "Material Transfer for Manufacture entries of Work Order {3}.<br><br>"
+                    "Only batches transferred for this Work Order cycle are allowed."
+                ).format(
+                    row.idx,
+                    frappe.bold(get_link_to_form("Batch", batch_no)),
+                    frappe.bold(get_link_to_form("Item", row.item_code)),
+                    frappe.bold(get_link_to_form("Work Order", self.work_order)),
+                )
+                if block:
+                    frappe.throw(msg, title=_("Invalid Batch for Manufacture"))
+                else:
+                    frappe.msgprint(msg, title=_("Invalid Batch for Manufacture"), indicator="orange")
+
+            # 4b. Batch must currently exist in the WIP warehouse
+            #     (rejected batches transferred out of WIP will have 0 qty)
+            if flt(wip_qty.get((batch_no, wip_warehouse))) <= 0:
+                msg = _(
+                    "Row #{0}: Batch {1} for item {2} is not available in "
+                    "WIP Warehouse {3} of Work Order {4}.<br><br>"
+                    "The batch may have been rejected and transferred out. "
+                    "Please use a batch that is currently in the WIP Warehouse."
+                ).format(
+                    row.idx,
+                    frappe.bold(get_link_to_form("Batch", batch_no)),
+                    frappe.bold(get_link_to_form("Item", row.item_code)),
+                    frappe.bold(wip_warehouse),
+                    frappe.bold(get_link_to_form("Work Order", self.work_order)),
+                )
+                if block:
+                    frappe.throw(msg, title=_("Batch Not in WIP Warehouse"))
+                else:
+                    frappe.msgprint(msg, title=_("Batch Not in WIP Warehouse"), indicator="orange")
 
-    for r in sed_batches:
-        valid.setdefault(cstr(r.item_code).strip(), set()).add(cstr(r.batch_no).strip())
 
-    return valid
+def _get_row_batches(rows):
+    """Return { row.name: [batch_no, …] } from the batch_no field or, when the row
+    uses a Serial and Batch Bundle, from the bundle entries (one query for all rows)."""
 
+    batches_by_row = {}
+    bundle_rows = {}
+    for row in rows:
+        batch_no = cstr(row.get("batch_no")).strip()
+        if batch_no:
+            batches_by_row[row.name] = [batch_no]
+        elif row.get("serial_and_batch_bundle"):
+            bundle_rows[row.serial_and_batch_bundle] = row.name
 
-def _get_batch_qty_in_warehouse(batch_no, warehouse):
-    """Return the current stock balance of a batch in a specific warehouse
-    using the Stock Ledger Entry (single source of truth for stock)."""
+    if bundle_rows:
+        entries = frappe.db.sql(
+            """
+            SELECT DISTINCT parent, batch_no
+            FROM `tabSerial and Batch Entry`
+            WHERE parent IN %(bundles)s AND IFNULL(batch_no, '') != ''
+            ORDER BY parent, batch_no
+            """,
+            {"bundles": tuple(bundle_rows)},
+            as_dict=True,
+        )
+        for entry in entries:
+            batches_by_row.setdefault(bundle_rows[entry.parent], []).append(cstr(entry.batch_no).strip())
 
-    qty = frappe.db.sql(
-        """
-        SELECT IFNULL(SUM(actual_qty), 0)
-        FROM `tabStock Ledger Entry`
-        WHERE
-            batch_no = %s
-            AND warehouse = %s
-            AND is_cancelled = 0
-        """,
-        (batch_no, warehouse),
-    )
-    return flt(qty[0][0]) if qty else 0
+    return batches_by_row
 
 
 def validate_reserved_stock_usage(self):
@@ -306,14 +262,13 @@ def validate_reserved_stock_usage(self):
     if not serial_nos and not outward_batch_qty:
         return
 
-    reserved_refs = get_reserved_stock_references(serial_nos=serial_nos, batch_nos=[])
-    reserved_serials = reserved_refs.get("serial_no", {})
+    reserved_serials = get_cached_reserved_serials(serial_nos)
     violating_batches = {}
 
     if outward_batch_qty:
-        batch_details = get_reserved_batch_details(
-            batch_nos=[k[0] for k in outward_batch_qty.keys()],
-            warehouses=[k[1] for k in outward_batch_qty.keys()],
+        batch_details = get_cached_reserved_batches(outward_batch_qty.keys())
+        current_qty_by_key = get_cached_batch_qty(
+            [key for key in outward_batch_qty if key in batch_details]
         )
         for (batch_no, warehouse), outgoing_qty in outward_batch_qty.items():
             reserved_detail = batch_details.get((batch_no, warehouse))
@@ -321,7 +276,7 @@ def validate_reserved_stock_usage(self):
                 continue
 
             reserved_qty = flt(reserved_detail.get("reserved_qty"))
-            current_qty = get_batch_qty_in_warehouse(batch_no, warehouse)
+            current_qty = current_qty_by_key.get((batch_no, warehouse), 0)
             projected_qty = current_qty - flt(outgoing_qty)
             if projected_qty < reserved_qty:
                 violating_batches[(batch_no, warehouse)] = {
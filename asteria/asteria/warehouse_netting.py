@@ -0,0 +1,157 @@
+"""Net Production Plan demand against stock held in several warehouses.
+
+Supply is a matrix { item_code: { warehouse: qty } } whose warehouse order is
+the allocation priority. It is loaded once for every item and warehouse, then
+rows are allocated against it in a single pass. Stock taken by one row is not
+offered to the next. Only stock that can actually be moved counts: picked qty
+of open Pick Lists and expired or disabled batches are excluded.
+"""
+
+import frappe
+from frappe.utils import cstr, flt, nowdate
+
+
+def get_warehouse_supply(item_codes, warehouses=None, company=None):
+	"""Movable qty per item and warehouse, ordered by Bin creation like erpnext
+	get_available_item_locations.
+
+	Stock already picked on open Pick Lists is left out. Batch items only count
+	non-expired, enabled batches (from the Batch Warehouse Balance store), less
+	what is picked of each batch.
+	"""
+	supply = {}
+	item_codes = list(set(item_codes))
+	if not item_codes:
+		return supply
+
+	conditions = "bin.item_code IN %(item_codes)s AND bin.actual_qty > 0"
+	if warehouses:
+		conditions += " AND bin.warehouse IN %(warehouses)s"
+	else:
+		conditions += """ AND bin.warehouse IN (
+			SELECT name FROM `tabWarehouse` WHERE company = %(company)s
+		)"""
+
+	values = {"item_codes": item_codes, "warehouses": list(warehouses or []), "company": company}
+	bin_rows = frappe.db.sql(
+		f"""
+		SELECT bin.item_code, bin.warehouse, bin.actual_qty
+		FROM `tabBin` AS bin
+		WHERE {conditions}
+		ORDER BY bin.creation
+		""",
+		values,
+		as_dict=True,
+	)
+	if not bin_rows:
+		return supply
+
+	batch_items = set(
+		frappe.get_all("Item", filters={"name": ("in", item_codes), "has_batch_no": 1}, pluck="name")
+	)
+	picked = get_picked_qty(item_codes)
+	batch_qty = get_movable_batch_qty(
+		[row.item_code for row in bin_rows if row.item_code in batch_items],
+		[row.warehouse for row in bin_rows if row.item_code in batch_items],
+		picked,
+	)
+
+	for bin_row in bin_rows:
+		key = (bin_row.item_code, bin_row.warehouse)
+		qty = flt(bin_row.actual_qty)
+		if bin_row.item_code in batch_items:
+			qty = min(qty, batch_qty.get(key, 0))
+
+		# picks not tied to a batch_no field, e.g. bundle-based batch picks
+		qty -= flt(picked.get((*key, None)))
+
+		if qty > 0:
+			supply.setdefault(bin_row.item_code, {})[bin_row.warehouse] = qty
+
+	return supply
+
+
+def get_picked_qty(item_codes):
+	"""Qty on submitted, open Pick Lists keyed by (item_code, warehouse, batch_no or None)."""
+	picked = {}
+	for row in frappe.db.sql(
+		"""
+		SELECT
+			pli.item_code, pli.warehouse, pli.batch_no,
+			SUM(CASE WHEN pli.picked_qty > 0 THEN pli.picked_qty ELSE pli.stock_qty END) AS qty
+		FROM `tabPick List Item` AS pli
+		INNER JOIN `tabPick List` AS pl ON pl.name = pli.parent
+		WHERE
+			pl.docstatus = 1
+			AND pl.status NOT IN ('Completed', 'Cancelled')
+			AND pli.item_code IN %(item_codes)s
+		GROUP BY pli.item_code, pli.warehouse, pli.batch_no
+		""",
+		{"item_codes": item_codes},
+		as_dict=True,
+	):
+		key = (row.item_code, row.warehouse, cstr(row.batch_no).strip() or None)
+		picked[key] = picked.get(key, 0) + flt(row.qty)
+
+	return picked
+
+
+def get_movable_batch_qty(item_codes, warehouses, picked):
+	"""{ (item_code, warehouse): qty } of non-expired, enabled batches less their picked qty."""
+	if not item_codes or not warehouses:
+		return {}
+
+	movable = {}
+	for row in frappe.db.sql(
+		"""
+		SELECT bwb.item_code, bwb.warehouse, bwb.batch_no, SUM(bwb.qty) AS qty
+		FROM `tabBatch Warehouse Balance` AS bwb
+		INNER JOIN `tabBatch` AS batch ON batch.name = bwb.batch_no
+		WHERE
+			bwb.item_code IN %(item_codes)s
+			AND bwb.warehouse IN %(warehouses)s
+			AND batch.disabled = 0
+			AND (batch.expiry_date IS NULL OR batch.expiry_date >= %(today)s)
+		GROUP BY bwb.item_code, bwb.warehouse, bwb.batch_no
+		HAVING SUM(bwb.qty) > 0
+		""",
+		{"item_codes": list(set(item_codes)), "warehouses": list(set(warehouses)), "today": nowdate()},
+		as_dict=True,
+	):
+		qty = flt(row.qty) - flt(picked.get((row.item_code, row.warehouse, row.batch_no)))
+		if qty > 0:
+			key = (row.item_code, row.warehouse)
+			movable[key] = movable.get(key, 0) + qty
+
+	return movable
+
+
+def allocate(supply, item_code, qty, warehouses=None):
+	"""Take up to `qty` of `item_code` from `supply` in priority order.
+
+	Only `warehouses` are drawn from when given. Returns ([(warehouse, qty)], shortfall)
+	and reduces `supply` by what was allocated.
+	"""
+	stock = supply.get(item_code) or {}
+	allocations = []
+	qty = flt(qty)
+
+	for warehouse in warehouses or list(stock):
+		if qty <= 0:
+			break
+
+		available = flt(stock.get(warehouse))
+		if available <= 0:
+			continue
+
+		allocated = min(qty, available)
+		stock[warehouse] = available - allocated
+		qty -= allocated
+		allocations.append((warehouse, allocated))
+
+	return allocations, max(qty, 0)
+
+
+def allocate_demand(demands, supply):
+	"""Allocation matrix for `demands` [(item_code, qty)], one (allocations, shortfall) per row."""
+	return [allocate(supply, item_code, qty) for item_code, qty in demands]
@@ -0,0 +1,367 @@
+"""Per-Work Order pool of serials and batches transferred into WIP.
+
+Manufacture entries may only consume what the Work Order's Material Transfer
+for Manufacture entries moved into WIP. Deriving that set means listing the
+transfers and scanning their bundles, which used to happen on every
+"Add Serial / Batch No" click and once per raw-material row on Job Card submit.
+
+The pool is cached in Redis as one hash per Work Order with one field per item
+code (plus the list of transfer entries). It is built lazily, and a submitted or
+cancelled Stock Entry of the Work Order drops only the fields of the items it
+moved, after commit. Serials are re-checked against Serial No when served, so a
+serial that left WIP through an unrelated entry is never handed out.
+
+Fields are stored with the pool version they were built under. Invalidation
+bumps VERSION_FIELD, so a field rebuilt by a reader that started before the
+commit is ignored instead of surviving for the TTL, so validations can read
+through the cache too.
+"""
+
+import pickle
+
+import frappe
+from frappe.utils import cint, cstr
+
+WIP_POOL_KEY = "asteria:wip_pool:{0}"
+WIP_POOL_TTL = 24 * 60 * 60
+TRANSFERS_FIELD = "__transfers__"
+VALID_BATCHES_FIELD = "__valid_batches__"
+VERSION_FIELD = "__version__"
+
+
+def get_material_transfer_entries(work_order):
+	"""Return submitted Material Transfer for Manufacture entries of the Work Order."""
+	return _get_pool_field(
+		work_order,
+		TRANSFERS_FIELD,
+		lambda: frappe.get_all(
+			"Stock Entry",
+			{
+				"stock_entry_type": "Material Transfer for Manufacture",
+				"work_order": work_order,
+				"docstatus": 1,
+			},
+			pluck="name",
+			order_by="posting_date, posting_time, name",
+		),
+	)
+
+
+def get_valid_batch_map(work_order):
+	"""Return { item_code: set(batch_no) } moved by the Work Order's transfers.
+
+	Both bundle entries and Stock Entry Detail batch fields (use_serial_batch_fields)
+	count, so a batch is valid whichever way it was transferred.
+	"""
+	return _get_pool_field(work_order, VALID_BATCHES_FIELD, lambda: build_valid_batch_map(work_order))
+
+
+def build_valid_batch_map(work_order):
+	transfers = get_material_transfer_entries(work_order)
+	if not transfers:
+		return {}
+
+	rows = frappe.db.sql(
+		"""
+		SELECT sbb.item_code, sbe.batch_no
+		FROM `tabSerial and Batch Bundle` AS sbb
+		INNER JOIN `tabSerial and Batch Entry` AS sbe ON sbe.parent = sbb.name
+		WHERE
+			sbb.docstatus = 1
+			AND sbb.has_batch_no = 1
+			AND sbe.batch_no IS NOT NULL
+			AND sbb.voucher_no IN %(transfers)s
+		UNION
+		SELECT sed.item_code, sed.batch_no
+		FROM `tabStock Entry Detail` AS sed
+		WHERE
+			sed.parent IN %(transfers)s
+			AND sed.batch_no IS NOT NULL
+			AND sed.batch_no != ''
+		""",
+		{"transfers": tuple(transfers)},
+		as_dict=True,
+	)
+
+	valid = {}
+	for row in rows:
+		valid.setdefault(cstr(row.item_code).strip(), set()).add(cstr(row.batch_no).strip())
+
+	return valid
+
+
+def get_wip_pool(work_order, item_code):
+	"""Return frappe._dict(serials=[...], batches=[...]) for one item of the Work Order.
+
+	serials: latest bundle movement per Active serial, newest first
+	batches: batches (with qty and warehouse) moved by the transfers
+	"""
+	pool = _get_pool_field(work_order, cstr(item_code), lambda: build_wip_pool(work_order, item_code))
+	return frappe._dict(pool)
+
+
+def build_wip_pool(work_order, item_code):
+	transfers = get_material_transfer_entries(work_order)
+	if not transfers:
+		return {"serials": [], "batches": []}
+
+	return {
+		"serials": get_transferred_serials(transfers, item_code),
+		"batches": get_transferred_batches(transfers, item_code),
+	}
+
+
+def get_transferred_serials(
+	transfers, item_code, warehouse=None, limit=None, after=None, count_only=False, ignore=None
+):
+	"""Latest bundle movement per Active serial of the item, newest first.
+
+	Without transfers every bundle of the item is considered, as the Manufacture
+	serial selection always did before the Work Order had any transfer.
+	`after` is a (posting_datetime, serial_no) keyset cursor; rows sort by
+	posting_datetime and serial_no, both descending. Serials in `ignore` are left out.
+	"""
+	conditions = "AND sbb.item_code = %(item_code)s AND sbb.has_serial_no = 1"
+	values = {"item_code": item_code}
+	if transfers:
+		conditions += " AND sbb.voucher_no IN %(transfers)s"
+		values["transfers"] = tuple(transfers)
+
+	if warehouse:
+		conditions += " AND serial.warehouse = %(warehouse)s"
+		values["warehouse"] = warehouse
+
+	if ignore:
+		conditions += " AND sbe.serial_no NOT IN %(ignore)s"
+		values["ignore"] = tuple(ignore)
+
+	outer_conditions = ""
+	if after:
+		outer_conditions = """
+			AND (
+				t.posting_datetime < %(after_datetime)s
+				OR (t.posting_datetime = %(after_datetime)s AND t.serial_no < %(after_serial_no)s)
+			)
+		"""
+		values["after_datetime"], values["after_serial_no"] = after
+
+	select = "COUNT(*) AS count" if count_only else "*"
+	order_clause = "" if count_only else "ORDER BY posting_datetime DESC, serial_no DESC"
+	if cint(limit) and not count_only:
+		order_clause += " LIMIT %(limit)s"
+		values["limit"] = cint(limit)
+
+	rows = frappe.db.sql(
+		f"""
+		SELECT {select}
+		FROM (
+			SELECT
+				sbe.serial_no,
+				serial.warehouse,
+				serial.batch_no,
+				sbb.type_of_transaction,
+				sle.posting_datetime,
+				ROW_NUMBER() OVER(
+					PARTITION BY sbe.serial_no
+					ORDER BY sle.posting_datetime DESC
+				) AS rn
+			FROM `tabSerial and Batch Bundle` AS sbb
+			LEFT JOIN `tabSerial and Batch Entry` AS sbe
+				ON sbe.parent = sbb.name
+			LEFT JOIN `tabSerial No` AS serial
+				ON serial.name = sbe.serial_no
+			LEFT JOIN `tabStock Ledger Entry` AS sle
+				ON sle.serial_and_batch_bundle = sbb.name
+			WHERE
+				serial.status = "Active"
+				AND sle.is_cancelled = 0
+				{conditions}
+		) t
+		WHERE t.rn = 1 {outer_conditions}
+		{order_clause}
+		""",
+		values,
+		as_dict=True,
+	)
+
+	return cint(rows[0].count) if count_only else rows
+
+
+def get_transferred_batches(transfers, item_code):
+	# Fetch batches from Serial and Batch Bundle entries
+	batch_data = frappe.db.sql(
+		"""
+		SELECT
+			sbe.batch_no,
+			SUM(ABS(sbe.qty)) as qty,
+			sbe.warehouse
+		FROM `tabSerial and Batch Bundle` AS sbb
+		LEFT JOIN `tabSerial and Batch Entry` AS sbe ON sbe.parent = sbb.name
+		WHERE
+			sbb.docstatus = 1
+			AND sbe.batch_no IS NOT NULL
+			AND sbb.has_batch_no = 1
+			AND sbb.voucher_no IN %(transfers)s
+			AND sbb.item_code = %(item_code)s
+		GROUP BY sbe.batch_no, sbe.warehouse
+		""",
+		{"transfers": tuple(transfers), "item_code": item_code},
+		as_dict=True,
+	)
+
+	# Fallback: check Stock Entry Detail for batch_no (when use_serial_batch_fields is used)
+	if not batch_data:
+		batch_data = frappe.db.sql(
+			"""
+			SELECT
+				sed.batch_no,
+				SUM(sed.qty) as qty,
+				sed.t_warehouse as warehouse
+			FROM `tabStock Entry Detail` AS sed
+			WHERE
+				sed.parent IN %(transfers)s
+				AND sed.item_code = %(item_code)s
+				AND sed.batch_no IS NOT NULL
+				AND sed.batch_no != ''
+			GROUP BY sed.batch_no, sed.t_warehouse
+			""",
+			{"transfers": tuple(transfers), "item_code": item_code},
+			as_dict=True,
+		)
+
+	return batch_data
+
+
+def get_wip_batch_availability(batch_nos, wip_warehouse, item_code=None, based_on=None):
+	"""Return the batches with stock in the WIP warehouse, in picking order.
+
+	Quantities come from the Batch Warehouse Balance store (legacy SLE and
+	bundle-based stock, like reserve_stock.get_batch_qty_in_warehouse) in one
+	grouped query. Rows are ordered by expiry for "Expiry", newest first for
+	"LIFO" and oldest first otherwise (FIFO).
+	"""
+	batch_nos = {cstr(batch_no).strip() for batch_no in batch_nos or []}
+	batch_nos.discard("")
+	if not batch_nos or not wip_warehouse:
+		return []
+
+	values = {"batch_nos": tuple(batch_nos), "warehouse": wip_warehouse}
+	item_filter = ""
+	if item_code:
+		item_filter = "AND bwb.item_code = %(item_code)s"
+		values["item_code"] = item_code
+
+	order_by = "batch.manufacturing_date IS NULL, batch.manufacturing_date, batch.creation"
+	if based_on == "LIFO":
+		order_by = "batch.creation DESC"
+	elif based_on == "Expiry":
+		order_by = "batch.expiry_date IS NULL, batch.expiry_date, batch.creation"
+
+	return frappe.db.sql(
+		f"""
+		SELECT bwb.batch_no, SUM(bwb.qty) AS qty, bwb.warehouse
+		FROM `tabBatch Warehouse Balance` AS bwb
+		INNER JOIN `tabBatch` AS batch ON batch.name = bwb.batch_no
+		WHERE
+			bwb.batch_no IN %(batch_nos)s
+			AND bwb.warehouse = %(warehouse)s
+			{item_filter}
+		GROUP BY bwb.batch_no, bwb.warehouse
+		HAVING SUM(bwb.qty) > 0
+		ORDER BY {order_by}
+		""",
+		values,
+		as_dict=True,
+	)
+
+
+def get_pool_serial_nos(work_order, item_code, warehouse=None, qty=None, after=None, ignore=None):
+	"""Serve up to `qty` serials from the pool, newest movement first.
+
+	Only the served serials are re-checked against Serial No, so the cost is
+	proportional to the rows requested rather than to the size of the pool.
+	`after` is the (posting_datetime, serial_no) of the last row already served;
+	serials in `ignore` are never served.
+	"""
+	ignore = set(ignore or [])
+	candidates = [
+		frappe._dict(row)
+		for row in get_wip_pool(work_order, item_code).serials
+		if (not warehouse or row.get("warehouse") == warehouse)
+		and (not after or (row.get("posting_datetime"), row.get("serial_no")) < after)
+		and row.get("serial_no") not in ignore
+	]
+	qty = cint(qty) or len(candidates)
+
+	selected = []
+	stale = set()
+	start = 0
+	while len(selected) < qty and start < len(candidates):
+		batch = candidates[start : start + qty - len(selected)]
+		start += len(batch)
+
+		active = dict(
+			frappe.get_all(
+				"Serial No",
+				filters={"name": ("in", [row.serial_no for row in batch]), "status": "Active"},
+				fields=["name", "warehouse"],
+				as_list=True,
+			)
+		)
+		for row in batch:
+			if row.serial_no in active and (not warehouse or active[row.serial_no] == warehouse):
+				selected.append(row)
+			else:
+				stale.add(row.serial_no)
+
+	if stale:
+		invalidate_wip_pool_items(work_order, [item_code])
+
+	return selected
+
+
+def on_stock_entry_update(doc, method=None):
+	"""Drop pool fields of the items a Stock Entry of a Work Order moved, after commit."""
+	if not doc.get("work_order"):
+		return
+
+	item_codes = {row.item_code for row in doc.get("items") or [] if row.item_code}
+	if doc.get("stock_entry_type") == "Material Transfer for Manufacture" or doc.get("purpose") == "Material Transfer for Manufacture":
+		item_codes.update((TRANSFERS_FIELD, VALID_BATCHES_FIELD))
+
+	work_order = doc.work_order
+	frappe.db.after_commit.add(lambda: invalidate_wip_pool_items(work_order, item_codes))
+
+
+def invalidate_wip_pool_items(work_order, item_codes):
+	"""Drop the fields and bump the version, so fields built before this are ignored."""
+	key = frappe.cache.make_key(WIP_POOL_KEY.format(work_order))
+	pipeline = frappe.cache.pipeline()
+	pipeline.hincrby(key, VERSION_FIELD, 1)
+	if item_codes:
+		pipeline.hdel(key, *item_codes)
+	pipeline.expire(key, WIP_POOL_TTL)
+	pipeline.execute()
+
+
+def invalidate_wip_pool(work_order):
+	frappe.cache.delete_value(WIP_POOL_KEY.format(work_order))
+
+
+def _get_pool_field(work_order, field, generator):
+	key = frappe.cache.make_key(WIP_POOL_KEY.format(work_order))
+	version, cached = frappe.cache.hmget(key, [VERSION_FIELD, field])
+	version = cint(version)
+	if cached is not None:
+		cached_version, value = pickle.loads(cached)
+		if cached_version == version:
+			return value
+
+	# Stored under the version read before building; a later bump makes it stale
+	value = generator()
+	pipeline = frappe.cache.pipeline()
+	pipeline.hset(key, field, pickle.dumps((version, value)))
+	pipeline.expire(key, WIP_POOL_TTL)
+	pipeline.execute()
+
+	return value
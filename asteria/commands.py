@@ -0,0 +1,50 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-reservation-index")
+@pass_context
+def rebuild_reservation_index(context):
+	"Rebuild the Redis index of active Reserve Stock reservations"
+	from asteria.asteria.doctype.reserve_stock.reservation_index import rebuild_reservation_index
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		counts = rebuild_reservation_index()
+		click.echo(
+			"Indexed {batch_no} batch/warehouse keys and {serial_no} serials".format(**counts)
+		)
+	finally:
+		frappe.destroy()
+
+
+@click.command("check-reservation-index")
+@pass_context
+def check_reservation_index(context):
+	"Compare the Redis reservation index against the database"
+	from asteria.asteria.doctype.reserve_stock.reservation_index import check_reservation_index
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		frappe.set_user("Administrator")
+		result = check_reservation_index()
+		if not result.get("ready"):
+			click.echo("Reservation index is not built. Run bench rebuild-reservation-index.")
+		elif result.get("consistent"):
+			click.echo("Reservation index is consistent")
+		else:
+			mismatches = result["mismatches"]
+			for row in mismatches["batch_no"]:
+				click.echo("Batch {batch_no} / {warehouse}: expected {expected}, indexed {indexed}".format(**row))
+			for row in mismatches["serial_no"]:
+				click.echo("Serial {serial_no}: expected {expected}, indexed {indexed}".format(**row))
+	finally:
+		frappe.destroy()
+
+
+commands = [rebuild_reservation_index, check_reservation_index]
@@ -29,6 +29,9 @@ app_license = "mit"
 # include js, css files in header of desk.html
 # app_include_css = "/assets/asteria/css/asteria.css"
 # app_include_js = "/assets/asteria/js/asteria.js"
+app_include_js = [
+	"/assets/asteria/js/utils.js"
+]
 
 # include js, css files in header of web template
 # web_include_css = "/assets/asteria/css/asteria.css"
@@ -123,7 +126,10 @@ doctype_js = {
 # See frappe.core.notifications.get_notification_config
 
 # notification_config = "asteria.notifications.get_notification_config"
-after_migrate = "asteria.asteria.create_custom_field.setup_custom_fields"
+after_migrate = [
+	"asteria.asteria.create_custom_field.setup_custom_fields",
+	"asteria.asteria.doctype.reserve_stock.reservation_index.rebuild_reservation_index"
+]
 # Permissions
 # -----------
 # Permissions evaluated in scripted ways
@@ -157,9 +163,13 @@ doc_events = {
 		"validate": "asteria.asteria.override.serial_and_batch_bundle.validate",
 		"on_submit" : "asteria.asteria.doc_events.purchase_receipt.on_submit"
 	},
+	"Stock Ledger Entry": {
+		"on_submit": "asteria.asteria.doctype.batch_warehouse_balance.batch_warehouse_balance.update_from_stock_ledger_entry"
+	},
 	"Stock Entry": {
 		"validate": "asteria.asteria.stock_entry.validate",
-		"on_submit": "asteria.asteria.stock_entry.on_submit"
+		"on_submit": "asteria.asteria.stock_entry.on_submit",
+		"on_cancel": "asteria.asteria.stock_entry.on_cancel"
 	},
 	"Expense Claim" : {
 		"validate" : "asteria.asteria.doc_events.expense_claim.validate"
@@ -184,10 +194,19 @@ doc_events = {
 	"Material Request" : {
 		"on_submit" : "asteria.asteria.doc_events.material_request.on_submit"
 	},
+	"BOM" : {
+		"on_submit" : "asteria.asteria.bom_explosion.clear_bom_explosion_cache",
+		"on_cancel" : "asteria.asteria.bom_explosion.clear_bom_explosion_cache",
+		"on_update_after_submit" : "asteria.asteria.bom_explosion.clear_bom_explosion_cache"
+	},
+	"Item" : {
+		"on_update" : "asteria.asteria.bom_explosion.clear_bom_explosion_cache"
+	},
 	"Work Order" : {
 		"validate" : "asteria.asteria.doc_events.work_order.validate",
 		"on_trash" : "asteria.asteria.doc_events.work_order.on_trash",
 		"on_submit": "asteria.asteria.doc_events.work_order.on_submit",
+		"on_cancel": "asteria.asteria.doc_events.work_order.on_cancel",
 	},
 	"NC Actions" : {
 		"autoname" : "asteria.asteria.doc_events.nc_action.autoname",
@@ -220,7 +239,9 @@ scheduler_events = {
 		]
 	},
 	"Daily" : [
-		"asteria.asteria.api.set_payment_aging_for_payment_request"
+		"asteria.asteria.api.set_payment_aging_for_payment_request",
+		"asteria.asteria.doctype.reserve_stock.reserve_stock.expire_stale_reservations",
+		"asteria.asteria.doc_events.work_order.reconcile_production_plan_quantities"
 	]
 }
 
@@ -0,0 +1,8 @@
+import frappe
+from asteria.asteria.doctype.batch_warehouse_balance.batch_warehouse_balance import (
+    rebuild_batch_warehouse_balance,
+)
+
+def execute():
+    frappe.reload_doc("asteria", "doctype", "batch_warehouse_balance")
+    rebuild_batch_warehouse_balance()
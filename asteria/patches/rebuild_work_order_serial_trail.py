@@ -0,0 +1,8 @@
+import frappe
+from asteria.asteria.doctype.work_order_serial_trail.work_order_serial_trail import (
+    rebuild_serial_trail,
+)
+
+def execute():
+    frappe.reload_doc("asteria", "doctype", "work_order_serial_trail")
+    rebuild_serial_trail()
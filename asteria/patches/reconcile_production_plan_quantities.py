@@ -0,0 +1,5 @@
+import frappe
+from asteria.asteria.doc_events.work_order import reconcile_production_plan_quantities
+
+def execute():
+    reconcile_production_plan_quantities()
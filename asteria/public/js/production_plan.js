@@ -18,5 +18,11 @@ frappe.ui.form.on("Production Plan", {
                 has_create_buttons = true;
             }
         }
+        frm.add_custom_button(__("Stock Availability"), function(){
+            const rows = (frm.doc.mr_items || []).length ? frm.doc.mr_items : frm.doc.po_items || [];
+            asteria.utils.show_stock_availability(
+                rows.map((row) => ({ item_code: row.item_code, warehouse: row.warehouse }))
+            );
+        }, __("View"))
     }
 })
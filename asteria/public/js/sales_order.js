@@ -8,5 +8,10 @@ frappe.ui.form.on("Sales Order", {
                 });
             },__("Create"))
         }
+        frm.add_custom_button(__("Stock Availability"), function(){
+            asteria.utils.show_stock_availability(
+                (frm.doc.items || []).map((row) => ({ item_code: row.item_code, warehouse: row.warehouse }))
+            );
+        }, __("View"))
     }
 })
@@ -23,7 +23,16 @@ erpnext.SerialBatchPackageSelector = class extends SerialBatchPackageSelector {
 			warehouse = this.item.rejected_warehouse;
 		}
 
-		if (qty) {
+		if (qty && this.item.has_serial_no && qty > asteria.utils.SERIAL_PAGE_LENGTH) {
+			asteria.utils.stream_serial_nos(this, {
+				doc: this.frm.doc,
+				item_code: this.item.item_code,
+				warehouse: warehouse,
+				based_on: based_on,
+				posting_date: this.frm.doc.posting_date,
+				posting_time: this.frm.doc.posting_time,
+			}, qty);
+		} else if (qty) {
 			frappe.call({
 				method: "erpnext.stock.doctype.serial_and_batch_bundle.serial_and_batch_bundle.get_auto_data",
 				args: {
@@ -46,4 +55,4 @@ erpnext.SerialBatchPackageSelector = class extends SerialBatchPackageSelector {
 			});
 		}
 	}
-}
\ No newline at end of file
+}
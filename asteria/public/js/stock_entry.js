@@ -24,7 +24,16 @@ frappe.ui.form.on("Stock Entry", {
                     warehouse = this.item.rejected_warehouse;
                 }
         
-                if (qty) {
+                if (qty && this.item.has_serial_no && qty > asteria.utils.SERIAL_PAGE_LENGTH) {
+                    asteria.utils.stream_serial_nos(this, {
+                        doc: this.frm.doc,
+                        item_code: this.item.item_code,
+                        warehouse: warehouse,
+                        based_on: based_on,
+                        posting_date: this.frm.doc.posting_date,
+                        posting_time: this.frm.doc.posting_time,
+                    }, qty);
+                } else if (qty) {
                     frappe.call({
                         method: "asteria.asteria.override.serial_and_batch_bundle.get_auto_data",
                         args: {
@@ -292,5 +301,52 @@ frappe.ui.form.on("Stock Entry", {
 			);
 		}
         // Copy content end /apps/erpnext/erpnext/stock/doctype/stock_entry/stock_entry.js
+
+        if (frm.doc.docstatus === 0 && frm.doc.stock_entry_type === "Manufacture" && frm.doc.work_order) {
+            frm.add_custom_button(__("Allocate Serial / Batch Nos"), () => allocate_serial_batch_nos(frm), __("Tools"));
+        }
     }
-});
\ No newline at end of file
+});
+
+function allocate_serial_batch_nos(frm) {
+    // One call for all rows, so the same serial or batch is never picked twice
+    frappe.call({
+        method: "asteria.asteria.override.serial_and_batch_bundle.allocate_serial_batch_for_document",
+        args: { doc: frm.doc },
+        freeze: true,
+        callback: (r) => {
+            (r.message || []).forEach((assignment) => {
+                let row = frm.doc.items.find((item) => item.idx === assignment.idx);
+                if (!row || row.serial_and_batch_bundle) return;
+
+                if (assignment.serial_nos.length) {
+                    frappe.model.set_value(row.doctype, row.name, "use_serial_batch_fields", 1);
+                    frappe.model.set_value(row.doctype, row.name, "serial_no", assignment.serial_nos.join("\n"));
+                } else if (assignment.batches.length) {
+                    // A row short of one batch is split into one row per batch
+                    let conversion_factor = row.conversion_factor || 1;
+                    let targets = assignment.batches.map((batch, i) =>
+                        i ? frappe.model.copy_doc(row, false, frm.doc, "items") : row
+                    );
+                    targets.forEach((target, i) => {
+                        frappe.model.set_value(target.doctype, target.name, {
+                            use_serial_batch_fields: 1,
+                            batch_no: assignment.batches[i].batch_no,
+                            qty: assignment.batches[i].qty / conversion_factor,
+                        });
+                    });
+                }
+            });
+            frm.refresh_field("items");
+
+            let shortfalls = (r.message || []).filter((assignment) => assignment.message);
+            if (shortfalls.length) {
+                frappe.msgprint({
+                    title: __("Serial / Batch Shortfall"),
+                    indicator: "orange",
+                    message: shortfalls.map((assignment) => assignment.message).join("<br>"),
+                });
+            }
+        },
+    });
+}
\ No newline at end of file
@@ -0,0 +1,72 @@
+frappe.provide("asteria.utils");
+
+asteria.utils.SERIAL_PAGE_LENGTH = 500;
+
+asteria.utils.stream_serial_nos = function (selector, args, qty, cursor = null, loaded = []) {
+    // Fetch serials page by page so the selector grid fills while the rest loads
+    frappe.call({
+        method: "asteria.asteria.override.serial_and_batch_bundle.get_serial_no_page",
+        args: {
+            ...args,
+            cursor: cursor,
+            page_length: Math.min(asteria.utils.SERIAL_PAGE_LENGTH, qty - loaded.length),
+        },
+        callback: (r) => {
+            if (!r.message) return;
+
+            let { fields, rows } = r.message;
+            rows.forEach((row) => {
+                let entry = {};
+                fields.forEach((field, i) => (entry[field] = row[i]));
+                loaded.push(entry);
+            });
+
+            selector.dialog.fields_dict.entries.df.data = loaded;
+            selector.dialog.fields_dict.entries.grid.refresh();
+
+            if (r.message.cursor && loaded.length < qty) {
+                asteria.utils.stream_serial_nos(selector, args, qty, r.message.cursor, loaded);
+            }
+        },
+    });
+};
+
+asteria.utils.show_stock_availability = function (items) {
+    items = items.filter((row) => row.item_code && row.warehouse);
+    if (!items.length) return;
+
+    frappe.call({
+        method: "asteria.asteria.atp.get_availability",
+        args: { items: items },
+        callback: (r) => {
+            const rows = (r.message || []).map((d) => `
+                <tr>
+                    <td>${d.item_code}</td>
+                    <td>${d.warehouse}</td>
+                    <td style="text-align: right;">${flt(d.actual_qty)}</td>
+                    <td style="text-align: right;">${flt(d.reserved_qty) + flt(d.sre_reserved_qty)}</td>
+                    <td style="text-align: right;">${flt(d.atp_qty)}</td>
+                </tr>
+            `).join("");
+
+            frappe.msgprint({
+                title: __("Stock Availability"),
+                wide: true,
+                message: `
+                    <table class="table table-bordered">
+                        <thead>
+                            <tr>
+                                <th>${__("Item Code")}</th>
+                                <th>${__("Warehouse")}</th>
+                                <th>${__("Actual Qty")}</th>
+                                <th>${__("Reserved Qty")}</th>
+                                <th>${__("Available to Promise")}</th>
+                            </tr>
+                        </thead>
+                        <tbody>${rows}</tbody>
+                    </table>
+                `,
+            });
+        },
+    });
+};